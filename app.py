@@ -1,10 +1,8 @@
 import streamlit as st
 import pandas as pd
+import logging
 import time
-import openai
 import os
-import gspread
-from google.oauth2.service_account import Credentials
 
 # Passwortschutz
 def check_password():
@@ -25,74 +23,40 @@ def check_password():
 
 check_password()
 
-from get_companies import get_companies_via_openai_prompt, parse_openai_response, update_sheet, get_prompt
-from send_emails import send_mail, td, DELAY_SECONDS, LOG_FILE
-from hubspot_api import annotate_companies_with_hubspot, get_last_company_activity, get_last_hubspot_contact
-
-# Google Sheets Setup
-SCOPES = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive"
-]
+from get_companies import SHARD_SIZE, ExtractionStats, get_companies_structured, get_companies_via_openai_prompt, get_existing_company_names, get_prompt, parse_openai_response, research_companies_sharded, stream_companies_via_openai_prompt, update_sheet
+from send_emails import PreparedCampaign, DELAY_SECONDS, LOG_FILE
+from mail_templates import recipient_batch
+from send_queue import MAIL_RUN_NAME, campaign_progress, enqueue_campaign, ensure_worker, worker_running
+from hubspot_api import enrich_companies_iter, get_lookup_cache, invalidate_hubspot_cache
+from hubspot_client import HubSpotQuotaExceeded
+from backend import get_sheet_revision, get_worksheet
+from table_filter import TableFilter
+from sheet_data import FIRST_DATA_ROW, SheetConflictError, frame_from_values, save_company_data
+import instrumentation
 
 os.makedirs("mail_log", exist_ok=True)
 
-SERVICE_ACCOUNT_FILE = "service_account.json"
-with open(SERVICE_ACCOUNT_FILE, "w") as f:
-    f.write(st.secrets["GOOGLE_SERVICE_ACCOUNT_JSON"])
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_company_data(revision):
+    # Nur neu laden, wenn sich der Änderungsstand (revision) des Sheets geändert hat.
+    # Typisiert: Zähler, Checkboxen, Region/Gruppe und Datumsspalten (siehe sheet_data.frame_from_values)
+    return frame_from_values(get_worksheet().get("A6:Q"))
 
-CREDS = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-SPREADSHEET_ID = "1o4vY8j2hrHyKfs1wwvyxYF172BOvgPRl5qpj_9-GsJE"
-WORKSHEET_NAME = "Team Gabriel" 
-gc = gspread.authorize(CREDS)
-sh = gc.open_by_key(SPREADSHEET_ID)
-worksheet = sh.worksheet(WORKSHEET_NAME)
+NAME_COLUMN = "Unternehmensname (laut Handelsregister)"
+TEXT_FILTER_COLUMNS = [NAME_COLUMN, "Name, Nachname", "E-Mail"]
 
-@st.cache_data(ttl=60)
-def load_company_data():
-    data = worksheet.get("A6:Q")
-    
-    if not data:
-        return pd.DataFrame()
-        
-    headers = data[0]
-    rows = data[1:]
-    
-    seen = {}
-    clean_headers = []
-    for i, h in enumerate(headers):
-        h = str(h).replace('\n', ' ').strip()
-        h = " ".join(h.split())
-        
-        if not h:
-            h = f"Leer_{i}"
-        if h in seen:
-            seen[h] += 1
-            clean_headers.append(f"{h}_{seen[h]}")
-        else:
-            seen[h] = 0
-            clean_headers.append(h)
-            
-    max_cols = len(clean_headers)
-    padded_rows = []
-    for row in rows:
-        padded_row = row + [''] * (max_cols - len(row))
-        padded_rows.append(padded_row[:max_cols])
-            
-    df = pd.DataFrame(padded_rows, columns=clean_headers)
-    
-    for col in df.columns:
-        df[col] = pd.to_numeric(df[col], errors='ignore')
-        
-    return df
+@st.cache_resource(max_entries=4, show_spinner=False)
+def get_table_filter(revision):
+    """Suchindex für die Tabelle, einmal pro Sheet-Revision aufgebaut und von allen Sessions geteilt."""
+    df = load_company_data(revision)
+    if NAME_COLUMN in df.columns:
+        df = df[df[NAME_COLUMN].notna() & (df[NAME_COLUMN].str.strip() != "")]
+    return TableFilter(df, text_columns=TEXT_FILTER_COLUMNS)
 
-def save_company_data(df):
-    worksheet.batch_clear(["A6:Q1000"]) 
-    data_to_upload = [df.columns.values.tolist()] + df.values.tolist()
-    worksheet.update(range_name="A6", values=data_to_upload)
+# Nach einem Neustart offene Mail-Jobs weiter abarbeiten
+ensure_worker()
 
 st.title("Unternehmensakquise & Mailing Tool")
-openai.api_key = st.secrets["OPENAI_API_KEY"]
 
 st.header("1. Unternehmen suchen (OpenAI)")
 
@@ -110,70 +74,144 @@ if prompt_option in ("Mittelständische Unternehmen", "Kleine Unternehmen"):
 with open('resources/prompt_structure.txt', 'r', encoding='utf-8') as f:
     prompt_structure = f.read()
 
+prompt_template = None
 if prompt_option == "Eigener Prompt":
     prompt = st.text_area("Eigener Prompt:") + prompt_structure
 elif prompt_option == "Mittelständische Unternehmen":
-    prompt = get_prompt(prompt_type="mittelständisch")
-    prompt = prompt.replace("{anzahl}", str(anzahl))
+    prompt_template = get_prompt(prompt_type="mittelständisch")
+    prompt = prompt_template.replace("{anzahl}", str(anzahl))
     st.code(prompt)
 elif prompt_option == "Kleine Unternehmen":
-    prompt = get_prompt(prompt_type="klein")
-    prompt = prompt.replace("{anzahl}", str(anzahl))
+    prompt_template = get_prompt(prompt_type="klein")
+    prompt = prompt_template.replace("{anzahl}", str(anzahl))
     st.code(prompt)
 
+# Große Recherchen laufen als parallele Teilrecherchen (nach Anfangsbuchstaben aufgeteilt)
+use_shards = prompt_template is not None and anzahl > SHARD_SIZE
+if use_shards:
+    st.caption(f"💡 Die Recherche wird in {-(-anzahl // SHARD_SIZE)} parallele Teilrecherchen nach Anfangsbuchstaben der Unternehmensnamen aufgeteilt (zusammen A–Z, Branchen wie im Prompt); doppelte und bereits eingetragene Unternehmen werden aussortiert.")
+
 if 'companies' not in st.session_state:
     st.session_state['companies'] = []
+if 'editor_version' not in st.session_state:
+    st.session_state['editor_version'] = 0
 
 search_contacts = st.checkbox("Auch nach Kontaktpersonen in HubSpot suchen", value=False)
 only_new_hubspot = st.checkbox("Nur Unternehmen suchen, die nicht bereits in HubSpot sind")
 st.caption("⚠️ **Achtung:** Dieses Feature sucht nach konkreten Personen in HubSpot...")
 
+with st.sidebar:
+    st.subheader("HubSpot-Cache")
+    cache_stats = get_lookup_cache().stats()
+    st.caption(f"{cache_stats['size']} Einträge · {cache_stats['hits']} Treffer · {cache_stats['misses']} Fehlgriffe")
+    if st.button("HubSpot-Cache leeren", help="Nach Änderungen in HubSpot, damit die Daten neu abgefragt werden."):
+        invalidate_hubspot_cache()
+        st.success("HubSpot-Cache geleert.")
+
+def highlight_last_contact(val):
+    if val and val != "Keinen Kontakt gefunden":
+        return 'background-color: orange'
+    else:
+        return 'background-color: lightgreen'
+
+def show_performance(perf):
+    """Aufklappbare Übersicht eines Durchlaufs: Dauer je Stufe und Zähler (siehe instrumentation.py)."""
+    summary = perf.summary()
+    with st.expander(f"Performance ({summary['duration_s']:.1f} s)"):
+        if summary["stages"]:
+            st.dataframe(
+                pd.DataFrame(summary["stages"]).rename(columns={
+                    "stage": "Stufe", "count": "Aufrufe", "total_s": "Gesamt (s)", "max_s": "Längster (s)"
+                }),
+                use_container_width=True, hide_index=True
+            )
+        if summary["counters"]:
+            st.dataframe(
+                pd.DataFrame(sorted(summary["counters"].items()), columns=["Zähler", "Wert"]),
+                use_container_width=True, hide_index=True
+            )
+        st.caption("Stufen können sich überlappen (parallele Abfragen), die Summe kann daher über der Gesamtdauer liegen.")
+
+def collect(items, sink):
+    """Reicht die Elemente durch und merkt sie sich in sink (für die Anzahl der OpenAI-Vorschläge)."""
+    for item in items:
+        sink.append(item)
+        yield item
+
+stream_results = st.checkbox("Ergebnisse live anzeigen (Streaming)", value=True)
+structured_output = st.checkbox(
+    "Strukturierte Ausgabe (JSON-Schema)", value=False,
+    help="OpenAI liefert die Unternehmen als typisierte Datensätze statt Textzeilen (ohne Live-Anzeige)."
+)
+force_fresh = st.checkbox(
+    "Neu recherchieren (Cache ignorieren)", value=False,
+    help="Identische Prompts werden sonst aus dem Recherche-Cache beantwortet, ohne OpenAI erneut abzufragen."
+)
+
 if st.button("Unternehmen suchen (normal)"):
     if prompt:
-        response_text = get_companies_via_openai_prompt(prompt)
-        companies = parse_openai_response(response_text)
-        
-        filtered_companies = [] 
-
-        for company in companies:
-            hub_org = get_last_company_activity(company["Name"])
-            
-            if only_new_hubspot and hub_org is not None:
-                continue 
-            
-            company["Letzter Kontakt Organisation"] = hub_org["last_activity_date"] if hub_org else "Keinen Kontakt gefunden"
-
-            if search_contacts:
-                hub_contact = get_last_hubspot_contact(email=company["E-Mail"], company_name=company["Name"])
-                if hub_contact:
-                    company["Name Kontaktperson"] = hub_contact.get("name", company["Name"])
-                    company["E-Mail"] = hub_contact.get("email", company["E-Mail"])
-                    company["Letzter Kontakt Person"] = hub_contact.get("date", "")
-                else:
-                    company["Letzter Kontakt Person"] = "Keine Kontaktperson gefunden"
+        # Alle Stufen (OpenAI, HubSpot, Sheets) werden für die Performance-Übersicht gemessen
+        with instrumentation.run("Recherche") as perf:
+            companies = []
+            extraction_stats = ExtractionStats(requested=anzahl if prompt_template is not None else None)
+            if use_shards:
+                source = collect(
+                    research_companies_sharded(
+                        prompt_template, anzahl, exclude_names=get_existing_company_names(),
+                        research=get_companies_structured if structured_output else None,
+                        stats=extraction_stats, force_fresh=force_fresh
+                    ),
+                    companies
+                )
+            elif structured_output:
+                source = collect(get_companies_structured(prompt, stats=extraction_stats, force_fresh=force_fresh), companies)
+            elif stream_results:
+                # Unternehmen gehen zeilenweise in den HubSpot-Abgleich, während OpenAI noch schreibt
+                source = collect(stream_companies_via_openai_prompt(prompt, stats=extraction_stats, force_fresh=force_fresh), companies)
             else:
-                company["Letzter Kontakt Person"] = ""
-                
-            filtered_companies.append(company)
+                response_text = get_companies_via_openai_prompt(prompt, force_fresh=force_fresh, stats=extraction_stats)
+                source = collect(parse_openai_response(response_text, stats=extraction_stats), companies)
+
+            heading = st.empty()
+            table = st.empty()
+            filtered_companies = []
+            # HubSpot-Abgleich läuft nebenläufig (gebündelte Company-Suchen + parallele Kontaktsuche)
+            try:
+                for company in enrich_companies_iter(source, search_contacts=search_contacts, only_new=only_new_hubspot):
+                    filtered_companies.append(company)
+                    with instrumentation.span("ui.render"):
+                        heading.write("Gefundene Unternehmen:")
+                        table.dataframe(
+                            pd.DataFrame(filtered_companies).style.map(
+                                highlight_last_contact, subset=["Letzter Kontakt Organisation"]
+                            ),
+                            use_container_width=True
+                        )
+            except HubSpotQuotaExceeded as e:
+                st.error(str(e))
 
         st.session_state['companies'] = filtered_companies
-        companies_df = pd.DataFrame(filtered_companies)
-
-        def highlight_last_contact(val):
-            if val and val != "Keinen Kontakt gefunden":
-                return 'background-color: orange'
-            else:
-                return 'background-color: lightgreen'
 
-        if not companies_df.empty:
-            styled_df = companies_df.style.map(
-                highlight_last_contact, subset=["Letzter Kontakt Organisation"]
-            )
-            st.write("Gefundene Unternehmen:")
-            st.dataframe(styled_df, use_container_width=True)
-        else:
+        stats = extraction_stats.as_dict()
+        logging.info(f"Recherche-Ausbeute: {stats}")
+        st.caption(
+            f"Ausbeute: {stats['requested'] if stats['requested'] is not None else '–'} angefragt · "
+            f"{stats['parsed']} erkannt · {stats['rejected']} verworfen"
+            + (f" · {stats['cached']} Antwort(en) aus dem Recherche-Cache" if stats['cached'] else "")
+        )
+        if extraction_stats.rejected_lines:
+            with st.expander("Verworfene Zeilen"):
+                st.code("\n".join(extraction_stats.rejected_lines))
+        show_performance(perf)
+
+        if not filtered_companies:
             if only_new_hubspot and len(companies) > 0:
-                st.warning("Alle von OpenAI vorgeschlagenen Unternehmen waren bereits in HubSpot und wurden herausgefiltert. Klicke erneut auf Suchen!")
+                if stats['cached']:
+                    # Ein erneuter Klick würde nur dieselbe Antwort aus dem Cache liefern
+                    st.warning("Alle von OpenAI vorgeschlagenen Unternehmen waren bereits in HubSpot und wurden herausgefiltert. "
+                               "Die Antwort stammt aus dem Recherche-Cache: setze den Haken bei „Neu recherchieren (Cache ignorieren)“ und suche erneut.")
+                else:
+                    st.warning("Alle von OpenAI vorgeschlagenen Unternehmen waren bereits in HubSpot und wurden herausgefiltert. Klicke erneut auf Suchen!")
             else:
                 st.write("Keine Unternehmen gefunden.")
     else:
@@ -187,57 +225,169 @@ if st.session_state['companies']:
             for company in st.session_state['companies']:
                 company = company.copy()
                 companies_to_add.append(company)
-            skipped = update_sheet(companies_to_add)
+            with instrumentation.run("Eintragen") as perf:
+                skipped = update_sheet(companies_to_add)
+            # Eigene Änderung: nicht auf die nächste Änderungsprüfung warten (Drive-Revision kann nachhinken)
+            get_sheet_revision.clear()
+            load_company_data.clear()
+            get_table_filter.clear()
             if skipped:
                 st.info(f"Folgende Unternehmen waren bereits im Google Sheet und wurden übersprungen:\n\n- " + "\n- ".join(skipped))
             else:
                 st.success("Alle Unternehmen wurden in die Tabelle eingetragen.")
+            show_performance(perf)
             st.session_state['companies'] = []
 
 st.header("2. Tabelle anzeigen & filtern")
 st.caption("💡 **Tipp:** Wenn du mit der Maus über die Tabelle fährst, erscheint oben rechts eine kleine Suchlupe.")
 
+def reset_editor():
+    """Verwirft die laufende Bearbeitung: beim nächsten Durchlauf neuer Snapshot und leerer Editor."""
+    st.session_state.pop('edit_snapshot', None)
+    st.session_state['editor_version'] += 1
+
+if st.button("Tabelle neu laden", help="Lädt die Tabelle sofort neu, statt auf die automatische Änderungserkennung zu warten. Ungespeicherte Änderungen gehen verloren."):
+    reset_editor()
+    get_sheet_revision.clear()
+    load_company_data.clear()
+    get_table_filter.clear()
+
 try:
-    df = load_company_data()
+    revision = get_sheet_revision()
+    df = load_company_data(revision)
+    table_filter = get_table_filter(revision)
 except Exception as e:
     st.error(f"{type(e).__name__} - {e}")
     st.stop()
 
-df = df[df["Unternehmensname (laut Handelsregister)"].notna() & (df["Unternehmensname (laut Handelsregister)"].str.strip() != "")]
+all_columns = list(df.columns)
+next_free_row = FIRST_DATA_ROW + len(df)
+
+df = table_filter.frame
 
 unternehmen_filter = st.text_input("Filter für 'Unternehmensname':")
 name_filter = st.text_input("Filter für 'Name, Nachname':")
 email_filter = st.text_input("Filter für 'E-Mail':")
 
-other_cols = [col for col in df.columns if col not in ["Unternehmensname (laut Handelsregister)", "Name, Nachname", "E-Mail"]]
+other_cols = [col for col in df.columns if col not in TEXT_FILTER_COLUMNS]
 filter_cols = st.multiselect("Weitere Spalten zum Filtern auswählen:", other_cols)
 
-filtered_df = df.copy()
-
-if unternehmen_filter:
-    filtered_df = filtered_df[filtered_df["Unternehmensname (laut Handelsregister)"].str.contains(unternehmen_filter, case=False, na=False)]
-if name_filter:
-    filtered_df = filtered_df[filtered_df["Name, Nachname"].str.contains(name_filter, case=False, na=False)]
-if email_filter:
-    filtered_df = filtered_df[filtered_df["E-Mail"].str.contains(email_filter, case=False, na=False)]
+# Alle Bedingungen werden gesammelt und in einem Schritt über den Index ausgewertet
+text_filters = dict(zip(TEXT_FILTER_COLUMNS, [unternehmen_filter, name_filter, email_filter]))
+value_filters = {}
+range_filters = {}
 
 for col in filter_cols:
-    if df[col].dtype == object:
+    dtype = df[col].dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        choice = st.radio(f"'{col}':", ("Alle", "Ja", "Nein"), horizontal=True)
+        if choice != "Alle":
+            # Leere Checkbox-Zellen zählen als "Nein"
+            value_filters[col] = (True,) if choice == "Ja" else (False, None)
+    elif isinstance(dtype, pd.CategoricalDtype):
+        categories = df[col].cat.categories.tolist()
+        selected_vals = st.multiselect(f"Werte für '{col}' auswählen:", categories, default=categories)
+        if len(selected_vals) < len(categories):
+            value_filters[col] = selected_vals
+    elif pd.api.types.is_datetime64_any_dtype(dtype):
+        dates = df[col].dropna()
+        if dates.empty:
+            continue
+        min_date, max_date = dates.min().date(), dates.max().date()
+        selected_range = st.date_input(f"Zeitraum für '{col}' auswählen:", (min_date, max_date), min_value=min_date, max_value=max_date)
+        if len(selected_range) == 2:
+            range_filters[col] = (
+                pd.Timestamp(selected_range[0]),
+                pd.Timestamp(selected_range[1]) + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+            )
+    elif pd.api.types.is_numeric_dtype(dtype):
+        values = df[col].dropna()
+        if values.empty or values.min() == values.max():
+            continue
+        min_val, max_val = int(values.min()), int(values.max())
+        selected_range = st.slider(f"Wertebereich für '{col}' auswählen:", min_val, max_val, (min_val, max_val))
+        range_filters[col] = selected_range
+    else:
         unique_vals = df[col].dropna().unique().tolist()
         selected_vals = st.multiselect(f"Werte für '{col}' auswählen:", unique_vals, default=unique_vals)
-        filtered_df = filtered_df[filtered_df[col].isin(selected_vals)]
-    else:
-        min_val, max_val = int(df[col].min()), int(df[col].max())
-        selected_range = st.slider(f"Wertebereich für '{col}' auswählen:", min_val, max_val, (min_val, max_val))
-        filtered_df = filtered_df[(filtered_df[col] >= selected_range[0]) & (filtered_df[col] <= selected_range[1])]
-
-edit_df = filtered_df.copy()
-edit_df = edit_df.dropna(axis=1, how='all')
-edited_df = st.data_editor(edit_df, num_rows="dynamic", use_container_width=True, key="excel_editor")
+        if len(selected_vals) < len(unique_vals):
+            value_filters[col] = selected_vals
+
+filtered_df = table_filter.filter(text=text_filters, values=value_filters, ranges=range_filters)
+
+editor_key = f"excel_editor_{st.session_state['editor_version']}"
+editor_state = st.session_state.get(editor_key) or {}
+editing = any(editor_state.get(k) for k in ("edited_rows", "added_rows", "deleted_rows"))
+if editing and 'edit_snapshot' in st.session_state:
+    # Basis für Diff und Konfliktprüfung bleibt der Stand vom Beginn der Bearbeitung, auch wenn die
+    # Tabelle inzwischen neu geladen wurde; Änderungen anderer fallen beim Speichern als Konflikt auf
+    snapshot_revision, edit_df = st.session_state['edit_snapshot']
+    st.caption("Ungespeicherte Änderungen: angezeigt wird der Stand vom Beginn der Bearbeitung"
+               + (" (die Tabelle wurde inzwischen geändert)" if snapshot_revision != revision else "")
+               + ". Filter wirken erst nach dem Speichern oder Neuladen.")
+else:
+    edit_df = filtered_df.copy()
+    edit_df = edit_df.dropna(axis=1, how='all')
+    # Region/Gruppe sind zum Filtern category, im Editor aber Freitext: sonst wären nur schon vorhandene Werte wählbar
+    for col in edit_df.select_dtypes("category").columns:
+        edit_df[col] = edit_df[col].astype("string")
+    st.session_state['edit_snapshot'] = (revision, edit_df)
+edited_df = st.data_editor(edit_df, num_rows="dynamic", use_container_width=True, key=editor_key)
 
 if st.button("Änderungen speichern"):
-    save_company_data(edited_df)
-    st.success("Änderungen gespeichert!")
+    try:
+        # Nur geänderte Zellen, neue und gelöschte Zeilen der angezeigten Auswahl schreiben
+        with instrumentation.run("Speichern") as perf:
+            changed, appended, deleted = save_company_data(
+                get_worksheet(), snapshot=edit_df, edited=edited_df, columns=all_columns, next_row=next_free_row
+            )
+    except SheetConflictError as e:
+        st.error(f"Nicht gespeichert: {e}. Bitte Tabelle neu laden und die Änderungen erneut vornehmen.")
+    else:
+        reset_editor()
+        get_sheet_revision.clear()
+        load_company_data.clear()
+        get_table_filter.clear()
+        st.success(f"Änderungen gespeichert! ({changed} Zellen geändert, {appended} Zeilen neu, {deleted} Zeilen gelöscht)")
+        show_performance(perf)
+
+PROGRESS_REFRESH_SECONDS = 2
+
+def campaign_finished(campaign_id, progress=None):
+    """
+    Alle Jobs bearbeitet und der Versand-Durchlauf dieses Prozesses (inkl. Rückschreiben ins Sheet)
+    abgeschlossen; hat ein Worker in einem anderen Prozess gesendet, genügt Ersteres.
+    """
+    progress = progress or campaign_progress(campaign_id)
+    done = progress["sent"] + progress["failed"] + progress["uncertain"]
+    if done < progress["total"]:
+        return False
+    return bool(instrumentation.recent_runs(MAIL_RUN_NAME, campaign_id=campaign_id)) or not worker_running()
+
+def show_campaign_progress(campaign_id, polling):
+    """Fortschrittsbalken, Fehler und nach Abschluss die Performance-Übersicht einer Kampagne."""
+    progress = campaign_progress(campaign_id)
+    done = progress["sent"] + progress["failed"] + progress["uncertain"]
+    st.progress(done / progress["total"] if progress["total"] else 1.0,
+                text=f"{progress['sent']} von {progress['total']} Mails gesendet")
+    if progress["failed"] or progress["uncertain"]:
+        st.warning(f"{progress['failed']} fehlgeschlagen, {progress['uncertain']} unklar (nach Neustart nicht erneut gesendet). Details siehe Log.")
+    if progress["sheet_error"]:
+        st.error(f"{progress['unsynced']} gesendete Mails konnten noch nicht im Sheet vermerkt werden "
+                 f"(wird erneut versucht): {progress['sheet_error']}")
+    if progress["sending"]:
+        # Nach einem Absturz hängende Jobs: ein (kurzer) Worker-Lauf markiert abgelaufene als "unklar"
+        ensure_worker()
+    if done >= progress["total"]:
+        st.info("Alle ausgewählten Mails wurden bearbeitet. Details siehe Log.")
+        # Messwerte genau dieser Kampagne (SMTP-Verbindungen, Versanddauer); der Worker schließt den
+        # Durchlauf erst nach der letzten Pause und dem Rückschreiben ins Sheet
+        mail_runs = instrumentation.recent_runs(MAIL_RUN_NAME, campaign_id=campaign_id)
+        if mail_runs:
+            show_performance(mail_runs[0])
+    if polling and campaign_finished(campaign_id, progress):
+        # Ganze Seite einmal neu ausführen, damit das automatische Aktualisieren aufhört
+        st.rerun()
 
 st.header("3. E-Mails senden (an gefilterte Auswahl)")
 
@@ -245,6 +395,7 @@ mail_text_option = st.radio("Welchen E-Mail-Text möchtest du verwenden?", ("Sta
 if mail_text_option == "Eigenen Text eingeben":
     custom_mail_subject = st.text_input("Eigener E-Mail-Betreff (nutze {company} als Platzhalter):", value="Maßgeschneiderte Lösungen für {company}")
     custom_mail_text = st.text_area("Eigener E-Mail-Text (nutze {company} als Platzhalter):")
+    st.caption("Weitere Platzhalter: {contact_name}, {region}, {website}, {email} sowie jeder Spaltenname der Tabelle, z.B. {Name, Nachname}.")
 else:
     custom_mail_subject = None
     custom_mail_text = None
@@ -256,28 +407,67 @@ uploaded_file = st.file_uploader("Optional: Anhang (z.B. PDF) per Drag & Drop hi
 cc_email_input = st.text_input("Optional: CC-Adresse hinzufügen (z.B. für eine Kopie an dich selbst oder das CRM):")
 
 if not filtered_df.empty:
-    options = [
-        f"{row['Unternehmensname (laut Handelsregister)']} ({row['E-Mail']})"
-        for idx, row in filtered_df.iterrows()
-    ]
-    selected = st.multiselect("Wähle die Unternehmen aus, die du kontaktieren möchtest:", options)
+    # Auswahl über die Sheet-Zeilennummer (Index), damit gleichnamige Einträge nicht verwechselt werden
+    recipient_labels = dict(zip(
+        filtered_df.index,
+        filtered_df[NAME_COLUMN].astype("string").fillna("") + " (" + filtered_df["E-Mail"].astype("string").fillna("") + ")"
+    ))
+    select_all = st.checkbox(f"Alle {len(filtered_df)} gefilterten Unternehmen auswählen", value=False)
+    if select_all:
+        selected_rows = list(filtered_df.index)
+    else:
+        selected_rows = st.multiselect(
+            "Wähle die Unternehmen aus, die du kontaktieren möchtest:", list(filtered_df.index),
+            format_func=lambda row: f"{recipient_labels[row]} · Zeile {row}"
+        )
     
+    messages_per_minute = st.number_input(
+        "Versandrate (Mails pro Minute):",
+        min_value=1, max_value=int(60 / DELAY_SECONDS), value=int(60 / DELAY_SECONDS), step=1
+    )
+
     if st.button("Ausgewählten Unternehmen E-Mails senden"):
-        for idx, row in filtered_df.iterrows():
-            label = f"{row['Unternehmensname (laut Handelsregister)']} ({row['E-Mail']})"
-            if label in selected:
-                send_mail(
-                    row['E-Mail'],
-                    row['Unternehmensname (laut Handelsregister)'],
-                    mail_text=custom_mail_text if mail_text_option == "Eigenen Text eingeben" else None,
-                    mail_subject=custom_mail_subject if mail_text_option == "Eigenen Text eingeben" else None,
-                    attachment=uploaded_file,
-                    add_signature=add_signature,
-                    cc_email=cc_email_input if cc_email_input.strip() else None # <-- NEU übergeben
-                )
-                st.success(f"Mail gesendet an {row['E-Mail']}")
-                time.sleep(DELAY_SECONDS)
-        st.info("Alle ausgewählten Mails wurden bearbeitet. Details siehe Log.")
+        # Empfänger in einem Durchgang: Adressen prüfen, Dubletten entfernen, Platzhalter-Werte aufbereiten
+        recipients, rejected = recipient_batch(filtered_df, selected_rows)
+        if rejected:
+            st.warning(f"{len(rejected)} Auswahl(en) werden nicht angeschrieben:\n\n- " + "\n- ".join(
+                f"{recipient_labels.get(row, row)}: {reason}" for row, reason in rejected.items()
+            ))
+        if not recipients:
+            st.error("Keine gültigen Empfänger ausgewählt.")
+            st.stop()
+
+        mail_text = custom_mail_text if mail_text_option == "Eigenen Text eingeben" else None
+        mail_subject = custom_mail_subject if mail_text_option == "Eigenen Text eingeben" else None
+        # Platzhalter vor dem Versand prüfen statt mitten in der Kampagne abzubrechen
+        try:
+            missing = PreparedCampaign(mail_text, mail_subject, add_signature=add_signature).missing_fields(
+                [{"company": r["company"], **r["fields"]} for r in recipients]
+            )
+        except ValueError as e:
+            st.error(f"Ungültiges Template: {e}")
+            st.stop()
+        if missing:
+            st.error("Für folgende Empfänger fehlen Platzhalter-Werte, es wurde nichts gesendet:\n\n- " + "\n- ".join(
+                f"{recipients[i]['company']}: {', '.join(fields)}" for i, fields in missing.items()
+            ))
+        else:
+            # Versand läuft im Hintergrund-Worker weiter, auch wenn der Browser neu lädt
+            st.session_state['campaign_id'] = enqueue_campaign(
+                recipients,
+                mail_text=mail_text,
+                mail_subject=mail_subject,
+                attachment=uploaded_file,
+                add_signature=add_signature,
+                cc_email=cc_email_input if cc_email_input.strip() else None, # <-- NEU übergeben
+                messages_per_minute=messages_per_minute
+            )
+
+    if st.session_state.get('campaign_id'):
+        campaign_id = st.session_state['campaign_id']
+        # Solange die Kampagne läuft, aktualisiert sich nur dieser Bereich selbst (st.fragment)
+        polling = not campaign_finished(campaign_id)
+        st.fragment(run_every=PROGRESS_REFRESH_SECONDS if polling else None)(show_campaign_progress)(campaign_id, polling)
 else:
     st.info("Keine Unternehmen für den Versand gefunden.")
 
@@ -0,0 +1,78 @@
+import json
+import logging
+import time
+
+import gspread
+import streamlit as st
+from google.oauth2.service_account import Credentials
+from openai import OpenAI
+
+from settings import get_secret
+
+# Gemeinsamer Zugriff auf Google Sheets, OpenAI und SMTP-Einstellungen (HubSpot: hubspot_client).
+# Alles wird erst bei der ersten Verwendung aufgebaut und dann prozessweit wiederverwendet
+# (st.cache_resource gilt für alle Sessions und Reruns, auch für den Mail-Worker-Thread).
+SPREADSHEET_ID = "1o4vY8j2hrHyKfs1wwvyxYF172BOvgPRl5qpj_9-GsJE"
+WORKSHEET_NAME = "Team Gabriel"
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive"
+]
+
+# Wie oft höchstens nach Änderungen am Sheet gefragt wird (eine Drive-Metadaten-Abfrage pro Prozess)
+REVISION_CHECK_SECONDS = 15
+# Ohne Drive-Zugriff wird die Tabelle wie früher spätestens nach dieser Zeit neu geladen
+FALLBACK_REFRESH_SECONDS = 60
+
+
+@st.cache_resource(show_spinner=False)
+def get_google_credentials():
+    """Service-Account-Credentials direkt aus dem Secret (ohne Umweg über eine Datei)."""
+    info = get_secret("GOOGLE_SERVICE_ACCOUNT_JSON")
+    if isinstance(info, str):
+        info = json.loads(info)
+    return Credentials.from_service_account_info(dict(info), scopes=SCOPES)
+
+
+@st.cache_resource(show_spinner=False)
+def get_spreadsheet(spreadsheet_id=SPREADSHEET_ID):
+    return gspread.authorize(get_google_credentials()).open_by_key(spreadsheet_id)
+
+
+@st.cache_resource(show_spinner=False)
+def get_worksheet(name=WORKSHEET_NAME, spreadsheet_id=SPREADSHEET_ID):
+    """Arbeitsblatt des Akquise-Sheets (Authentifizierung und Metadaten nur einmal pro Prozess)."""
+    return get_spreadsheet(spreadsheet_id).worksheet(name)
+
+
+@st.cache_data(ttl=REVISION_CHECK_SECONDS, show_spinner=False)
+def get_sheet_revision(spreadsheet_id=SPREADSHEET_ID):
+    """
+    Änderungsstand des Sheets (Drive modifiedTime). Daten, die mit diesem Wert gecacht sind, müssen erst
+    neu geladen werden, wenn er sich ändert. Schlägt die Abfrage fehl, wechselt der Wert minütlich.
+    """
+    try:
+        return get_spreadsheet(spreadsheet_id).get_lastUpdateTime()
+    except Exception as e:
+        logging.warning(f"Änderungsstand des Sheets nicht abrufbar: {e}")
+        return f"zeit:{int(time.time() // FALLBACK_REFRESH_SECONDS)}"
+
+
+@st.cache_resource(show_spinner=False)
+def get_openai_client():
+    return OpenAI(api_key=get_secret("OPENAI_API_KEY"))
+
+
+@st.cache_resource(show_spinner=False)
+def get_smtp_settings():
+    """Zugangsdaten und Server für den Mailversand."""
+    return {
+        'GMAIL_USER': get_secret("GMAIL_USER"),
+        'GMAIL_PASS': get_secret("GMAIL_PASS"),
+        'SMTP_HOST': get_secret("SMTP_HOST", "smtp.gmail.com"),
+        'SMTP_PORT': int(get_secret("SMTP_PORT", 587)),
+        # Nur für lokale Relays/Test-Server ohne TLS auf false setzen
+        'SMTP_STARTTLS': str(get_secret("SMTP_STARTTLS", "true")).strip().lower() not in ("0", "false", "no")
+    }
+
@@ -0,0 +1,396 @@
+"""
+Lokale Stellvertreter für die externen Dienste, damit die echten Code-Pfade offline gemessen werden können:
+HubSpot (HTTP-Server), Google Sheets (Worksheet im Speicher), SMTP (Empfänger, der alles annimmt)
+und OpenAI (feste Antworten).
+"""
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+from gspread.utils import a1_to_rowcol
+from requests.adapters import HTTPAdapter
+
+HUBSPOT_ORIGIN = "https://api.hubapi.com"
+
+_SYLLABLES = ["berg", "hof", "tal", "bau", "tech", "lin", "mar", "sol", "ver", "alp", "don", "inn",
+              "ka", "ro", "ti", "na", "el", "ga", "mo", "stein", "feld", "wald", "haus", "werk"]
+_SUFFIXES = ["GmbH", "AG", "KG", "GmbH & Co KG", "e.U.", "OG", ""]
+_SECTORS = ["Bau", "Technik", "Metall", "Handel", "Consulting", "Holz", "Elektro", "Logistik"]
+
+
+# --- Testdaten ---
+
+def company_names(count, seed=1):
+    """Reproduzierbare, überwiegend eindeutige Firmennamen wie 'Bergtal Technik GmbH'."""
+    rng = random.Random(seed)
+    names = []
+    for _ in range(count):
+        stem = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3))).title()
+        names.append(" ".join(p for p in (stem, rng.choice(_SECTORS), rng.choice(_SUFFIXES)) if p))
+    return names
+
+
+def slug(name):
+    return re.sub(r"[^a-z0-9]+", "-", name.lower().split(" gmbh")[0]).strip("-")
+
+
+def openai_text(count, seed=2, junk_ratio=0.1):
+    """Antworttext im Format 'Name – Website – Standort – Email' mit einigen unbrauchbaren Zeilen."""
+    rng = random.Random(seed)
+    lines = ["Hier sind die gewünschten Unternehmen:"]
+    for i, name in enumerate(company_names(count, seed)):
+        if rng.random() < junk_ratio:
+            lines.append(f"{i + 1}. {name} (keine Kontaktadresse gefunden)")
+            continue
+        lines.append(f"{i + 1}. **{name}** – www.{slug(name)}.at – Innsbruck, Tirol – office@{slug(name)}.at")
+    return "\n".join(lines)
+
+
+# --- HubSpot ---
+
+class FakeHubSpot:
+    """
+    HTTP-Server, der die genutzten HubSpot-CRM-Endpunkte (Listing und Search für Kontakte und Companies)
+    nachbildet, inklusive Paginierung (`after`), einstellbarer Latenz und 429-Antworten bei jeder
+    n-ten Anfrage (throttle_every=0 schaltet das ab).
+    """
+
+    def __init__(self, companies=(), contacts=(), latency=0.0, throttle_every=0):
+        self.objects = {"companies": list(companies), "contacts": list(contacts)}
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.requests = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @classmethod
+    def generate(cls, count, **kwargs):
+        """Server mit `count` Companies und je einem Kontakt mit Firmen-Domain."""
+        companies, contacts = [], []
+        for i, name in enumerate(company_names(count)):
+            modified = f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}T10:00:00Z"
+            companies.append({"id": str(i + 1), "properties": {
+                "name": name, "domain": f"{slug(name)}.at", "last_activity_date": modified,
+                "hs_lastmodifieddate": modified, "createdate": "2020-01-01T00:00:00Z"}})
+            contacts.append({"id": str(i + 1), "properties": {
+                "firstname": "Eva", "lastname": f"Muster{i}", "email": f"eva.muster{i}@{slug(name)}.at",
+                "lastmodifieddate": modified, "last_contacted": None}})
+        return cls(companies, contacts, **kwargs)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self):
+        with self._lock:
+            self.requests += 1
+            if self.throttle_every and self.requests % self.throttle_every == 0:
+                self.throttled += 1
+                return True
+            return False
+
+    @staticmethod
+    def _page(results, after, limit):
+        start = int(after or 0)
+        body = {"results": results[start:start + limit]}
+        if start + limit < len(results):
+            body["paging"] = {"next": {"after": str(start + limit)}}
+        return body
+
+    @staticmethod
+    def _matches(obj, flt):
+        value = obj["properties"].get(flt["propertyName"]) or ""
+        if flt["operator"] == "EQ":
+            return str(value).lower() == str(flt["value"]).lower()
+        if flt["operator"] == "CONTAINS_TOKEN":
+            return flt["value"].lower() in re.findall(r"\w+", str(value).lower())
+        if flt["operator"] == "GT":
+            return value > time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(int(flt["value"]) / 1000))
+        return False
+
+    def search(self, kind, body):
+        groups = body.get("filterGroups") or [{"filters": []}]
+        results = [obj for obj in self.objects[kind]
+                   if any(all(self._matches(obj, f) for f in g["filters"]) for g in groups)]
+        return self._page(results, body.get("after"), int(body.get("limit", 10)))
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Kopfzeilen und Body gehen getrennt raus; mit Nagle kämen ~40 ms Verzögerung pro Antwort dazu
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body, headers=()):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in headers:
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _route(self):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if fake._count():
+                    return 429, {"status": "error", "message": "rate limit"}, [("Retry-After", "0")]
+                url = urlparse(self.path)
+                match = re.match(r"^/crm/v3/objects/(contacts|companies)(/search)?$", url.path)
+                if not match:
+                    return 404, {"message": "not found"}, []
+                kind, is_search = match.groups()
+                if is_search:
+                    length = int(self.headers.get("Content-Length", 0))
+                    return 200, fake.search(kind, json.loads(self.rfile.read(length) or b"{}")), []
+                query = parse_qs(url.query)
+                return 200, fake._page(fake.objects[kind], query.get("after", [None])[0],
+                                       int(query.get("limit", ["10"])[0])), []
+
+            def do_GET(self):
+                self._reply(*self._route())
+
+            def do_POST(self):
+                self._reply(*self._route())
+
+        return Handler
+
+
+class _RedirectAdapter(HTTPAdapter):
+    """Leitet Anfragen an api.hubapi.com auf den lokalen Server um (die URLs im Code bleiben unverändert)."""
+
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+    def send(self, request, **kwargs):
+        request.url = self.base_url + request.url[len(HUBSPOT_ORIGIN):]
+        return super().send(request, **kwargs)
+
+
+def point_client_at(client, base_url):
+    """Hängt den HubSpotClient an den lokalen Server; Retry-Konfiguration und Pool bleiben erhalten."""
+    original = client.session.get_adapter(HUBSPOT_ORIGIN)
+    client.session.mount(HUBSPOT_ORIGIN, _RedirectAdapter(
+        base_url, pool_maxsize=original._pool_maxsize, max_retries=original.max_retries
+    ))
+
+
+# --- Google Sheets ---
+
+def _parse_range(a1, max_rows, max_cols):
+    start, _, end = a1.partition(":")
+    if start.isdigit():
+        # Ganze Zeilen, z.B. "6:6"
+        return int(start), 1, int(end or start), max_cols
+    row1, col1 = a1_to_rowcol(start)
+    if not end:
+        return row1, col1, row1, col1
+    if end[-1].isdigit():
+        row2, col2 = a1_to_rowcol(end)
+    else:
+        row2, col2 = max_rows, a1_to_rowcol(end + "1")[1]
+    return row1, col1, row2, col2
+
+
+class FakeWorksheet:
+    """
+    Worksheet im Speicher mit den von der App genutzten gspread-Methoden (get, batch_get, batch_update,
+    update, col_values). Wie die echte API werden leere Zellen am Zeilenende und leere Zeilen am Ende
+    weggelassen. `calls` zählt die API-Aufrufe (Round-Trips).
+    """
+
+    def __init__(self, rows=None):
+        self.rows = [list(r) for r in (rows or [])]
+        self.calls = 0
+
+    @classmethod
+    def company_sheet(cls, count, header_row=6):
+        """Akquise-Tabelle mit Kopfzeile in Zeile 6 und `count` Unternehmen ab Zeile 7 (Spalten A bis S)."""
+        header = ["Unternehmensname (laut Handelsregister)", "Name, Nachname", "E-Mail", "Telefon", "Notiz",
+                  "Ansprechpartner", "Anzahl Kontaktaufnahmen", "Angeschrieben", "Angerufen", "Termin",
+                  "Angebot", "Absage", "Follow-ups", "Website", "Region", "Gruppe", "Name icons Mitglied",
+                  "Letzter Kontakt Person", "Letzter Kontakt Organisation"]
+        rows = [[""] for _ in range(header_row - 1)] + [header]
+        regions = ["Tirol", "Wien", "Salzburg", "Vorarlberg", "Steiermark"]
+        for i, name in enumerate(company_names(count)):
+            rows.append([name, f"Eva Muster{i}", f"office@{slug(name)}.at", "", "", "",
+                         str(i % 4), "TRUE" if i % 3 == 0 else "FALSE", "FALSE", "FALSE", "FALSE", "FALSE", "0",
+                         f"www.{slug(name)}.at", regions[i % len(regions)], f"Gruppe {i % 3 + 1}", "",
+                         "", f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}"])
+        return cls(rows)
+
+    def copy(self):
+        return FakeWorksheet(self.rows)
+
+    def _cell(self, row, col):
+        if row - 1 < len(self.rows) and col - 1 < len(self.rows[row - 1]):
+            return self.rows[row - 1][col - 1]
+        return ""
+
+    def _read(self, a1):
+        row1, col1, row2, col2 = _parse_range(a1, len(self.rows), 26)
+        values = []
+        for row in range(row1, min(row2, len(self.rows)) + 1):
+            cells = [self._cell(row, col) for col in range(col1, col2 + 1)]
+            while cells and cells[-1] in ("", None):
+                cells.pop()
+            values.append(cells)
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def _write(self, a1, values):
+        row1, col1, _, _ = _parse_range(a1, len(self.rows), 26)
+        for r, row_values in enumerate(values):
+            row = row1 + r
+            while len(self.rows) < row:
+                self.rows.append([])
+            target = self.rows[row - 1]
+            needed = col1 - 1 + len(row_values)
+            if len(target) < needed:
+                target.extend([""] * (needed - len(target)))
+            target[col1 - 1:needed] = [str(v) if not isinstance(v, str) else v for v in row_values]
+
+    def get(self, range_name, **kwargs):
+        self.calls += 1
+        return self._read(range_name)
+
+    def batch_get(self, ranges, **kwargs):
+        self.calls += 1
+        return [self._read(a1) for a1 in ranges]
+
+    def batch_update(self, data, **kwargs):
+        self.calls += 1
+        for entry in data:
+            self._write(entry["range"], entry["values"])
+
+    def update(self, range_name=None, values=None, **kwargs):
+        self.calls += 1
+        self._write(range_name, values)
+
+    def col_values(self, col, **kwargs):
+        self.calls += 1
+        values = [row[col - 1] if col - 1 < len(row) else "" for row in self.rows]
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+
+# --- SMTP ---
+
+class SMTPSink:
+    """
+    Minimaler SMTP-Server (EHLO, AUTH, MAIL, RCPT, DATA, RSET, QUIT), der jede Mail annimmt und nur zählt.
+    Bietet kein STARTTLS an, daher mit SMTP_STARTTLS = false verwenden.
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.sessions = 0
+        self._lock = threading.Lock()
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            disable_nagle_algorithm = True
+
+            def handle(self):
+                with sink._lock:
+                    sink.sessions += 1
+                self.wfile.write(b"220 sink ESMTP\r\n")
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    verb = line[:4].upper()
+                    if verb == b"EHLO":
+                        self.wfile.write(b"250-sink\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+                    elif verb == b"AUTH":
+                        self.wfile.write(b"235 2.7.0 Authentication successful\r\n")
+                    elif verb == b"DATA":
+                        self.wfile.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                        while self.rfile.readline() not in (b".\r\n", b""):
+                            pass
+                        with sink._lock:
+                            sink.messages += 1
+                        self.wfile.write(b"250 2.0.0 Ok: queued\r\n")
+                    elif verb == b"QUIT":
+                        self.wfile.write(b"221 2.0.0 Bye\r\n")
+                        return
+                    else:
+                        self.wfile.write(b"250 2.0.0 Ok\r\n")
+
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def settings(self):
+        host, port = self._server.server_address
+        return {"GMAIL_USER": "bench@example.org", "GMAIL_PASS": "bench", "SMTP_HOST": host,
+                "SMTP_PORT": port, "SMTP_STARTTLS": False}
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# --- OpenAI ---
+
+class CannedOpenAI:
+    """Stellvertreter für OpenAI().chat.completions mit fester Antwort (auch gestreamt und als JSON)."""
+
+    def __init__(self, text, latency=0.0, chunk_size=64):
+        self.text = text
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    def _json(self):
+        companies = []
+        for line in self.text.splitlines():
+            parts = [p.strip(" *") for p in line.split(" – ")]
+            if len(parts) == 4:
+                name = re.sub(r"^\d+\.\s*", "", parts[0])
+                companies.append({"name": name, "website": parts[1], "standort": parts[2], "email": parts[3]})
+        return json.dumps({"companies": companies}, ensure_ascii=False)
+
+    def create(self, model=None, messages=None, stream=False, response_format=None, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        content = self._json() if response_format else self.text
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+        return (
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[i:i + self.chunk_size]))])
+            for i in range(0, len(content), self.chunk_size)
+        )
@@ -0,0 +1,309 @@
+"""
+Offline-Benchmarks für die zeitkritischen Pfade des Tools. Gemessen wird der echte Code gegen lokale
+Stellvertreter (siehe fakes.py): HubSpot als HTTP-Server, Google Sheets im Speicher, ein SMTP-Empfänger
+und feste OpenAI-Antworten. Es werden keine echten Zugangsdaten gebraucht und nichts verschickt.
+
+    python benchmarks/run.py                     # 10, 100 und 10.000 Zeilen
+    python benchmarks/run.py --sizes 100 --only hubspot --latency-ms 20 --throttle-every 25
+    python benchmarks/run.py --json results.json # Ergebnisse zusätzlich als JSON (für Vergleiche)
+
+Ausgabe je Szenario und Größe: Anzahl Messungen, p50/p95 in Millisekunden und Durchsatz (Einträge/s).
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SECRETS = """\
+APP_PASSWORD = "bench"
+OPENAI_API_KEY = "bench"
+HUBSPOT_TOKEN = "bench"
+HUBSPOT_CACHE_PATH = ""
+RESEARCH_CACHE_PATH = ""
+GMAIL_USER = "bench@example.org"
+GMAIL_PASS = "bench"
+SMTP_STARTTLS = "false"
+GOOGLE_SERVICE_ACCOUNT_JSON = "{}"
+"""
+
+GROUPS = ("openai", "hubspot", "sheet", "mail")
+
+
+def _percentile(values, p):
+    """Nearest-Rank-Perzentil (p zwischen 0 und 1)."""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(p * len(ordered)) - 1))]
+
+
+class Benchmark:
+    """Sammelt die Messwerte aller Szenarien und gibt sie als Tabelle bzw. JSON aus."""
+
+    def __init__(self, repeats):
+        self.repeats = repeats
+        self.results = []
+
+    def measure(self, scenario, size, op, items=1, setup=None, repeats=None, warmup=False, **extra):
+        """
+        Führt op(state) repeats-mal aus (state = setup(), nicht mitgemessen) und merkt sich die Laufzeiten.
+        items ist die Anzahl verarbeiteter Einträge pro Aufruf (für den Durchsatz); warmup=True macht vorher
+        einen ungemessenen Durchlauf (z.B. für Imports, die pandas erst beim ersten Aufruf nachlädt).
+        """
+        timings = []
+        # Die Module geben Fortschritt per print aus; das würde die Messung verfälschen
+        with contextlib.redirect_stdout(io.StringIO()):
+            if warmup:
+                op(setup() if setup else None)
+            for _ in range(repeats or self.repeats):
+                state = setup() if setup else None
+                start = time.perf_counter()
+                op(state)
+                timings.append(time.perf_counter() - start)
+        self._add(scenario, size, timings, items, extra)
+
+    def _add(self, scenario, size, timings, items, extra):
+        total = sum(timings)
+        result = {
+            "scenario": scenario,
+            "size": size,
+            "ops": len(timings),
+            "p50_ms": _percentile(timings, 0.5) * 1000,
+            "p95_ms": _percentile(timings, 0.95) * 1000,
+            "items_per_s": items * len(timings) / total if total else float("inf"),
+            **{key: (value() if callable(value) else value) for key, value in extra.items()}
+        }
+        self.results.append(result)
+        notes = ", ".join(f"{k}={v}" for k, v in result.items() if k not in
+                          ("scenario", "size", "ops", "p50_ms", "p95_ms", "items_per_s"))
+        print(f"{scenario:<34} {size:>6} {result['ops']:>5} {result['p50_ms']:>10.2f} {result['p95_ms']:>10.2f} "
+              f"{result['items_per_s']:>12.1f}  {notes}", flush=True)
+
+
+# --- Szenarien ---
+
+def bench_openai(bench, size, args):
+    from fakes import CannedOpenAI, openai_text
+    import get_companies
+    from get_companies import ExtractionStats, parse_openai_response, stream_companies_via_openai_prompt
+    from lookup_cache import LookupCache
+
+    text = openai_text(size)
+    bench.measure("parse_openai_response", size, lambda _: parse_openai_response(text, ExtractionStats()),
+                  items=size, warmup=True)
+
+    client = CannedOpenAI(text, latency=args.latency_ms / 1000)
+    get_companies.get_openai_client = lambda: client
+    get_companies._research_cache = LookupCache(path=None)
+    bench.measure("stream_companies_via_openai_prompt", size,
+                  lambda _: list(stream_companies_via_openai_prompt("bench", ExtractionStats(), force_fresh=True)),
+                  items=size)
+
+
+def _hubspot_setup(size, args, workdir):
+    """Startet den HubSpot-Stellvertreter und hängt Client, Indizes und Cache der Module daran."""
+    import hubspot_client
+    import hubspot_index
+    from fakes import FakeHubSpot, point_client_at
+    from hubspot_client import HubSpotClient, TokenBucket
+
+    fake = FakeHubSpot.generate(size, latency=args.latency_ms / 1000, throttle_every=args.throttle_every)
+    fake.__enter__()
+    client = HubSpotClient("bench")
+    point_client_at(client, fake.base_url)
+    if not args.keep_rate_limits:
+        # Sonst misst der Benchmark nur die HubSpot-Limits (9/s bzw. 4/s für Suchen)
+        client._rate_limiter = TokenBucket(10000)
+        client._search_rate_limiter = TokenBucket(10000)
+    hubspot_client._client = client
+    hubspot_index._company_index = hubspot_index.CompanyIndex(os.path.join(workdir, f"companies-{size}.json"))
+    hubspot_index._contact_index = hubspot_index.ContactIndex(os.path.join(workdir, f"contacts-{size}.json"))
+    return fake
+
+
+def _fresh_lookup_cache(_=None):
+    import hubspot_api
+    from lookup_cache import LookupCache
+    hubspot_api._lookup_cache = LookupCache(path=None)
+
+
+def bench_hubspot(bench, size, args, workdir):
+    import hubspot_index
+    from fakes import company_names
+    from hubspot_api import get_last_company_activity, get_last_company_activity_bulk, get_last_hubspot_contact
+
+    fake = _hubspot_setup(size, args, workdir)
+    try:
+        names = company_names(size)
+        rng = random.Random(3)
+        # Suchnamen wie aus einer Recherche: teils exakt, teils ohne Rechtsform, teils unbekannt
+        queries = [rng.choice([name, name.rsplit(" ", 1)[0], f"Unbekannt {i} GmbH"]) for i, name in enumerate(names)]
+        requests_before = fake.requests
+
+        def rebuild_index():
+            path = hubspot_index.get_company_index().path
+            if os.path.exists(path):
+                os.remove(path)
+            hubspot_index._company_index = hubspot_index.CompanyIndex(path)
+            _fresh_lookup_cache()
+
+        bench.measure("company_index_full_build", size, lambda _: get_last_company_activity(queries[0]),
+                      items=size, setup=rebuild_index, repeats=min(bench.repeats, 3),
+                      requests_per_build=lambda: (fake.requests - requests_before) // min(bench.repeats, 3))
+
+        lookups = iter(rng.choices(queries, k=args.ops))
+        bench.measure("get_last_company_activity", size, lambda _: get_last_company_activity(next(lookups)),
+                      setup=_fresh_lookup_cache, repeats=args.ops)
+
+        bench.measure("get_last_company_activity_bulk", size, lambda _: get_last_company_activity_bulk(queries),
+                      items=size, setup=_fresh_lookup_cache)
+
+        contacts = [c["properties"] for c in fake.objects["contacts"]]
+        # Hälfte über exakte E-Mail, Hälfte nur über den Firmennamen (Kontakt-Index nach Domain)
+        picks = rng.choices(range(size), k=args.ops)
+        contact_lookups = iter([
+            (contacts[j]["email"], None) if i % 2 == 0 else ("", names[j]) for i, j in enumerate(picks)
+        ])
+        requests_before = fake.requests
+        bench.measure("get_last_hubspot_contact", size,
+                      lambda _: get_last_hubspot_contact(*next(contact_lookups)),
+                      setup=_fresh_lookup_cache, repeats=args.ops,
+                      requests=lambda: fake.requests - requests_before, throttled=lambda: fake.throttled)
+    finally:
+        fake.__exit__(None, None, None)
+
+
+def bench_sheet(bench, size, args):
+    import get_companies
+    from fakes import FakeWorksheet, company_names, slug
+    from sheet_data import FIRST_DATA_ROW, frame_from_values, save_company_data
+
+    template = FakeWorksheet.company_sheet(size)
+
+    # load_company_data in app.py ist frame_from_values(get_worksheet().get("A6:Q")) hinter st.cache_data
+    bench.measure("load_company_data", size, lambda ws: frame_from_values(ws.get("A6:Q")),
+                  items=size, setup=template.copy, warmup=True)
+
+    df = frame_from_values(template.get("A6:Q"))
+    edits = max(1, size // 100)
+
+    def prepare_save():
+        ws = template.copy()
+        edited = df.copy()
+        name_col = df.columns[0]
+        for row in df.index[::max(1, len(df) // edits)][:edits]:
+            edited.loc[row, name_col] = f"{edited.loc[row, name_col]} (geändert)"
+        new_row = {col: None for col in df.columns}
+        new_row[name_col] = "Neu Angelegt GmbH"
+        edited.loc[FIRST_DATA_ROW + len(df) + 1000] = new_row
+        return ws, edited
+
+    calls = {}
+
+    def save(state):
+        ws, edited = state
+        save_company_data(ws, snapshot=df, edited=edited, columns=list(df.columns), next_row=FIRST_DATA_ROW + len(df))
+        calls["api"] = ws.calls
+
+    bench.measure("save_company_data", size, save, items=edits + 1, setup=prepare_save, warmup=True,
+                  sheet_calls=lambda: calls.get("api"))
+
+    # Neue Recherche-Ergebnisse: zur Hälfte Dubletten bereits eingetragener Unternehmen
+    batch = min(size, 100)
+    existing = company_names(size)
+    new_names = company_names(batch, seed=99)
+    companies = []
+    for i in range(batch):
+        name = existing[i] if i % 2 == 0 else f"{new_names[i]} Neu"
+        companies.append({"Name": name, "E-Mail": f"office@{slug(name)}.at", "Website": f"www.{slug(name)}.at",
+                          "Region": "Tirol", "Gruppe": "Gruppe 1"})
+
+    def prepare_update():
+        ws = template.copy()
+        get_companies.get_worksheet = lambda: ws
+        return ws
+
+    def update(ws):
+        get_companies.update_sheet(companies)
+        calls["api"] = ws.calls
+
+    bench.measure("update_sheet", size, update, items=batch, setup=prepare_update,
+                  companies=batch, sheet_calls=lambda: calls.get("api"))
+
+
+def bench_mail(bench, size, args):
+    import send_emails
+    from fakes import SMTPSink
+    from send_emails import MailSender, PreparedCampaign, send_mail
+
+    with SMTPSink() as sink:
+        send_emails.get_smtp_settings = lambda: sink.settings
+        campaign = PreparedCampaign(
+            mail_text="Sehr geehrte Damen und Herren von {company},\n\nwir melden uns wegen ...",
+            mail_subject="Anfrage für {company}"
+        )
+        recipients = iter(range(size))
+        with MailSender() as sender:
+            def send(_):
+                i = next(recipients)
+                if not send_mail(f"kontakt{i}@example.org", f"Firma {i}", campaign=campaign, sender=sender):
+                    raise RuntimeError("Versand an den SMTP-Stellvertreter fehlgeschlagen")
+
+            bench.measure("send_mail", size, send, repeats=size,
+                          messages=lambda: sink.messages, smtp_sessions=lambda: sink.sessions)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="10,100,10000", help="Zeilenzahlen, kommagetrennt")
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"Auswahl aus {', '.join(GROUPS)}")
+    parser.add_argument("--repeats", type=int, default=5, help="Wiederholungen für Aufrufe über alle Zeilen")
+    parser.add_argument("--ops", type=int, default=50, help="Einzelabfragen pro HubSpot-Szenario")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="künstliche Latenz für HubSpot/OpenAI")
+    parser.add_argument("--throttle-every", type=int, default=0, help="jede n-te HubSpot-Anfrage mit 429 beantworten")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="HubSpot-Rate-Limits des Clients beibehalten")
+    parser.add_argument("--json", help="Ergebnisse zusätzlich in diese Datei schreiben")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    groups = {g.strip() for g in args.only.split(",") if g.strip()}
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    # Eigenes Arbeitsverzeichnis mit Dummy-Secrets, damit weder Caches noch Logs des Projekts berührt werden
+    workdir = tempfile.mkdtemp(prefix="akquise-bench-")
+    os.makedirs(os.path.join(workdir, ".streamlit"))
+    with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+        f.write(SECRETS)
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    sys.path[:0] = [REPO_ROOT, os.path.dirname(os.path.abspath(__file__))]
+
+    bench = Benchmark(args.repeats)
+    print(f"{'Szenario':<34} {'Zeilen':>6} {'Ops':>5} {'p50 ms':>10} {'p95 ms':>10} {'Einträge/s':>12}")
+    try:
+        for size in sizes:
+            if "openai" in groups:
+                bench_openai(bench, size, args)
+            if "hubspot" in groups:
+                bench_hubspot(bench, size, args, workdir)
+            if "sheet" in groups:
+                bench_sheet(bench, size, args)
+            if "mail" in groups:
+                bench_mail(bench, size, args)
+    finally:
+        os.chdir(previous_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": bench.results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
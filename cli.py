@@ -0,0 +1,411 @@
+"""
+Stapelbetrieb ohne Streamlit: recherchiert Unternehmen, gleicht sie mit HubSpot ab, trägt sie ins Sheet ein
+und verschickt optional die Mails, mit denselben Funktionen wie die App. Die Schritte laufen als Strom
+(jedes Unternehmen geht sofort weiter) und der Stand wird laufend in einer Checkpoint-Datei gesichert;
+nach einem Abbruch setzt --resume dort wieder an.
+
+    python cli.py --config batch.toml
+    python cli.py --prompt-type klein --anzahl 500 --send --mail-subject "Anfrage für {company}"
+    python cli.py --config batch.toml --resume
+
+Zugangsdaten kommen aus [secrets] in der Konfigurationsdatei, aus Umgebungsvariablen (auch über eine
+.env-Datei) oder aus .streamlit/secrets.toml, siehe settings.py. Wie die App aus dem Projektordner starten.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+
+import settings
+
+CHECKPOINT_FILE = "cache/cli_checkpoint.json"
+# Neue Unternehmen werden in Blöcken dieser Größe ins Sheet eingetragen (je Block ein batch_update)
+INSERT_BATCH_SIZE = 50
+# Abstand der Fortschrittsmeldungen und der Checkpoint-Sicherungen (Sekunden)
+PROGRESS_INTERVAL_SECONDS = 5
+CHECKPOINT_INTERVAL_SECONDS = 2
+
+DEFAULT_CONFIG = {
+    "research": {
+        "prompt_type": "klein",   # "klein", "mittelständisch" oder "eigener" (dann prompt_file)
+        "prompt_file": None,
+        "anzahl": 20,
+        "structured": False,
+        "force_fresh": False,
+    },
+    "enrich": {
+        "search_contacts": False,
+        "only_new": False,
+    },
+    "sheet": {
+        "insert": True,
+    },
+    "mail": {
+        "send": False,
+        "subject": None,
+        "text_file": None,
+        "attachment": None,
+        "cc": None,
+        "add_signature": True,
+        "messages_per_minute": None,
+    },
+    "run": {
+        "checkpoint": CHECKPOINT_FILE,
+    },
+}
+
+
+def _load_toml(path):
+    try:
+        import tomllib
+    except ModuleNotFoundError:
+        # Python < 3.11: das toml-Paket kommt mit Streamlit
+        import toml
+        with open(path, "r", encoding="utf-8") as f:
+            return toml.load(f)
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def load_config(args):
+    """Standardwerte, darüber die TOML-Datei (--config), darüber die Kommandozeile."""
+    config = {section: dict(values) for section, values in DEFAULT_CONFIG.items()}
+    if args.config:
+        data = _load_toml(args.config)
+        settings.configure(data.pop("secrets", {}))
+        for section, values in data.items():
+            if section not in config:
+                raise SystemExit(f"Unbekannter Abschnitt [{section}] in {args.config}")
+            config[section].update(values)
+
+    overrides = {
+        ("research", "prompt_type"): args.prompt_type,
+        ("research", "prompt_file"): args.prompt_file,
+        ("research", "anzahl"): args.anzahl,
+        ("research", "structured"): args.structured or None,
+        ("research", "force_fresh"): args.force_fresh or None,
+        ("enrich", "search_contacts"): args.search_contacts or None,
+        ("enrich", "only_new"): args.only_new or None,
+        ("sheet", "insert"): False if args.no_insert else None,
+        ("mail", "send"): args.send or None,
+        ("mail", "subject"): args.mail_subject,
+        ("mail", "text_file"): args.mail_text_file,
+        ("run", "checkpoint"): args.checkpoint,
+    }
+    for (section, key), value in overrides.items():
+        if value is not None:
+            config[section][key] = value
+    if config["research"]["prompt_file"]:
+        config["research"]["prompt_type"] = "eigener"
+    if config["mail"]["send"] and not config["sheet"]["insert"]:
+        raise SystemExit("Mailversand setzt das Eintragen ins Sheet voraus (--no-insert und --send schließen sich aus).")
+    return config
+
+
+class Checkpoint:
+    """
+    Stand eines Stapellaufs als JSON-Datei: Konfiguration, Ausschlussliste der Recherche, alle fertig
+    abgeglichenen Unternehmen, wie viele davon eingetragen sind, und die Kampagne des Mailversands.
+    Wird atomar geschrieben (temporäre Datei + Umbenennen).
+    """
+
+    def __init__(self, path, config):
+        self.path = path
+        self.state = {
+            "config": config,
+            "exclude_names": None,
+            "companies": [],
+            "inserted": 0,
+            "skipped": [],
+            "rows": {},
+            "research_done": False,
+            "campaign_id": None,
+        }
+        self._saved_at = 0.0
+
+    @classmethod
+    def open(cls, path, config, resume):
+        checkpoint = cls(path, config)
+        if not os.path.exists(path):
+            return checkpoint
+        if not resume:
+            raise SystemExit(f"Checkpoint {path} existiert bereits: mit --resume fortsetzen oder die Datei löschen.")
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("config", {}).get("research") != config["research"]:
+            raise SystemExit(f"Checkpoint {path} gehört zu einer anderen Recherche (Abschnitt [research] weicht ab).")
+        # Versand- und Eintrageinstellungen dürfen sich beim Fortsetzen ändern
+        state["config"] = config
+        checkpoint.state.update(state)
+        return checkpoint
+
+    def save(self, force=True):
+        now = time.monotonic()
+        if not force and now - self._saved_at < CHECKPOINT_INTERVAL_SECONDS:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, self.path)
+        self._saved_at = now
+
+
+class Progress:
+    """Gibt in regelmäßigen Abständen Anzahl, Durchsatz und Laufzeit eines Schritts auf stderr aus."""
+
+    def __init__(self, stage, total=None):
+        self.stage = stage
+        self.total = total
+        self.done = 0
+        self._initial = None
+        self._start = time.monotonic()
+        self._reported_at = self._start
+
+    def update(self, done=None, force=False):
+        if done is not None:
+            self.done = done
+        if self._initial is None:
+            # Beim Fortsetzen zählt für den Durchsatz nur, was in diesem Lauf dazukommt
+            self._initial = self.done
+        now = time.monotonic()
+        if force or now - self._reported_at >= PROGRESS_INTERVAL_SECONDS:
+            self._reported_at = now
+            elapsed = now - self._start
+            rate = (self.done - self._initial) / elapsed if elapsed else 0.0
+            total = f"/{self.total}" if self.total else ""
+            print(f"[{self.stage}] {self.done}{total} · {rate:.2f}/s · {elapsed:.0f} s", file=sys.stderr, flush=True)
+
+
+def _research_source(config, exclude_names, force_fresh):
+    from get_companies import (SHARD_SIZE, get_companies_structured, get_prompt, research_companies_sharded,
+                               stream_companies_via_openai_prompt)
+
+    research = config["research"]
+    if research["prompt_type"] == "eigener":
+        with open(research["prompt_file"], "r", encoding="utf-8") as f:
+            custom_prompt = f.read()
+        # Wie in der App wird das erwartete Ausgabeformat angehängt
+        with open("resources/prompt_structure.txt", "r", encoding="utf-8") as f:
+            prompt = get_prompt(custom_prompt=custom_prompt + f.read())
+        prompt_template = None
+    else:
+        prompt_template = get_prompt(prompt_type=research["prompt_type"])
+        prompt = prompt_template.replace("{anzahl}", str(research["anzahl"]))
+
+    # Wie in der App: große Recherchen als parallele Teilrecherchen
+    if prompt_template is not None and research["anzahl"] > SHARD_SIZE:
+        return research_companies_sharded(
+            prompt_template, research["anzahl"], exclude_names=exclude_names,
+            research=get_companies_structured if research["structured"] else None, force_fresh=force_fresh
+        )
+    if research["structured"]:
+        return iter(get_companies_structured(prompt, force_fresh=force_fresh))
+    return stream_companies_via_openai_prompt(prompt, force_fresh=force_fresh)
+
+
+def _insert_pending(checkpoint, final=False):
+    from get_companies import update_sheet
+
+    state = checkpoint.state
+    while len(state["companies"]) - state["inserted"] >= (1 if final else INSERT_BATCH_SIZE):
+        batch = state["companies"][state["inserted"]:state["inserted"] + INSERT_BATCH_SIZE]
+        rows = {}
+        state["skipped"].extend(update_sheet([dict(company) for company in batch], rows=rows))
+        # Sheet-Zeilen (Position in state["companies"] als Schlüssel) für das Rückschreiben des Versandstatus
+        state["rows"].update({str(state["inserted"] + i): row for i, row in rows.items()})
+        state["inserted"] += len(batch)
+        checkpoint.save()
+
+
+def run_research(config, checkpoint):
+    """Recherche → HubSpot-Abgleich → Eintragen, als Strom; bereits im Checkpoint enthaltene Unternehmen werden übersprungen."""
+    from get_companies import company_key, get_existing_company_names
+    from hubspot_api import enrich_companies_iter
+
+    state = checkpoint.state
+    if state["exclude_names"] is None:
+        # Beim Fortsetzen dieselbe Ausschlussliste, damit die Teilrecherchen aus dem Recherche-Cache kommen
+        state["exclude_names"] = get_existing_company_names()
+        checkpoint.save()
+    known = {company_key(company) for company in state["companies"]}
+
+    # Beim Fortsetzen fertige Teilrecherchen aus dem Cache nehmen, auch wenn der erste Lauf ihn ignoriert hat
+    force_fresh = config["research"]["force_fresh"] and not state["companies"]
+
+    def new_companies():
+        for company in _research_source(config, state["exclude_names"], force_fresh):
+            if company_key(company) not in known:
+                known.add(company_key(company))
+                yield company
+
+    progress = Progress("Recherche + HubSpot", total=config["research"]["anzahl"])
+    progress.update(len(state["companies"]), force=True)
+    enrich = config["enrich"]
+    for company in enrich_companies_iter(new_companies(), search_contacts=enrich["search_contacts"], only_new=enrich["only_new"]):
+        state["companies"].append(company)
+        checkpoint.save(force=False)
+        if config["sheet"]["insert"]:
+            _insert_pending(checkpoint)
+        progress.update(len(state["companies"]))
+    if config["sheet"]["insert"]:
+        _insert_pending(checkpoint, final=True)
+    state["research_done"] = True
+    checkpoint.save()
+    progress.update(force=True)
+
+
+def _recipients(checkpoint):
+    """
+    Eingetragene (nicht übersprungene) Unternehmen mit gültiger E-Mail-Adresse als Empfänger für
+    enqueue_campaign; Adressen werden wie in der App vorab geprüft und dedupliziert (recipient_batch).
+    Mit bekannter Sheet-Zeile wird der Versand dort vermerkt (siehe send_queue).
+    """
+    import pandas as pd
+    from mail_templates import recipient_batch
+
+    state = checkpoint.state
+    skipped = set(state["skipped"])
+    positions = [i for i, c in enumerate(state["companies"][:state["inserted"]]) if c.get("Name") not in skipped]
+    if not positions:
+        return []
+    frame = pd.DataFrame([state["companies"][i] for i in positions], index=positions)
+    recipients, rejected = recipient_batch(frame)
+    for position, reason in rejected.items():
+        print(f"Nicht angeschrieben: {state['companies'][position].get('Name', '')}: {reason}", file=sys.stderr)
+    for recipient in recipients:
+        # recipient_batch liefert die Position in state["companies"]; ins Journal gehört die Sheet-Zeile
+        row = state["rows"].get(str(recipient.pop("row")))
+        if row is not None:
+            recipient["row"] = row
+    return recipients
+
+
+def run_mailing(config, checkpoint):
+    """Reiht die Kampagne einmal ein (send_queue) und wartet, bis der Worker alle Mails bearbeitet hat."""
+    from send_emails import PreparedCampaign
+    from send_queue import campaign_progress, enqueue_campaign, ensure_worker, wait_for_worker
+
+    mail = config["mail"]
+    state = checkpoint.state
+    mail_text = None
+    if mail["text_file"]:
+        with open(mail["text_file"], "r", encoding="utf-8") as f:
+            mail_text = f.read()
+
+    if state["campaign_id"] is None:
+        recipients = _recipients(checkpoint)
+        if not recipients:
+            print("Keine neuen Empfänger für den Mailversand.", file=sys.stderr)
+            return
+        missing = PreparedCampaign(mail_text, mail["subject"], add_signature=mail["add_signature"]).missing_fields(
+            [{"company": r["company"], **r["fields"]} for r in recipients]
+        )
+        if missing:
+            raise SystemExit("Für folgende Empfänger fehlen Platzhalter-Werte, es wurde nichts gesendet:\n- " + "\n- ".join(
+                f"{recipients[i]['company']}: {', '.join(fields)}" for i, fields in missing.items()
+            ))
+        attachment = None
+        if mail["attachment"]:
+            with open(mail["attachment"], "rb") as f:
+                attachment = io.BytesIO(f.read())
+            attachment.name = os.path.basename(mail["attachment"])
+        state["campaign_id"] = enqueue_campaign(
+            recipients, mail_text=mail_text, mail_subject=mail["subject"], attachment=attachment,
+            add_signature=mail["add_signature"], cc_email=mail["cc"], messages_per_minute=mail["messages_per_minute"]
+        )
+        checkpoint.save()
+    else:
+        # Offene Jobs der Kampagne stehen noch im Journal; der Worker macht dort weiter
+        ensure_worker()
+
+    progress = Progress("Mailversand")
+    while True:
+        status = campaign_progress(state["campaign_id"])
+        done = status["sent"] + status["failed"] + status["uncertain"]
+        progress.total = status["total"]
+        progress.update(done)
+        if done >= status["total"]:
+            break
+        time.sleep(1)
+    progress.update(force=True)
+    # Der Worker schreibt die letzten Versandstatus erst nach dem letzten Job ins Sheet; der Prozess
+    # darf vorher nicht enden (Daemon-Thread)
+    wait_for_worker()
+    status = campaign_progress(state["campaign_id"])
+    print(f"Kampagne {state['campaign_id']}: {status['sent']} gesendet, {status['failed']} fehlgeschlagen, "
+          f"{status['uncertain']} unklar.", file=sys.stderr)
+    if status["unsynced"]:
+        print(f"{status['unsynced']} gesendete Mails sind noch nicht im Sheet vermerkt"
+              + (f": {status['sheet_error']}" if status["sheet_error"] else "."), file=sys.stderr)
+
+
+def print_summary(perf, checkpoint):
+    summary = perf.summary()
+    state = checkpoint.state
+    print(f"\nFertig in {summary['duration_s']:.1f} s: {len(state['companies'])} Unternehmen abgeglichen, "
+          f"{state['inserted'] - len(state['skipped'])} eingetragen, {len(state['skipped'])} übersprungen.", file=sys.stderr)
+    for stage in summary["stages"][:10]:
+        print(f"  {stage['stage']:<34} {stage['count']:>6}× {stage['total_s']:>8.1f} s", file=sys.stderr)
+    for name, value in sorted(summary["counters"].items()):
+        print(f"  {name:<34} {value:>10.0f}" if isinstance(value, float) else f"  {name:<34} {value:>10}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--config", help="TOML-Datei mit den Abschnitten [research], [enrich], [sheet], [mail], [run], [secrets]")
+    parser.add_argument("--resume", action="store_true", help="einen abgebrochenen Lauf aus dem Checkpoint fortsetzen")
+    parser.add_argument("--checkpoint", help=f"Checkpoint-Datei (Standard: {CHECKPOINT_FILE})")
+    parser.add_argument("--prompt-type", choices=["klein", "mittelständisch"])
+    parser.add_argument("--prompt-file", help="eigener Prompt aus dieser Datei (das Ausgabeformat wird angehängt)")
+    parser.add_argument("--anzahl", type=int, help="Anzahl zu recherchierender Unternehmen")
+    parser.add_argument("--structured", action="store_true", help="strukturierte Ausgabe (JSON-Schema)")
+    parser.add_argument("--force-fresh", action="store_true", help="Recherche-Cache ignorieren")
+    parser.add_argument("--search-contacts", action="store_true", help="auch Kontaktpersonen in HubSpot suchen")
+    parser.add_argument("--only-new", action="store_true", help="Unternehmen überspringen, die schon in HubSpot sind")
+    parser.add_argument("--no-insert", action="store_true", help="nichts ins Sheet eintragen (nur recherchieren)")
+    parser.add_argument("--send", action="store_true", help="eingetragene Unternehmen anschreiben")
+    parser.add_argument("--mail-subject", help="Betreff (Platzhalter wie {company} möglich)")
+    parser.add_argument("--mail-text-file", help="Mailtext aus dieser Datei (sonst Standardtext)")
+    parser.add_argument("--verbose", action="store_true", help="Ausgaben der Module (Treffer, Versand) anzeigen")
+    args = parser.parse_args(argv)
+
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    # Ohne Streamlit-Server warnen die Caches bei jedem Aufruf; das ist hier erwartet
+    from streamlit.logger import set_log_level
+    set_log_level("error")
+
+    config = load_config(args)
+    checkpoint = Checkpoint.open(config["run"]["checkpoint"], config, args.resume)
+
+    import instrumentation
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with instrumentation.run("CLI") as perf:
+        try:
+            with output:
+                if not checkpoint.state["research_done"]:
+                    run_research(config, checkpoint)
+                if config["mail"]["send"]:
+                    run_mailing(config, checkpoint)
+        except KeyboardInterrupt:
+            checkpoint.save()
+            logging.warning("CLI-Lauf abgebrochen, Stand gesichert")
+            print("\nAbgebrochen. Mit denselben Optionen und --resume fortsetzen.", file=sys.stderr)
+            return 130
+    print_summary(perf, checkpoint)
+    # Vollständig abgeschlossen: der nächste Lauf beginnt ohne --resume von vorn
+    os.remove(checkpoint.path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
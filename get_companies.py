@@ -1,36 +1,43 @@
 # -*- coding: utf-8 -*-
 import pandas as pd
+import hashlib
 import logging
 import os
-from openai import OpenAI
 import re
-import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
 import requests
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from backend import get_openai_client, get_worksheet
+from gspread.utils import rowcol_to_a1
+from normalize import EMAIL_PATTERN, company_domain, normalize_company_name
+from sheet_data import CompanyDedupIndex, row_runs
+from lookup_cache import MISSING, LookupCache
+from settings import get_secret
+from instrumentation import bind, count, record, span
 from hubspot_api import get_last_hubspot_contact, annotate_companies_with_hubspot, get_last_company_activity
 
 os.makedirs("mail_log", exist_ok=True)
 
-SPREADSHEET_ID = "1o4vY8j2hrHyKfs1wwvyxYF172BOvgPRl5qpj_9-GsJE"
-WORKSHEET_NAME = "Team Gabriel"
 LOG_FILE = 'mail_log/mail_log.txt'
 
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+OPENAI_MODEL = "gpt-4.1"
 
-SERVICE_ACCOUNT_FILE = "service_account.json"
-with open(SERVICE_ACCOUNT_FILE, "w") as f:
-    f.write(st.secrets["GOOGLE_SERVICE_ACCOUNT_JSON"])
+# Recherche-Antworten werden pro Modell und Prompt (Hash) auf der Platte zwischengespeichert
+RESEARCH_CACHE_FILE = "cache/research_cache.sqlite3"
+RESEARCH_CACHE_MAX_SIZE = 200
+RESEARCH_CACHE_TTL_SECONDS = 7 * 24 * 3600
 
-SCOPES = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive"
-]
-CREDS = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-gc = gspread.authorize(CREDS)
-sh = gc.open_by_key(SPREADSHEET_ID)
-worksheet = sh.worksheet(WORKSHEET_NAME)
+# Große Recherchen werden in parallele Teilrecherchen mit je höchstens SHARD_SIZE Unternehmen aufgeteilt
+SHARD_SIZE = 20
+MAX_PARALLEL_SHARDS = 5
+MAX_EXCLUDED_NAMES = 150
+# Teilrecherchen bekommen disjunkte Anfangsbuchstaben des Unternehmensnamens; zusammen decken sie
+# in jedem Lauf das ganze Alphabet ab, Branchen- und Regionsvorgaben des Prompts bleiben unverändert
+SHARD_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
 
 logging.basicConfig(
     filename=LOG_FILE,
@@ -39,6 +46,27 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
+_research_cache = None
+_research_cache_lock = threading.Lock()
+
+def get_research_cache():
+    """Prozessweiter Cache für OpenAI-Recherchen (in RESEARCH_CACHE_PATH persistiert)."""
+    global _research_cache
+    with _research_cache_lock:
+        if _research_cache is None:
+            _research_cache = LookupCache(
+                max_size=int(get_secret("RESEARCH_CACHE_SIZE", RESEARCH_CACHE_MAX_SIZE)),
+                ttl_seconds=float(get_secret("RESEARCH_CACHE_TTL_SECONDS", RESEARCH_CACHE_TTL_SECONDS)),
+                path=get_secret("RESEARCH_CACHE_PATH", RESEARCH_CACHE_FILE) or None,
+                name="research"
+            )
+        return _research_cache
+
+def research_cache_key(mode, prompt):
+    """Schlüssel aus Modell, Recherche-Art (text/structured) und SHA-256 des vollständigen Prompts."""
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return f"research:{OPENAI_MODEL}:{mode}:{digest}"
+
 def get_prompt(prompt_type=None, custom_prompt=None):
     if custom_prompt:
         return custom_prompt
@@ -51,55 +79,400 @@ def get_prompt(prompt_type=None, custom_prompt=None):
     with open(path, "r", encoding="utf-8") as f:
         return f.read()
 
-def get_companies_via_openai_prompt(prompt):
-    response = client.chat.completions.create(
-        model="gpt-4.1",
-        messages=[{"role": "user", "content": prompt}]
-    )
-    return response.choices[0].message.content
+def get_companies_via_openai_prompt(prompt, force_fresh=False, stats=None):
+    """
+    Antworttext von OpenAI; identische Prompts kommen aus dem Recherche-Cache (außer force_fresh).
+    Ein Cache-Treffer wird in stats.cached gezählt (erkannte/verworfene Zeilen zählt parse_openai_response).
+    """
+    key = research_cache_key("text", prompt)
+    if not force_fresh:
+        cached = get_research_cache().get(key)
+        if cached is not MISSING:
+            if stats is not None:
+                replay = ExtractionStats()
+                replay.cached = 1
+                stats.merge(replay)
+            return cached["response"]
+    count("openai_requests")
+    with span("openai.request"):
+        response = get_openai_client().chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=[{"role": "user", "content": prompt}]
+        )
+    response_text = response.choices[0].message.content
+    call_stats = ExtractionStats()
+    companies = parse_openai_response(response_text or "", call_stats)
+    _store_research(key, response_text, companies, call_stats.rejected_lines)
+    return response_text
+
+# Bevorzugt: Trennstriche mit Leerzeichen, damit Bindestriche im Namen ("Müller-Bau") erhalten bleiben.
+# Die ursprüngliche, lockerere Regex bleibt als Fallback.
+STRICT_LINE_PATTERN = re.compile(
+    r'^\s*(.+?)\s+[-–—]\s+(.+?)\s+[-–—]\s+(.+?)\s+[-–—]\s+([\w\.+-]+@[\w\.-]+\.\w+)\s*$'
+)
+COMPANY_LINE_PATTERN = re.compile(
+    r'^\s*(.*?)\s*[-–]\s*(.*?)\s*[-–]\s*(.*?)\s*[-–]\s*([\w\.-]+@[\w\.-]+\.\w+)\s*$'
+)
+# Aufzählungszeichen, Nummerierung und Markdown-Fettdruck, die das Modell trotz Anweisung ausgibt
+LINE_DECORATION_PATTERN = re.compile(r'^\s*(?:[-*•·]\s+|\d+[.)]\s+)?')
+
+COMPANY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "companies": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string", "description": "Unternehmensname"},
+                    "website": {"type": "string"},
+                    "standort": {"type": "string", "description": "Ort, Bundesland"},
+                    "email": {"type": "string", "description": "Offizielle Kontakt-E-Mail-Adresse"}
+                },
+                "required": ["name", "website", "standort", "email"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["companies"],
+    "additionalProperties": False
+}
+
+class ExtractionStats:
+    """
+    Ausbeute einer Recherche: angefragte Unternehmen, erkannte und verworfene Einträge.
+    Thread-sicher, damit parallele Teilrecherchen in dieselben Zähler schreiben können.
+    """
+
+    def __init__(self, requested=None):
+        self.requested = requested
+        self.parsed = 0
+        self.rejected = 0
+        self.rejected_lines = []
+        self.cached = 0
+        self._lock = threading.Lock()
+
+    def record(self, ok, line=None):
+        with self._lock:
+            if ok:
+                self.parsed += 1
+            else:
+                self.rejected += 1
+                if line is not None:
+                    self.rejected_lines.append(line)
 
-def parse_openai_response(response_text):
+    def merge(self, other):
+        """Übernimmt die Zähler einer einzelnen Recherche (z.B. einer Teilrecherche)."""
+        with self._lock:
+            self.parsed += other.parsed
+            self.rejected += other.rejected
+            self.rejected_lines.extend(other.rejected_lines)
+            self.cached += other.cached
+
+    def as_dict(self):
+        with self._lock:
+            return {"requested": self.requested, "parsed": self.parsed, "rejected": self.rejected, "cached": self.cached}
+
+def parse_company_line(line, stats=None):
+    """Parst eine Zeile 'Name – Website – Standort – Email'; gibt None zurück, wenn sie nicht passt."""
+    cleaned = LINE_DECORATION_PATTERN.sub('', line.replace('**', '')).strip()
+    match = STRICT_LINE_PATTERN.match(cleaned) or COMPANY_LINE_PATTERN.match(cleaned)
+    if not match:
+        # Nur Zeilen mit E-Mail-Adresse zählen als verworfene Einträge (nicht Einleitungssätze o.ä.)
+        if stats is not None and '@' in line:
+            stats.record(False, line)
+        return None
+    company_name, website, region, email = match.groups()
+    if stats is not None:
+        stats.record(True)
+    return {
+        'Name': company_name.strip(), 
+        'Website': website.strip(),
+        'Region': region.strip(),
+        'E-Mail': email.strip()
+    }
+
+def parse_openai_response(response_text, stats=None):
     companies = []
-    pattern = re.compile(
-        r'^\s*(.*?)\s*[-–]\s*(.*?)\s*[-–]\s*(.*?)\s*[-–]\s*([\w\.-]+@[\w\.-]+\.\w+)\s*$'
-    )
     lines = response_text.strip().split('\n')
     for line in lines:
-        match = pattern.match(line)
-        if match:
-            company_name, website, region, email = match.groups()
+        company = parse_company_line(line, stats)
+        if company:
+            companies.append(company)
+    return companies
+
+def _store_research(key, response_text, companies, rejected_lines=()):
+    """Legt Antworttext, erkannte Unternehmen und verworfene Zeilen im Recherche-Cache ab."""
+    try:
+        get_research_cache().set(key, {
+            "response": response_text,
+            "companies": companies,
+            "rejected": list(rejected_lines)
+        })
+    except Exception as e:
+        # Der Cache ist nur eine Abkürzung, die Recherche selbst war erfolgreich
+        logging.warning(f"Recherche konnte nicht gecacht werden: {e}")
+
+def _cached_research(key, stats, force_fresh):
+    """Unternehmen aus dem Recherche-Cache (Zähler werden wie bei einer echten Antwort gesetzt) oder None."""
+    if force_fresh:
+        return None
+    cached = get_research_cache().get(key)
+    if cached is MISSING:
+        return None
+    if stats is not None:
+        replay = ExtractionStats()
+        replay.parsed = len(cached["companies"])
+        replay.rejected = len(cached["rejected"])
+        replay.rejected_lines = list(cached["rejected"])
+        replay.cached = 1
+        stats.merge(replay)
+    return cached["companies"]
+
+def get_companies_structured(prompt, stats=None, force_fresh=False):
+    """
+    Recherche mit strukturierter Ausgabe (JSON-Schema): das Modell liefert typisierte Datensätze
+    statt Textzeilen. Ist die Antwort kein gültiges JSON, wird sie mit dem Zeilen-Parser gelesen.
+    """
+    key = research_cache_key("structured", prompt)
+    cached = _cached_research(key, stats, force_fresh)
+    if cached is not None:
+        return cached
+    call_stats = ExtractionStats()
+    count("openai_requests")
+    with span("openai.request", structured=True):
+        response = get_openai_client().chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=[
+                {"role": "system", "content": "Gib die recherchierten Unternehmen ausschließlich als JSON gemäß dem vorgegebenen Schema zurück."},
+                {"role": "user", "content": prompt}
+            ],
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "companies", "strict": True, "schema": COMPANY_SCHEMA}
+            }
+        )
+    content = response.choices[0].message.content or ""
+    try:
+        records = json.loads(content)["companies"]
+    except (ValueError, KeyError, TypeError):
+        logging.warning("Strukturierte Antwort war kein gültiges JSON, verwende Zeilen-Parser")
+        records = None
+
+    if records is None:
+        companies = parse_openai_response(content, call_stats)
+    else:
+        companies = []
+        for record in records:
+            name = str(record.get("name", "")).strip()
+            email = str(record.get("email", "")).strip()
+            if not name or not EMAIL_PATTERN.match(email):
+                call_stats.record(False, json.dumps(record, ensure_ascii=False))
+                continue
+            call_stats.record(True)
             companies.append({
-                'Name': company_name.strip(), 
-                'Website': website.strip(),
-                'Region': region.strip(),
-                'E-Mail': email.strip()
+                'Name': name,
+                'Website': str(record.get("website", "")).strip(),
+                'Region': str(record.get("standort", "")).strip(),
+                'E-Mail': email
             })
+    if stats is not None:
+        stats.merge(call_stats)
+    _store_research(key, content, companies, call_stats.rejected_lines)
     return companies
 
-def update_sheet(companies):
-    # Spalte A (Unternehmensnamen) abrufen
+def stream_companies_via_openai_prompt(prompt, stats=None, force_fresh=False):
+    """
+    Wie get_companies_via_openai_prompt + parse_openai_response, aber gestreamt: jedes Unternehmen
+    wird geliefert, sobald seine Zeile vollständig ist, damit der HubSpot-Abgleich sofort starten kann.
+    Erst eine vollständig empfangene Antwort wird gecacht; Cache-Treffer werden sofort geliefert.
+    """
+    key = research_cache_key("text", prompt)
+    cached = _cached_research(key, stats, force_fresh)
+    if cached is not None:
+        yield from cached
+        return
+    count("openai_requests")
+    # openai.request = bis die Antwort zu laufen beginnt; openai.stream = Warten auf die restlichen Stücke
+    # (ohne die Zeit, in der der Aufrufer die gelieferten Unternehmen verarbeitet)
+    with span("openai.request", stream=True):
+        response = get_openai_client().chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True
+        )
+    stream = iter(response)
+    try:
+        parts = []
+        companies = []
+        buffer = ""
+        waited = 0.0
+        while True:
+            started = time.perf_counter()
+            chunk = next(stream, None)
+            waited += time.perf_counter() - started
+            if chunk is None:
+                break
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            parts.append(delta)
+            buffer += delta
+            *lines, buffer = buffer.split('\n')
+            for line in lines:
+                company = parse_company_line(line, stats)
+                if company:
+                    companies.append(company)
+                    yield company
+        company = parse_company_line(buffer, stats)
+        if company:
+            companies.append(company)
+            yield company
+        response_text = "".join(parts)
+        record("openai.stream", waited, chunks=len(parts))
+        count("openai_bytes", len(response_text.encode("utf-8")))
+        # Verworfene Zeilen für den Cache aus dem vollständigen Text bestimmen (stats kann geteilt sein)
+        rejected = ExtractionStats()
+        parse_openai_response(response_text, rejected)
+        _store_research(key, response_text, companies, rejected.rejected_lines)
+    finally:
+        # Bricht der Aufrufer vorzeitig ab (z.B. genug Teilergebnisse), wird die HTTP-Antwort geschlossen
+        if hasattr(response, "close"):
+            response.close()
+
+def company_key(company):
+    """Dedup-Schlüssel eines recherchierten Unternehmens: normalisierter Name und Domain."""
+    return (
+        normalize_company_name(company.get('Name', '')),
+        company_domain(company.get('Website', ''), company.get('E-Mail', ''))
+    )
+
+def get_existing_company_names():
+    """Alle Unternehmensnamen aus Spalte A (ab Zeile 6)."""
     try:
-        col_a = worksheet.col_values(1)
+        count("sheets_requests")
+        with span("sheets.col_values"):
+            col_a = get_worksheet().col_values(1)
     except Exception:
-        col_a = []
-        
-    existing_names = set(str(name).strip() for name in col_a[5:] if str(name).strip())
-    
-    # --- FIX 1: Exakt die erste freie Zeile ab Zeile 6 finden ---
-    insert_row_idx = 6
-    for i in range(5, len(col_a)):
-        if not str(col_a[i]).strip(): # Wenn die Zelle leer ist
-            insert_row_idx = i + 1
-            break
-    else:
-        # Wenn zwischendrin keine frei ist, hänge es ganz unten an
-        insert_row_idx = max(6, len(col_a) + 1)
-        
-    new_count = 0
+        return []
+    return [str(name).strip() for name in col_a[5:] if str(name).strip()]
+
+def shard_letter_ranges(shards):
+    """Teilt SHARD_LETTERS in `shards` zusammenhängende Bereiche ["A–M", "N–Z"] (mehr Teile als Buchstaben: reihum)."""
+    letters = SHARD_LETTERS
+    if shards >= len(letters):
+        return [letters[i % len(letters)] for i in range(shards)]
+    ranges = []
+    start = 0
+    for i in range(shards):
+        size = len(letters) // shards + (1 if i < len(letters) % shards else 0)
+        part = letters[start:start + size]
+        ranges.append(part[0] if len(part) == 1 else f"{part[0]}–{part[-1]}")
+        start += size
+    return ranges
+
+def shard_prompts(prompt_template, anzahl, exclude_names=()):
+    """
+    Teilt eine große Recherche in Teilrecherchen zu je höchstens SHARD_SIZE Unternehmen auf.
+    Jede bekommt einen eigenen Bereich von Anfangsbuchstaben (shard_letter_ranges), damit sich die
+    Ergebnisse nicht überschneiden, sowie die Liste bereits erfasster Unternehmen als Ausschluss.
+    """
+    shards = -(-anzahl // SHARD_SIZE)
+    counts = [anzahl // shards + (1 if i < anzahl % shards else 0) for i in range(shards)]
+    exclusion = ""
+    if exclude_names:
+        names = list(exclude_names)[-MAX_EXCLUDED_NAMES:]
+        exclusion = "\n\nDiese Unternehmen sind bereits erfasst und dürfen NICHT genannt werden: " + "; ".join(names)
+    prompts = []
+    for i, (shard_count, letters) in enumerate(zip(counts, shard_letter_ranges(shards))):
+        # Namen mit Ziffer am Anfang gehören zur ersten Teilrecherche
+        digits = "einer Ziffer oder " if i == 0 else ""
+        prompts.append(
+            prompt_template.replace("{anzahl}", str(shard_count))
+            + f"\n\nNenne in dieser Recherche nur Unternehmen, deren Name mit {digits}einem Buchstaben aus dem Bereich "
+            + f"{letters} beginnt (Umlaute wie der Grundbuchstabe, Rechtsformen am Anfang nicht mitgezählt)."
+            + exclusion
+        )
+    return prompts
+
+def research_companies_sharded(prompt_template, anzahl, exclude_names=(), research=None, stats=None, force_fresh=False):
+    """
+    Führt die Teilrecherchen aus shard_prompts parallel aus (jeweils gestreamt) und liefert die
+    Unternehmen, sobald sie ankommen. Duplikate über Teilrecherchen hinweg sowie bereits erfasste
+    Unternehmen werden anhand von Name bzw. Domain (normalisiert) verworfen.
+    Jede Teilrecherche wird einzeln im Recherche-Cache abgelegt.
+    """
+    research = research or stream_companies_via_openai_prompt
+    prompts = shard_prompts(prompt_template, anzahl, exclude_names)
+    results = queue.Queue()
+    done = object()
+    # Gesetzt, sobald der Verbraucher genug hat (oder abbricht): laufende Teilrecherchen hören auf
+    stop = threading.Event()
+
+    def run_shard(shard_prompt):
+        try:
+            if stop.is_set():
+                return
+            companies = research(shard_prompt, stats=stats, force_fresh=force_fresh)
+            try:
+                for company in companies:
+                    if stop.is_set():
+                        break
+                    results.put(company)
+            finally:
+                # Ein abgebrochener Stream wird sofort geschlossen (und nicht gecacht)
+                if hasattr(companies, "close"):
+                    companies.close()
+        except Exception as e:
+            logging.error(f"Teilrecherche fehlgeschlagen: {e}")
+        finally:
+            results.put(done)
+
+    pool = ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_SHARDS, len(prompts)))
+    for shard_prompt in prompts:
+        pool.submit(bind(run_shard), shard_prompt)
+
+    seen_names = {normalize_company_name(name) for name in exclude_names}
+    seen_domains = set()
+    remaining = len(prompts)
+    yielded = 0
+    try:
+        while remaining and yielded < anzahl:
+            company = results.get()
+            if company is done:
+                remaining -= 1
+                continue
+            name_key, domain_key = company_key(company)
+            if not name_key or name_key in seen_names or (domain_key and domain_key in seen_domains):
+                continue
+            seen_names.add(name_key)
+            if domain_key:
+                seen_domains.add(domain_key)
+            yielded += 1
+            yield company
+    finally:
+        # Noch nicht gestartete Teilrecherchen verwerfen, laufende beim nächsten Stück beenden
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def update_sheet(companies, rows=None):
+    """
+    Trägt neue Unternehmen ins Sheet ein und gibt die übersprungenen Namen zurück. Dubletten werden
+    über normalisierten Namen, E-Mail und Domain erkannt (auch innerhalb von companies); neue Zeilen
+    gehen nur in freie Zeilen und werden in einem batch_update geschrieben.
+    Mit rows (dict) wird dort für jedes eingetragene Unternehmen {Position in companies: Sheet-Zeile} vermerkt.
+    """
+    worksheet = get_worksheet()
+    # Ohne Dublettenprüfung wird nichts geschrieben (Fehler beim Lesen werden nicht abgefangen)
+    count("sheets_requests")
+    with span("sheets.read_dedup_index"):
+        index = CompanyDedupIndex.from_worksheet(worksheet)
+
     skipped_names = []
     rows_to_insert = [] # Wir sammeln alle neuen Zeilen hier
-    
-    for company in companies:
+    inserted_positions = []
+
+    for i, company in enumerate(companies):
         company_name = company.get('Name', '').strip()
         email = company.get('E-Mail', '').strip()
         region = company.get('Region', '').strip()
@@ -109,26 +482,38 @@ def update_sheet(companies):
         letzter_kontakt_orga = company.get('Letzter Kontakt Organisation', '').strip()
         name = company.get('Name Kontaktperson', '').strip()
         last_contact_person = company.get('Letzter Kontakt Person', '').strip()
-        
-        if not company_name or company_name in existing_names:
+
+        if not company_name or index.find(company_name, email, website):
             skipped_names.append(company_name)
             continue
-            
+
         new_row = [
-            company_name, name, email, '', '', '', 
+            company_name, name, email, '', '', '',
             0, 'FALSE', 'FALSE', 'FALSE', 'FALSE', 'FALSE', 0,
             website, region, gruppe, mitglied, last_contact_person, letzter_kontakt_orga
         ]
-        
+
         rows_to_insert.append(new_row)
-        existing_names.add(company_name)
-        new_count += 1
-        
-    # --- FIX 1b: Alle gesammelten Zeilen exakt an der Lücke einfügen ---
-    if rows_to_insert:
-        worksheet.update(range_name=f"A{insert_row_idx}", values=rows_to_insert)
-        print(f"{new_count} Unternehmen ab Zeile {insert_row_idx} hinzugefügt.")
-    else:
+        inserted_positions.append(i)
+        index.add(company_name, email, website)
+
+    if not rows_to_insert:
         print("Keine neuen Unternehmen hinzugefügt.")
-        
-    return skipped_names
\ No newline at end of file
+        return skipped_names
+
+    # Jede Lücke nur so weit füllen, wie sie frei ist; zusammenhängende Zeilen als ein Bereich
+    target_rows = index.free_rows(len(rows_to_insert))
+    last_col = rowcol_to_a1(1, len(rows_to_insert[0])).rstrip("0123456789")
+    data = []
+    position = 0
+    for first, last in row_runs(target_rows):
+        run_length = last - first + 1
+        data.append({"range": f"A{first}:{last_col}{last}", "values": rows_to_insert[position:position + run_length]})
+        position += run_length
+    count("sheets_requests")
+    with span("sheets.batch_update", rows=len(rows_to_insert)):
+        worksheet.batch_update(data)
+    if rows is not None:
+        rows.update(zip(inserted_positions, target_rows))
+    print(f"{len(rows_to_insert)} Unternehmen in Zeilen {', '.join(f'{a}-{b}' if a != b else str(a) for a, b in row_runs(target_rows))} hinzugefügt.")
+    return skipped_names
@@ -1,19 +1,91 @@
-import requests
-import streamlit as st
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import difflib
 import dateutil.parser
+from hubspot_client import get_client
+from hubspot_index import get_company_index, get_contact_index
+from instrumentation import bind, span
+from lookup_cache import MISSING, LookupCache
+from name_matching import SCORE_TIE_TOLERANCE, CompanyMatcher, distinctive_token
+from settings import get_secret
+
+# Cache für Company-/Kontakt-Abfragen (über alle Streamlit-Sessions des Prozesses geteilt)
+CACHE_FILE = "cache/hubspot_lookups.sqlite3"
+CACHE_MAX_SIZE = 5000
+CACHE_TTL_SECONDS = 6 * 3600
+_lookup_cache = None
+_lookup_cache_lock = threading.Lock()
+
+# Parallele HubSpot-Abfragen; Rate-Limits und Verbindungspool liegen im gemeinsamen HubSpotClient
+MAX_WORKERS = 8
+_company_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="hubspot-company")
+_contact_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="hubspot-contact")
+
+def _format_contact_date(value):
+    """HubSpot liefert Kontaktdaten als Millisekunden-Zeitstempel; diese werden als YYYY-MM-DD formatiert."""
+    if value:
+        try:
+            value = int(value)
+            value = datetime.utcfromtimestamp(value / 1000).strftime("%Y-%m-%d")
+        except Exception:
+            pass
+    return value
+
+def _contact_match(props):
+    name = f"{props.get('firstname') or ''} {props.get('lastname') or ''}".strip()
+    email_addr = props.get("email", "") or ""
+    last_contacted = _format_contact_date(props.get("last_contacted") or props.get("lastmodifieddate"))
+    return {"name": name, "email": email_addr, "date": last_contacted}
+
+def get_lookup_cache():
+    """Prozessweiter Cache für HubSpot-Abfragen (optional in HUBSPOT_CACHE_PATH persistiert)."""
+    global _lookup_cache
+    with _lookup_cache_lock:
+        if _lookup_cache is None:
+            _lookup_cache = LookupCache(
+                max_size=int(get_secret("HUBSPOT_CACHE_SIZE", CACHE_MAX_SIZE)),
+                ttl_seconds=float(get_secret("HUBSPOT_CACHE_TTL_SECONDS", CACHE_TTL_SECONDS)),
+                path=get_secret("HUBSPOT_CACHE_PATH", CACHE_FILE) or None,
+                name="hubspot"
+            )
+        return _lookup_cache
+
+def invalidate_hubspot_cache(company_name=None, email=None):
+    """
+    Verwirft gecachte HubSpot-Ergebnisse, z.B. nachdem jemand in HubSpot etwas geändert hat.
+    Ohne Argumente wird der gesamte Cache geleert.
+    """
+    cache = get_lookup_cache()
+    if company_name is None and email is None:
+        cache.invalidate()
+        return
+    if company_name:
+        cache.invalidate(f"company:{company_name}")
+    if email:
+        cache.invalidate_prefix(f"contact:{email}|")
 
 def get_last_hubspot_contact(email=None, company_name=None):
     """
     Prüft, ob ein Kontakt mit dieser E-Mail ODER einem zur Firma passenden E-Mail-Domain in HubSpot existiert.
     Gibt (Name, E-Mail, Datum letzter Kontakt) zurück oder None.
     """
+    cache = get_lookup_cache()
+    key = f"contact:{email or ''}|{company_name or ''}"
+    cached = cache.get(key)
+    if cached is not MISSING:
+        return cached
+    with span("hubspot.contact_lookup"):
+        result, complete = _find_hubspot_contact(email, company_name)
+    # Nur vollständige Abfragen cachen, nicht solche mit HubSpot-Fehlern
+    if complete:
+        cache.set(key, result)
+    return result
+
+def _find_hubspot_contact(email, company_name):
     url = "https://api.hubapi.com/crm/v3/objects/contacts/search"
-    headers = {
-        "Authorization": f"Bearer {st.secrets['HUBSPOT_TOKEN']}",
-        "Content-Type": "application/json"
-    }
+    client = get_client()
+    complete = True
 
     # 1. Suche nach exakter E-Mail
     if email:
@@ -27,138 +99,238 @@ def get_last_hubspot_contact(email=None, company_name=None):
             }],
             "properties": ["firstname", "lastname", "email", "lastmodifieddate", "last_contacted"]
         }
-        response = requests.post(url, headers=headers, json=data)
+        response = client.post(url, site="contact_by_email", json=data)
         if response.status_code == 200:
             results = response.json().get("results", [])
             if results:
-                props = results[0].get("properties", {})
-                name = f"{props.get('firstname', '')} {props.get('lastname', '')}".strip()
-                email_addr = props.get("email", "")
-                last_contacted = props.get("last_contacted") or props.get("lastmodifieddate")
-                if last_contacted:
-                    try:
-                        last_contacted = int(last_contacted)
-                        last_contacted = datetime.utcfromtimestamp(last_contacted / 1000).strftime("%Y-%m-%d")
-                    except Exception:
-                        pass
-                return {"name": name, "email": email_addr, "date": last_contacted}
+                return _contact_match(results[0].get("properties", {})), True
+        else:
+            complete = False
     
     # 2. Suche nach Kontakten, deren E-Mail-Domain zum Unternehmen passt
     if company_name:
-        # Extrahiere einen "Kern" des Firmennamens für die Suche (z.B. "PwC" aus "PwC Österreich")
-        company_token = company_name.split()[0].lower()
-        # Suche alle Kontakte, filtere nach Domain
-        # Achtung: HubSpot erlaubt keine Wildcard-Suche, daher paginiere alle Kontakte (max. 100 pro Seite)
-        url_all = "https://api.hubapi.com/crm/v3/objects/contacts"
-        after = None
+        # Aussagekräftigstes Wort des Firmennamens (ohne Rechtsform und Füllwörter wie "Die")
+        company_token = distinctive_token(company_name)
+        # HubSpot erlaubt keine Wildcard-Suche, daher wird ein lokaler Index aller Kontakte
+        # (nach Domain) gepflegt, der nur inkrementell nachgeladen wird
+        index = get_contact_index()
+        with span("hubspot.contact_index_refresh"):
+            loaded = index.refresh(client)
+        # Ohne geladenen Index ist "kein Treffer" nicht aussagekräftig und darf nicht gecacht werden
+        if not loaded:
+            complete = False
         best_match = None
-        while True:
-            params = {
-                "limit": 100,
-                "properties": "firstname,lastname,email,lastmodifieddate,last_contacted"
-            }
-            if after:
-                params["after"] = after
-            resp = requests.get(url_all, headers=headers, params=params)
-            if resp.status_code != 200:
-                break
-            data = resp.json()
-            contacts = data.get("results", [])
-            for c in contacts:
-                props = c.get("properties", {})
-                email_addr = props.get("email", "") or ""
-                if company_token in email_addr.lower():
-                    name = f"{props.get('firstname', '')} {props.get('lastname', '')}".strip()
-                    last_contacted = props.get("last_contacted") or props.get("lastmodifieddate")
-                    if last_contacted:
-                        try:
-                            last_contacted = int(last_contacted)
-                            last_contacted = datetime.utcfromtimestamp(last_contacted / 1000).strftime("%Y-%m-%d")
-                        except Exception:
-                            pass
-                    match = {"name": name, "email": email_addr, "date": last_contacted}
-                    # Nimm den ersten besten Treffer (oder verbessere das Matching nach Bedarf)
-                    if not best_match or (match["date"] and match["date"] > best_match.get("date", "")):
-                        best_match = match
-            after = data.get("paging", {}).get("next", {}).get("after")
-            if not after:
-                break
+        for props in index.find_by_company_token(company_token):
+            match = _contact_match(props)
+            # Nimm den Treffer mit dem neuesten Kontaktdatum
+            if not best_match or (match["date"] and match["date"] > (best_match.get("date") or "")):
+                best_match = match
         if best_match:
-            return best_match
+            return best_match, True
 
-    return None
+    return None, complete
 
-def get_last_company_activity(company_name):
+COMPANY_SEARCH_URL = "https://api.hubapi.com/crm/v3/objects/companies/search"
+COMPANY_PROPERTIES = ["name", "last_activity_date", "lastmodifieddate", "createdate"]
+
+# HubSpot-Suchlimits: max. 5 filterGroups (ODER-verknüpft) pro Anfrage, max. 100 Ergebnisse pro Seite
+MAX_FILTER_GROUPS = 5
+SEARCH_PAGE_LIMIT = 100
+MAX_BULK_PAGES = 10
+
+def _activity_date(props):
+    for key in ["last_activity_date", "lastmodifieddate", "hs_lastmodifieddate", "createdate"]:
+        if props.get(key):
+            try:
+                return dateutil.parser.parse(props[key])
+            except Exception:
+                pass
+    return dateutil.parser.parse("1900-01-01")
+
+def _best_company(company_name, scored):
     """
-    Sucht im HubSpot-Companies-Endpoint nach dem Unternehmensnamen (unscharf) und gibt den besten Treffer zurück.
-    Wählt zuerst den längsten Namensmatch, dann das neueste Aktivitätsdatum.
+    Wählt aus [(Company-Properties, Namenswert), ...] die Treffer mit (fast) dem höchsten Wert
+    und daraus den mit dem neuesten Aktivitätsdatum.
     """
-    url = "https://api.hubapi.com/crm/v3/objects/companies/search"
-    headers = {
-        "Authorization": f"Bearer {st.secrets['HUBSPOT_TOKEN']}",
-        "Content-Type": "application/json"
+    if not scored:
+        return None
+    top_score = max(score for _, score in scored)
+    best = max((props for props, score in scored if score >= top_score - SCORE_TIE_TOLERANCE), key=_activity_date)
+    best_name = best.get("name", "")
+    # Fallback-Logik für Datum
+    last_activity = (
+        best.get("last_activity_date")
+        or best.get("lastmodifieddate")
+        or best.get("hs_lastmodifieddate")
+        or best.get("createdate")
+        or ""
+    )
+    return {
+        "name": best_name,
+        "last_activity_date": last_activity if last_activity else "Kein Datum gefunden"
     }
-    main_token = company_name.split()[0]
+
+def _select_best_company(company_name, results):
+    """Bewertet die Treffer einer HubSpot-Suche mit dem Namensabgleich (name_matching) und wählt den besten."""
+    if not results:
+        return None
+    props = [r.get("properties", {}) for r in results]
+    matches = CompanyMatcher(p.get("name") or "" for p in props).match(company_name, limit=len(props))
+    return _best_company(company_name, [(props[i], score) for i, score in matches])
+
+def get_last_company_activity(company_name):
+    """
+    Sucht das Unternehmen unscharf unter den HubSpot-Companies und gibt den besten Treffer zurück
+    (bester Namensabgleich, bei Gleichstand das neueste Aktivitätsdatum).
+    """
+    return get_last_company_activity_bulk([company_name])[0]
+
+def _search_companies_by_tokens(tokens, client):
+    """
+    Eine Suche mit bis zu MAX_FILTER_GROUPS ODER-verknüpften CONTAINS_TOKEN-Filtern (inkl. Paginierung).
+    Gibt None zurück, wenn HubSpot die Anfrage ablehnt.
+    """
     data = {
-        "filterGroups": [{
-            "filters": [{
-                "propertyName": "name",
-                "operator": "CONTAINS_TOKEN",
-                "value": main_token
-            }]
-        }],
-        "properties": ["name", "last_activity_date", "lastmodifieddate", "createdate"]
+        "filterGroups": [
+            {"filters": [{"propertyName": "name", "operator": "CONTAINS_TOKEN", "value": token}]}
+            for token in tokens
+        ],
+        "properties": COMPANY_PROPERTIES,
+        "limit": SEARCH_PAGE_LIMIT
     }
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
-        results = response.json().get("results", [])
-        if not results:
-            return None
-
-        # 1. Finde alle mit maximalem Namensmatch
-        def match_len(r):
-            hub_name = r["properties"].get("name", "").lower()
-            tokens = set(company_name.lower().split())
-            return len(tokens & set(hub_name.split()))
-        max_match = max(match_len(r) for r in results)
-        best_matches = [r for r in results if match_len(r) == max_match]
-
-        # 2. Wähle aus diesen das mit dem neuesten Datum
-        def get_best_date(r):
-            props = r["properties"]
-            for key in ["last_activity_date", "lastmodifieddate", "createdate"]:
-                if props.get(key):
-                    try:
-                        return dateutil.parser.parse(props[key])
-                    except Exception:
-                        pass
-            return dateutil.parser.parse("1900-01-01")
-        best = max(best_matches, key=get_best_date)
-        best_name = best["properties"].get("name", "")
-        # Fallback-Logik für Datum
-        last_activity = (
-            best["properties"].get("last_activity_date")
-            or best["properties"].get("lastmodifieddate")
-            or best["properties"].get("createdate")
-            or ""
-        )
-        print(f"OpenAI: {company_name} | HubSpot: {best_name} | last_activity: {last_activity}")
-        return {
-            "name": best_name,
-            "last_activity_date": last_activity if last_activity else "Kein Datum gefunden"
-        }
-    return None
+    results = []
+    for _ in range(MAX_BULK_PAGES):
+        response = client.post(COMPANY_SEARCH_URL, site="company_search_bulk", json=data)
+        if response.status_code != 200:
+            return results or None
+        payload = response.json()
+        results.extend(payload.get("results", []))
+        after = payload.get("paging", {}).get("next", {}).get("after")
+        if not after:
+            break
+        data["after"] = after
+    return results
+
+def _match_via_search(names, client):
+    """
+    Rückfall ohne Company-Index: die aussagekräftigsten Tokens der Namen werden zu ODER-verknüpften
+    filterGroups gebündelt (MAX_FILTER_GROUPS pro Anfrage), die Treffer danach lokal bewertet.
+    Gibt {Name: Treffer oder None} nur für Namen zurück, deren Suche geklappt hat.
+    """
+    tokens = {name: distinctive_token(name) for name in names}
+    unique_tokens = list(dict.fromkeys(t for t in tokens.values() if t))
+
+    results_by_token = {}
+    for i in range(0, len(unique_tokens), MAX_FILTER_GROUPS):
+        chunk = unique_tokens[i:i + MAX_FILTER_GROUPS]
+        results = _search_companies_by_tokens(chunk, client)
+        if results is None:
+            continue
+        for token in chunk:
+            results_by_token[token] = results
+
+    found = {}
+    for name, token in tokens.items():
+        if not token:
+            found[name] = None
+        elif token in results_by_token:
+            found[name] = _select_best_company(name, results_by_token[token])
+    return found
+
+def get_last_company_activity_bulk(company_names):
+    """
+    Wie get_last_company_activity, aber für viele Namen auf einmal. Abgeglichen wird gegen den lokalen
+    Company-Index (alle Namen in einem Durchgang); ist er nicht verfügbar, per gebündelter HubSpot-Suche.
+    Gibt eine Liste in der Reihenfolge von company_names zurück (Treffer-Dict oder None).
+    """
+    cache = get_lookup_cache()
+    found = {}
+    to_search = []
+    for name in company_names:
+        cached = cache.get(f"company:{name}") if name else None
+        if cached is MISSING:
+            to_search.append(name)
+        else:
+            found[name] = cached
+    to_search = list(dict.fromkeys(to_search))
+    if not to_search:
+        return [found.get(name) for name in company_names]
+
+    client = get_client()
+    index = get_company_index()
+    with span("hubspot.company_index_refresh"):
+        index_ready = index.refresh(client)
+    if index_ready:
+        with span("hubspot.company_matching", names=len(to_search)):
+            matched = {name: _best_company(name, scored) for name, scored in zip(to_search, index.match_many(to_search))}
+    else:
+        # Namen, deren Suche fehlgeschlagen ist, fehlen in matched und bleiben ungecacht (None)
+        with span("hubspot.company_search_fallback", names=len(to_search)):
+            matched = _match_via_search(to_search, client)
+
+    for name, best in matched.items():
+        found[name] = best
+        cache.set(f"company:{name}", best)
+
+    return [found.get(name) for name in company_names]
+
+def _lookup_contact(company):
+    return get_last_hubspot_contact(email=company.get("E-Mail", ""), company_name=company.get("Name", ""))
+
+def _enrich_batch(batch, search_contacts, only_new):
+    """Gleicht einen Batch (eine gebündelte Company-Suche) ab und sucht die Kontakte parallel."""
+    hub_orgs = get_last_company_activity_bulk([company["Name"] for company in batch])
+
+    kept = []
+    for company, hub_org in zip(batch, hub_orgs):
+        if only_new and hub_org is not None:
+            continue
+        company["Letzter Kontakt Organisation"] = hub_org["last_activity_date"] if hub_org else "Keinen Kontakt gefunden"
+        kept.append(company)
+
+    if search_contacts:
+        for company, hub_contact in zip(kept, _contact_pool.map(bind(_lookup_contact), kept)):
+            if hub_contact:
+                company["Name Kontaktperson"] = hub_contact.get("name", company["Name"])
+                company["E-Mail"] = hub_contact.get("email", company["E-Mail"])
+                company["Letzter Kontakt Person"] = hub_contact.get("date", "")
+            else:
+                company["Letzter Kontakt Person"] = "Keine Kontaktperson gefunden"
+    else:
+        for company in kept:
+            company["Letzter Kontakt Person"] = ""
+    return kept
+
+def enrich_companies_iter(companies, search_contacts=False, only_new=False):
+    """
+    Reichert Unternehmen nebenläufig mit HubSpot-Daten an ('Letzter Kontakt Organisation' und optional
+    Kontaktperson). Nimmt auch Generatoren entgegen und liefert die Ergebnisse in Eingabereihenfolge,
+    sobald sie fertig sind. Mit only_new werden bereits in HubSpot vorhandene Unternehmen übersprungen.
+    """
+    pending = deque()
+    batch = []
+    for company in companies:
+        batch.append(company)
+        if len(batch) >= MAX_FILTER_GROUPS:
+            pending.append(_company_pool.submit(bind(_enrich_batch), batch, search_contacts, only_new))
+            batch = []
+        while pending and pending[0].done():
+            yield from pending.popleft().result()
+    if batch:
+        pending.append(_company_pool.submit(bind(_enrich_batch), batch, search_contacts, only_new))
+    while pending:
+        yield from pending.popleft().result()
+
+def enrich_companies(companies, search_contacts=False, only_new=False):
+    return list(enrich_companies_iter(companies, search_contacts=search_contacts, only_new=only_new))
 
 def annotate_companies_with_hubspot(companies):
     """
     Ergänzt jedes Unternehmen mit dem letzten HubSpot-Kontakt in 'Letzter Kontakt Organisation' (Spalte L).
     """
-    for company in companies:
-        email = company.get("E-Mail", "")
-        name = company.get("Name", "")
-        last_contact = get_last_hubspot_contact(email=email, company_name=name)
+    for company, last_contact in zip(companies, _contact_pool.map(bind(_lookup_contact), companies)):
         if last_contact:
             company["Letzter Kontakt Organisation"] = last_contact.get("date", "Keinen Kontakt gefunden")
         else:
             company["Letzter Kontakt Organisation"] = "Keinen Kontakt gefunden"
-    return companies
\ No newline at end of file
+    return companies
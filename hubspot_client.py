@@ -0,0 +1,193 @@
+import threading
+import time
+from datetime import date
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from instrumentation import count, span
+from settings import get_secret
+
+# HubSpot-Limits für Private Apps: 100 Anfragen / 10 Sekunden, die Search-API zusätzlich
+# 5 Anfragen / Sekunde, dazu ein Tageskontingent. Wir bleiben knapp darunter.
+RATE_LIMIT_PER_SECOND = 9
+SEARCH_RATE_LIMIT_PER_SECOND = 4
+DAILY_REQUEST_LIMIT = 250000
+
+MAX_RETRIES = 5
+DEFAULT_RETRY_AFTER_SECONDS = 1.0
+
+# Timeout pro Anfrage in Sekunden und Größe des Verbindungspools (>= parallele Threads)
+DEFAULT_TIMEOUT = 30.0
+POOL_SIZE = 16
+
+
+class HubSpotQuotaExceeded(RuntimeError):
+    """Das Tageskontingent an HubSpot-Anfragen ist aufgebraucht."""
+
+
+class TokenBucket:
+    """
+    Thread-sicherer Token-Bucket: füllt sich mit `rate` Tokens pro Sekunde bis `capacity`.
+    acquire() blockiert, bis ein Token verfügbar ist.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Leert den Bucket, sodass frühestens nach `seconds` wieder angefragt wird (z.B. nach 429)."""
+        with self._lock:
+            self._tokens = min(self._tokens, 1 - seconds * self.rate)
+            self._updated = time.monotonic()
+
+
+class DailyQuota:
+    """Zählt Anfragen pro Kalendertag und bricht ab, sobald das Limit erreicht ist."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._day = date.today()
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def consume(self):
+        with self._lock:
+            today = date.today()
+            if today != self._day:
+                self._day, self._count = today, 0
+            if self._count >= self.limit:
+                raise HubSpotQuotaExceeded(f"HubSpot-Tageslimit von {self.limit} Anfragen erreicht.")
+            self._count += 1
+
+
+def _retry_after_seconds(response):
+    try:
+        return float(response.headers.get("Retry-After", DEFAULT_RETRY_AFTER_SECONDS))
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER_SECONDS
+
+
+class HubSpotClient:
+    """
+    Gemeinsamer HubSpot-Client für alle Aufrufe: eine gepoolte requests.Session mit Keep-Alive
+    und gzip, konfigurierbaren Timeouts und Retries (5xx/Verbindungsfehler) sowie den
+    prozessweiten Rate-Limits. Zählt Anfragen und Bytes pro Aufrufstelle (`site`).
+    """
+
+    def __init__(self, token, timeout=DEFAULT_TIMEOUT, max_retries=MAX_RETRIES, pool_size=POOL_SIZE):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip, deflate"
+        })
+        # urllib3 wiederholt nur Verbindungsfehler und 5xx und gibt danach die letzte Antwort zurück
+        # (kein RetryError); 429 behandelt ausschließlich request() mit Rate-Limiter und Tageskontingent.
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=0.5,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=["GET", "POST"],
+            respect_retry_after_header=False,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._rate_limiter = TokenBucket(RATE_LIMIT_PER_SECOND)
+        self._search_rate_limiter = TokenBucket(SEARCH_RATE_LIMIT_PER_SECOND)
+        self._daily_quota = DailyQuota(DAILY_REQUEST_LIMIT)
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def _record(self, site, response=None, retried=False):
+        # Retries, die urllib3 schon im Adapter erledigt hat (Verbindungsfehler, 5xx)
+        transport_retries = 0
+        if response is not None and getattr(response.raw, "retries", None) is not None:
+            transport_retries = len(response.raw.retries.history)
+        retries = transport_retries + (1 if retried else 0)
+        size = len(response.content or b"") if response is not None else 0
+        with self._stats_lock:
+            entry = self._stats.setdefault(site, {"requests": 0, "bytes": 0, "retries": 0})
+            entry["retries"] += retries
+            if response is not None:
+                entry["requests"] += 1
+                entry["bytes"] += size
+        # Dieselben Zähler auch für den laufenden Durchlauf (Performance-Anzeige)
+        if retries:
+            count("hubspot_retries", retries)
+        if response is not None:
+            count("hubspot_requests")
+            count("hubspot_bytes", size)
+
+    def stats(self):
+        """Momentaufnahme der Zähler: {site: {"requests", "bytes", "retries"}}."""
+        with self._stats_lock:
+            return {site: dict(entry) for site, entry in self._stats.items()}
+
+    def request(self, method, url, site="other", **kwargs):
+        """
+        Führt eine HubSpot-Anfrage aus und hält dabei die Rate-Limits ein (thread-sicher).
+        Bei 429 wird entsprechend dem Retry-After-Header gewartet und erneut versucht.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        is_search = url.endswith("/search")
+        for attempt in range(self.max_retries + 1):
+            self._daily_quota.consume()
+            waiting_since = time.perf_counter()
+            self._rate_limiter.acquire()
+            if is_search:
+                self._search_rate_limiter.acquire()
+            count("hubspot_rate_limit_wait_s", time.perf_counter() - waiting_since)
+            with span(f"hubspot.{site}"):
+                response = self.session.request(method, url, **kwargs)
+            self._record(site, response)
+            if response.status_code != 429 or attempt == self.max_retries:
+                return response
+            self._record(site, retried=True)
+            wait = _retry_after_seconds(response)
+            (self._search_rate_limiter if is_search else self._rate_limiter).pause(wait)
+
+    def get(self, url, site="other", **kwargs):
+        return self.request("GET", url, site=site, **kwargs)
+
+    def post(self, url, site="other", **kwargs):
+        return self.request("POST", url, site=site, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Prozessweiter HubSpot-Client (eine Session für alle Streamlit-Sessions und Threads)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HubSpotClient(
+                get_secret("HUBSPOT_TOKEN"),
+                timeout=float(get_secret("HUBSPOT_TIMEOUT_SECONDS", DEFAULT_TIMEOUT)),
+                max_retries=int(get_secret("HUBSPOT_MAX_RETRIES", MAX_RETRIES))
+            )
+        return _client
@@ -0,0 +1,376 @@
+import json
+import os
+import re
+import threading
+import time
+
+import dateutil.parser
+
+from name_matching import MIN_MATCH_SCORE, CompanyMatcher
+from normalize import fold
+
+INDEX_DIR = "cache"
+CONTACT_INDEX_FILE = os.path.join(INDEX_DIR, "hubspot_contacts.json")
+COMPANY_INDEX_FILE = os.path.join(INDEX_DIR, "hubspot_companies.json")
+
+CONTACTS_URL = "https://api.hubapi.com/crm/v3/objects/contacts"
+CONTACTS_SEARCH_URL = "https://api.hubapi.com/crm/v3/objects/contacts/search"
+CONTACT_PROPERTIES = ["firstname", "lastname", "email", "lastmodifieddate", "last_contacted"]
+
+COMPANIES_URL = "https://api.hubapi.com/crm/v3/objects/companies"
+COMPANIES_SEARCH_URL = "https://api.hubapi.com/crm/v3/objects/companies/search"
+COMPANY_INDEX_PROPERTIES = ["name", "domain", "last_activity_date", "hs_lastmodifieddate", "createdate"]
+
+# Wie oft (Sekunden) inkrementell nachgeladen bzw. komplett neu aufgebaut wird.
+# Der Komplettaufbau ist nötig, weil die Suche gelöschte Kontakte nicht meldet.
+REFRESH_INTERVAL_SECONDS = 300
+FULL_REBUILD_INTERVAL_SECONDS = 7 * 24 * 3600
+
+# Die HubSpot-Suche liefert pro Anfrage höchstens 10.000 Treffer
+SEARCH_RESULT_LIMIT = 10000
+
+# Domain-Bestandteile ohne Aussagekraft über das Unternehmen
+GENERIC_DOMAIN_LABELS = {"www", "mail", "co", "or", "gv", "ac", "com", "net", "org"}
+
+
+def _to_millis(value):
+    """Wandelt einen HubSpot-Zeitstempel (Millisekunden oder ISO-String) in Millisekunden um."""
+    if not value:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return int(dateutil.parser.parse(value).timestamp() * 1000)
+    except Exception:
+        return None
+
+
+def domain_tokens(domain):
+    """
+    Zerlegt eine E-Mail-Domain in normalisierte Namens-Tokens,
+    z.B. "beispiel-technik.co.at" -> {"beispiel", "technik", "beispieltechnik"}.
+    """
+    labels = domain.lower().split(".")
+    if len(labels) > 1:
+        labels = labels[:-1]
+    labels = [label for label in labels if label not in GENERIC_DOMAIN_LABELS]
+    tokens = set()
+    for label in labels:
+        parts = [p for p in re.split(r"[^a-z0-9]+", label) if p]
+        tokens.update(parts)
+        if len(parts) > 1:
+            tokens.add("".join(parts))
+    return tokens
+
+
+def company_token_variants(token):
+    """Schreibvarianten eines Firmen-Tokens, wie sie in Domains vorkommen (ü -> ue bzw. u)."""
+    token = token.lower()
+    variants = {token, fold(token)}
+    variants.add(token.replace("ä", "a").replace("ö", "o").replace("ü", "u").replace("ß", "ss"))
+    return {re.sub(r"[^a-z0-9-]", "", v) for v in variants} - {""}
+
+
+class _ObjectIndex:
+    """
+    Lokaler, auf Platte gespeicherter Index aller HubSpot-Objekte eines Typs (Kontakte, Companies).
+    Lädt beim ersten Mal alles über das Listing-Endpoint und danach nur noch per Suche die seit dem
+    letzten Stand geänderten Objekte. Unterklassen legen URLs, Properties und die Nachschlage-Tabellen fest.
+    """
+
+    LIST_URL = None
+    SEARCH_URL = None
+    PROPERTIES = []
+    MODIFIED_PROPERTY = "lastmodifieddate"
+    STORE_KEY = "objects"
+    SITE = "index"
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._objects = {}
+        self._reset_lookups()
+        self._synced_at = None
+        self._built_at = 0.0
+        self._checked_at = 0.0
+        self._load()
+
+    def __len__(self):
+        return len(self._objects)
+
+    # --- Persistenz ---
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._synced_at = data.get("synced_at")
+        self._built_at = data.get("built_at", 0.0)
+        for object_id, props in data.get(self.STORE_KEY, {}).items():
+            self._add(object_id, props)
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "synced_at": self._synced_at,
+                "built_at": self._built_at,
+                self.STORE_KEY: self._objects
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    # --- Indexpflege ---
+
+    def _reset_lookups(self):
+        """Leert die Nachschlage-Tabellen der Unterklasse."""
+
+    def _lookup_state(self):
+        """Nachschlage-Tabellen der Unterklasse (für das Zurücksetzen nach einem abgebrochenen Aufbau)."""
+        return ()
+
+    def _restore_lookups(self, state):
+        pass
+
+    def _index(self, object_id, props):
+        pass
+
+    def _unindex(self, object_id, props):
+        pass
+
+    def _add(self, object_id, props):
+        self._remove(object_id)
+        self._objects[object_id] = props
+        self._index(object_id, props)
+
+    def _remove(self, object_id):
+        old = self._objects.pop(object_id, None)
+        if old:
+            self._unindex(object_id, old)
+
+    def _ingest(self, results):
+        for obj in results:
+            props = {k: obj.get("properties", {}).get(k) for k in self.PROPERTIES}
+            self._add(str(obj.get("id")), props)
+            modified = _to_millis(props.get(self.MODIFIED_PROPERTY))
+            if modified and (self._synced_at is None or modified > self._synced_at):
+                self._synced_at = modified
+
+    def _full_build(self, client):
+        """Lädt alle Objekte über das Listing-Endpoint (100 pro Seite)."""
+        previous = (self._objects, self._synced_at, self._lookup_state())
+        self._objects = {}
+        self._reset_lookups()
+        self._synced_at = None
+        after = None
+        while True:
+            params = {"limit": 100, "properties": ",".join(self.PROPERTIES)}
+            if after:
+                params["after"] = after
+            resp = client.get(self.LIST_URL, site=f"{self.SITE}_build", params=params)
+            if resp.status_code != 200:
+                # Abgebrochener Aufbau: alten Stand behalten
+                self._objects, self._synced_at, lookups = previous
+                self._restore_lookups(lookups)
+                return False
+            data = resp.json()
+            self._ingest(data.get("results", []))
+            after = data.get("paging", {}).get("next", {}).get("after")
+            if not after:
+                break
+        self._built_at = time.time()
+        return True
+
+    def _incremental_sync(self, client):
+        """Lädt nur Objekte nach, deren Änderungsdatum neuer als der letzte Stand ist."""
+        after = None
+        while True:
+            data = {
+                "filterGroups": [{
+                    "filters": [{
+                        "propertyName": self.MODIFIED_PROPERTY,
+                        "operator": "GT",
+                        "value": str(self._synced_at)
+                    }]
+                }],
+                "sorts": [{"propertyName": self.MODIFIED_PROPERTY, "direction": "ASCENDING"}],
+                "properties": self.PROPERTIES,
+                "limit": 100
+            }
+            if after:
+                data["after"] = after
+            resp = client.post(self.SEARCH_URL, site=f"{self.SITE}_sync", json=data)
+            if resp.status_code != 200:
+                return False
+            payload = resp.json()
+            self._ingest(payload.get("results", []))
+            after = payload.get("paging", {}).get("next", {}).get("after")
+            if not after:
+                break
+            # Über 10.000 Treffer hinaus kann nicht paginiert werden:
+            # neu ab dem zuletzt gesehenen Änderungsdatum suchen
+            if int(after) >= SEARCH_RESULT_LIMIT:
+                after = None
+        return True
+
+    def refresh(self, client, force=False):
+        """
+        Aktualisiert den Index: beim ersten Mal (bzw. nach FULL_REBUILD_INTERVAL_SECONDS) komplett,
+        sonst inkrementell. Ohne force höchstens alle REFRESH_INTERVAL_SECONDS.
+        Gibt False zurück, wenn der Index noch nie vollständig geladen werden konnte.
+        """
+        with self._lock:
+            now = time.time()
+            if force or now - self._checked_at >= REFRESH_INTERVAL_SECONDS:
+                if self._synced_at is None or now - self._built_at > FULL_REBUILD_INTERVAL_SECONDS:
+                    ok = self._full_build(client)
+                else:
+                    ok = self._incremental_sync(client)
+                self._checked_at = now
+                if ok:
+                    self._save()
+            return self._built_at > 0
+
+
+class ContactIndex(_ObjectIndex):
+    """
+    Index aller HubSpot-Kontakte. Schlüssel sind die E-Mail-Domain sowie die normalisierten
+    Namens-Tokens der Domain, damit die Domain-Suche in get_last_hubspot_contact ohne Komplett-Crawl auskommt.
+    """
+
+    LIST_URL = CONTACTS_URL
+    SEARCH_URL = CONTACTS_SEARCH_URL
+    PROPERTIES = CONTACT_PROPERTIES
+    STORE_KEY = "contacts"
+    SITE = "contact_index"
+
+    def __init__(self, path=CONTACT_INDEX_FILE):
+        super().__init__(path)
+
+    def _reset_lookups(self):
+        self._by_domain = {}
+        self._by_token = {}
+
+    def _lookup_state(self):
+        return self._by_domain, self._by_token
+
+    def _restore_lookups(self, state):
+        self._by_domain, self._by_token = state
+
+    def _index(self, contact_id, props):
+        email = (props.get("email") or "").strip().lower()
+        if "@" not in email:
+            return
+        domain = email.rsplit("@", 1)[1]
+        self._by_domain.setdefault(domain, set()).add(contact_id)
+        for token in domain_tokens(domain):
+            self._by_token.setdefault(token, set()).add(domain)
+
+    def _unindex(self, contact_id, props):
+        email = (props.get("email") or "").strip().lower()
+        if "@" not in email:
+            return
+        domain = email.rsplit("@", 1)[1]
+        ids = self._by_domain.get(domain)
+        if ids is not None:
+            ids.discard(contact_id)
+            if not ids:
+                del self._by_domain[domain]
+                for token in domain_tokens(domain):
+                    domains = self._by_token.get(token)
+                    if domains is not None:
+                        domains.discard(domain)
+                        if not domains:
+                            del self._by_token[token]
+
+    # --- Abfragen ---
+
+    def find_by_company_token(self, company_token):
+        """Gibt alle Kontakte zurück, deren E-Mail-Domain zum Firmen-Token passt."""
+        with self._lock:
+            variants = company_token_variants(company_token)
+            domains = set()
+            for v in variants:
+                domains |= self._by_token.get(v, set())
+            if not domains:
+                # Kein exakter Token-Treffer: Teilstring-Suche über die (wenigen) Domains
+                domains = {d for d in self._by_domain if any(v in d for v in variants)}
+            return [self._objects[cid] for d in domains for cid in self._by_domain.get(d, ())]
+
+
+class CompanyIndex(_ObjectIndex):
+    """
+    Index aller HubSpot-Companies für den unscharfen Namensabgleich (name_matching.CompanyMatcher).
+    Der Matcher wird nach jeder Änderung der Company-Liste beim nächsten Abgleich neu aufgebaut.
+    """
+
+    LIST_URL = COMPANIES_URL
+    SEARCH_URL = COMPANIES_SEARCH_URL
+    PROPERTIES = COMPANY_INDEX_PROPERTIES
+    MODIFIED_PROPERTY = "hs_lastmodifieddate"
+    STORE_KEY = "companies"
+    SITE = "company_index"
+
+    def __init__(self, path=COMPANY_INDEX_FILE):
+        self._version = 0
+        self._matcher = None
+        self._matcher_version = -1
+        self._matcher_ids = []
+        super().__init__(path)
+
+    def _index(self, company_id, props):
+        self._version += 1
+
+    def _unindex(self, company_id, props):
+        self._version += 1
+
+    def _restore_lookups(self, state):
+        self._version += 1
+
+    def match_many(self, company_names, min_score=MIN_MATCH_SCORE):
+        """
+        Gleicht viele Firmennamen in einem Durchgang ab. Gibt pro Name eine Liste
+        [(Company-Properties, Wert), ...] zurück, bester Treffer zuerst (leer, wenn keiner passt).
+        """
+        with self._lock:
+            if self._matcher_version != self._version:
+                self._matcher_ids = list(self._objects)
+                self._matcher = CompanyMatcher(self._objects[cid].get("name") or "" for cid in self._matcher_ids)
+                self._matcher_version = self._version
+            matcher, ids, objects = self._matcher, self._matcher_ids, self._objects
+            return [
+                [(objects[ids[doc]], score) for doc, score in found]
+                for found in matcher.match_many(company_names, min_score=min_score)
+            ]
+
+
+_contact_index = None
+_contact_index_lock = threading.Lock()
+
+
+def get_contact_index():
+    """Prozessweiter Kontakt-Index (wird zwischen Streamlit-Sessions geteilt)."""
+    global _contact_index
+    with _contact_index_lock:
+        if _contact_index is None:
+            _contact_index = ContactIndex()
+        return _contact_index
+
+
+_company_index = None
+_company_index_lock = threading.Lock()
+
+
+def get_company_index():
+    """Prozessweiter Company-Index (wird zwischen Streamlit-Sessions geteilt)."""
+    global _company_index
+    with _company_index_lock:
+        if _company_index is None:
+            _company_index = CompanyIndex()
+        return _company_index
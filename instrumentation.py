@@ -0,0 +1,188 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from settings import get_secret
+
+# Pro Durchlauf werden höchstens so viele Einzel-Spans gespeichert (die Summen pro Stufe sind immer vollständig)
+MAX_SPANS_PER_RUN = 5000
+# Anzahl abgeschlossener Durchläufe, die für die Anzeige aufbewahrt werden (prozessweit)
+RECENT_RUNS = 20
+# JSON-Lines-Export: Umgebungsvariable oder Secret mit dem Dateipfad (leer = kein Export)
+EXPORT_PATH_SETTING = "PERFORMANCE_LOG_PATH"
+
+_current_run = contextvars.ContextVar("instrumentation_run", default=None)
+_recent_runs = deque(maxlen=RECENT_RUNS)
+_recent_lock = threading.Lock()
+_export_lock = threading.Lock()
+
+
+class Run:
+    """
+    Messwerte eines Durchlaufs (z.B. einer Recherche oder eines Mailversands): Dauer je Stufe (Spans)
+    und Zähler für HTTP-Anfragen, Bytes, Retries, Cache-Treffer, SMTP-Verbindungen usw.
+    Thread-sicher, da Worker-Threads über bind() in denselben Durchlauf schreiben.
+    `attrs` ordnen den Durchlauf zu (z.B. campaign_id beim Mailversand).
+    """
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self.duration = None
+        self.spans = []
+        self.dropped_spans = 0
+        self.stages = {}
+        self.counters = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_span(self, name, seconds, start=None, **attrs):
+        with self._lock:
+            stage = self.stages.setdefault(name, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+            stage["count"] += 1
+            stage["total_s"] += seconds
+            stage["max_s"] = max(stage["max_s"], seconds)
+            if len(self.spans) >= MAX_SPANS_PER_RUN:
+                self.dropped_spans += 1
+                return
+            self.spans.append({
+                "name": name,
+                "offset_s": (start if start is not None else time.perf_counter() - seconds) - self._start,
+                "duration_s": seconds,
+                "thread": threading.current_thread().name,
+                **attrs
+            })
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+
+    def summary(self):
+        """Stufen (nach Gesamtdauer absteigend) und Zähler als einfache Dicts, z.B. für die Anzeige."""
+        with self._lock:
+            stages = sorted(({"stage": name, **values} for name, values in self.stages.items()),
+                            key=lambda s: -s["total_s"])
+            return {
+                "run": self.name,
+                "run_id": self.run_id,
+                **self.attrs,
+                "started_at": self.started_at,
+                "duration_s": self.duration if self.duration is not None else time.perf_counter() - self._start,
+                "stages": stages,
+                "counters": dict(self.counters),
+                "dropped_spans": self.dropped_spans
+            }
+
+    def export(self, path):
+        """Hängt alle Spans und eine Zusammenfassung als JSON-Lines an path an."""
+        summary = self.summary()
+        with self._lock:
+            spans = list(self.spans)
+        lines = [json.dumps({"type": "span", "run": self.name, "run_id": self.run_id, **span}, default=str)
+                 for span in spans]
+        lines.append(json.dumps({"type": "run", **summary}, default=str))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with _export_lock, open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def export_path():
+    """Pfad für den JSON-Lines-Export aus PERFORMANCE_LOG_PATH (siehe settings.get_secret) oder None."""
+    return get_secret(EXPORT_PATH_SETTING, None) or None
+
+
+@contextmanager
+def run(name, **attrs):
+    """
+    Startet einen Durchlauf: alle span()/count()-Aufrufe in diesem Kontext (und in per bind()
+    gestarteten Threads) landen darin. Am Ende wird er für recent_runs() gemerkt und ggf. exportiert.
+    attrs werden am Durchlauf gespeichert und mit exportiert (Run.attrs).
+
+        with instrumentation.run("Recherche") as perf:
+            ...
+        perf.summary()
+    """
+    current = Run(name, **attrs)
+    token = _current_run.set(current)
+    try:
+        yield current
+    finally:
+        _current_run.reset(token)
+        current.finish()
+        with _recent_lock:
+            _recent_runs.append(current)
+        path = export_path()
+        if path:
+            try:
+                current.export(path)
+            except OSError as e:
+                logging.warning(f"Performance-Export nach {path} fehlgeschlagen: {e}")
+
+
+def current_run():
+    return _current_run.get()
+
+
+@contextmanager
+def span(name, **attrs):
+    """Misst die Dauer des Blocks als Stufe name im aktuellen Durchlauf (ohne Durchlauf: nichts)."""
+    current = _current_run.get()
+    if current is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.add_span(name, time.perf_counter() - start, start=start, **attrs)
+
+
+def record(name, seconds, **attrs):
+    """Trägt eine anderweitig gemessene Dauer als Stufe name ein (z.B. summierte Wartezeit einer Schleife)."""
+    current = _current_run.get()
+    if current is not None:
+        current.add_span(name, seconds, **attrs)
+
+
+def count(name, amount=1):
+    """Erhöht einen Zähler im aktuellen Durchlauf (ohne Durchlauf: nichts)."""
+    current = _current_run.get()
+    if current is not None:
+        current.count(name, amount)
+
+
+def bind(fn):
+    """
+    Gibt fn so zurück, dass es im aktuellen Kontext läuft, auch in einem anderen Thread
+    (z.B. executor.submit(bind(fn), ...)). Jeder Aufruf bekommt eine eigene Kopie des Kontexts.
+    """
+    context = contextvars.copy_context()
+
+    def bound(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+
+    return bound
+
+
+def recent_runs(name=None, **attrs):
+    """
+    Zuletzt abgeschlossene Durchläufe (neueste zuerst), optional nur mit diesem Namen und diesen
+    Attributen, z.B. recent_runs(MAIL_RUN_NAME, campaign_id=7).
+    """
+    with _recent_lock:
+        runs = list(_recent_runs)
+    return [
+        r for r in reversed(runs)
+        if (name is None or r.name == name) and all(r.attrs.get(k) == v for k, v in attrs.items())
+    ]
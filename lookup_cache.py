@@ -0,0 +1,177 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from instrumentation import count
+
+# Markiert einen Cache-Miss (None ist ein gültiger, gecachter Wert: "nicht gefunden")
+MISSING = object()
+# Zugriffszeiten von Cache-Treffern werden gesammelt in die SQLite-Datei geschrieben
+# (spätestens nach so vielen Treffern bzw. Sekunden oder beim nächsten set())
+ACCESS_FLUSH_SIZE = 200
+ACCESS_FLUSH_SECONDS = 30
+
+
+def normalize_key(value):
+    """Cache-Schlüssel: Groß-/Kleinschreibung und Leerraum spielen keine Rolle."""
+    return " ".join(str(value or "").casefold().split())
+
+
+class LookupCache:
+    """
+    Begrenzter Cache mit LRU-Verdrängung und TTL pro Eintrag, thread-sicher und prozessweit nutzbar.
+    Mit `path` werden die Einträge zusätzlich in einer SQLite-Datei abgelegt, damit der Cache
+    einen Neustart übersteht. Werte müssen JSON-serialisierbar sein. `name` benennt die Treffer-Zähler
+    in der Performance-Anzeige (z.B. "hubspot_cache_hits").
+    """
+
+    def __init__(self, max_size=5000, ttl_seconds=6 * 3600, path=None, name="cache"):
+        self.name = name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._touched = {}
+        self._touched_flushed = time.monotonic()
+        self._db_rows = 0
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM entries WHERE expires < ?", (time.time(),))
+            self._db.commit()
+            self._db_rows = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load_persisted(self, key, now):
+        row = self._db.execute("SELECT value, expires FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._db.commit()
+            self._db_rows -= 1
+            return None
+        return row
+
+    def _touch(self, key, now):
+        """Merkt den Zugriff für die LRU-Reihenfolge in der Datei; schreibt gesammelt."""
+        if self._db is None:
+            return
+        self._touched[key] = now
+        if len(self._touched) >= ACCESS_FLUSH_SIZE or time.monotonic() - self._touched_flushed >= ACCESS_FLUSH_SECONDS:
+            self._flush_touched()
+            self._db.commit()
+
+    def _flush_touched(self):
+        if self._touched:
+            self._db.executemany("UPDATE entries SET accessed = ? WHERE key = ?",
+                                 [(accessed, key) for key, accessed in self._touched.items()])
+            self._touched.clear()
+        self._touched_flushed = time.monotonic()
+
+    def _prune_persisted(self):
+        """Begrenzt die Datei auf max_size (am längsten nicht genutzte zuerst), nur wenn sie zu groß ist."""
+        if self._db_rows <= self.max_size:
+            return
+        self._db_rows = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if self._db_rows > self.max_size:
+            self._flush_touched()
+            self._db.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed LIMIT ?)",
+                (self._db_rows - self.max_size,)
+            )
+            self._db_rows = self.max_size
+
+    def get(self, key, default=MISSING):
+        key = normalize_key(key)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                entry = self._load_persisted(key, now)
+                if entry is not None:
+                    self._entries[key] = entry
+                    self._evict()
+            if entry is None or entry[1] < now:
+                self._entries.pop(key, None)
+                self.misses += 1
+                count(f"{self.name}_cache_misses")
+                return default
+            self._entries.move_to_end(key)
+            self._touch(key, now)
+            self.hits += 1
+            count(f"{self.name}_cache_hits")
+            return json.loads(entry[0])
+
+    def set(self, key, value):
+        key = normalize_key(key)
+        now = time.time()
+        entry = (json.dumps(value), now + self.ttl_seconds)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+            if self._db is not None:
+                self._touched.pop(key, None)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                    (key, entry[0], entry[1], now)
+                )
+                # Ersetzte Schlüssel werden mitgezählt; _prune_persisted zählt dann genau nach
+                self._db_rows += 1
+                self._prune_persisted()
+                self._flush_touched()
+                self._db.commit()
+
+    def _evict(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Entfernt einen Eintrag bzw. ohne `key` den gesamten Cache (auch die SQLite-Datei)."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                if self._db is not None:
+                    self._touched.clear()
+                    self._db.execute("DELETE FROM entries")
+                    self._db.commit()
+                    self._db_rows = 0
+                return
+            key = normalize_key(key)
+            self._entries.pop(key, None)
+            if self._db is not None:
+                self._touched.pop(key, None)
+                self._db_rows -= self._db.execute("DELETE FROM entries WHERE key = ?", (key,)).rowcount
+                self._db.commit()
+
+    def invalidate_prefix(self, prefix):
+        """Entfernt alle Einträge, deren Schlüssel mit `prefix` beginnt."""
+        prefix = normalize_key(prefix)
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+            if self._db is not None:
+                for key in [k for k in self._touched if k.startswith(prefix)]:
+                    del self._touched[key]
+                self._db_rows -= self._db.execute(
+                    "DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+                ).rowcount
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
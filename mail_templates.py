@@ -0,0 +1,127 @@
+import math
+import string
+from functools import lru_cache
+
+import pandas as pd
+
+from normalize import EMAIL_PATTERN
+
+# Zusätzliche Platzhalter neben {company}; jeweils die Sheet-Spalten, aus denen sie befüllt werden.
+# Außerdem kann jede Spalte direkt über ihren Namen verwendet werden, z.B. {Name, Nachname}.
+FIELD_ALIASES = {
+    "company": ("Unternehmensname (laut Handelsregister)", "Name"),
+    "contact_name": ("Name, Nachname", "Name Kontaktperson"),
+    "email": ("E-Mail",),
+    "region": ("Region", "Standort"),
+    "website": ("Website", "Webseite"),
+}
+
+_formatter = string.Formatter()
+
+
+class CompiledTemplate:
+    """
+    Einmal geparstes Template im str.format-Stil. render() setzt nur noch die vorab
+    zerlegten Teile zusammen; missing() meldet fehlende Felder, bevor gesendet wird.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self._plan = []
+        for literal, field, spec, conversion in _formatter.parse(source):
+            self._plan.append((literal, field, spec, conversion))
+        self.fields = {field for _, field, _, _ in self._plan if field is not None}
+        if "" in self.fields:
+            raise ValueError("Leere Platzhalter {} sind nicht erlaubt, bitte einen Namen angeben, z.B. {company}.")
+
+    def missing(self, values):
+        """Platzhalter, für die in `values` kein (nicht-leerer) Wert vorliegt."""
+        return {f for f in self.fields if values.get(f) is None or values.get(f) == ""}
+
+    def render(self, values):
+        parts = []
+        for literal, field, spec, conversion in self._plan:
+            parts.append(literal)
+            if field is not None:
+                value = values[field]
+                if conversion:
+                    value = _formatter.convert_field(value, conversion)
+                parts.append(format(value, spec) if spec else str(value))
+        return "".join(parts)
+
+    def render_batch(self, records):
+        return [self.render(values) for values in records]
+
+
+@lru_cache(maxsize=64)
+def compile_template(source):
+    return CompiledTemplate(source)
+
+
+def _is_empty(value):
+    # pd.NA / pd.NaT aus typisierten Spalten (Int64, boolean, datetime) zählen wie NaN als leer
+    if value is None or value is pd.NA or value is pd.NaT:
+        return True
+    return (isinstance(value, float) and math.isnan(value)) or str(value).strip() == ""
+
+
+def fields_from_row(row):
+    """
+    Platzhalter-Werte für einen Empfänger aus einer Tabellenzeile (dict oder pandas.Series):
+    alle Spalten unter ihrem Namen plus die Aliase aus FIELD_ALIASES.
+    """
+    values = {str(k): ("" if _is_empty(v) else v) for k, v in dict(row).items()}
+    for alias, columns in FIELD_ALIASES.items():
+        if values.get(alias, "") != "":
+            continue
+        values[alias] = next((values[c] for c in columns if values.get(c, "") != ""), "")
+    return values
+
+
+def _text_values(frame):
+    """Alle Zellen als Text wie in fields_from_row: leere Zellen (NA, nur Leerraum) werden zu ""."""
+    values = frame.astype(object).where(frame.notna(), "")
+    empty = pd.DataFrame(
+        {col: values[col].astype(str).str.strip().eq("") for col in values.columns}, index=values.index
+    )
+    return values.mask(empty, "")
+
+
+def recipient_batch(frame, rows=None):
+    """
+    Empfänger für die gewählten Zeilen von frame (Index = Sheet-Zeilennummer; rows=None: alle) in einem
+    Durchgang, ohne iterrows: Platzhalter-Werte wie fields_from_row, E-Mail getrimmt und geprüft, jede
+    Adresse (ohne Groß-/Kleinschreibung) nur einmal. Gibt (Empfänger, Aussortierte) zurück:
+    [{"recipient", "company", "row", "fields"}, ...] in Tabellenreihenfolge und {Zeile: Grund}.
+    """
+    selected = frame if rows is None else frame[frame.index.isin(list(rows))]
+    values = _text_values(selected)
+    for alias, columns in FIELD_ALIASES.items():
+        filled = values[alias] if alias in values.columns else pd.Series("", index=values.index, dtype=object)
+        for col in columns:
+            if col in values.columns:
+                filled = filled.where(filled != "", values[col])
+        values[alias] = filled
+
+    emails = values["email"].astype(str).str.strip()
+    valid = emails.str.match(EMAIL_PATTERN)
+    keys = emails.str.lower()
+    duplicate = valid & keys.where(valid).duplicated()
+    first_rows = keys[valid].drop_duplicates()
+    first_row = dict(zip(first_rows.tolist(), first_rows.index.tolist()))
+
+    rejected = {}
+    for row in emails.index[emails == ""]:
+        rejected[int(row)] = "keine E-Mail-Adresse"
+    for row in emails.index[(emails != "") & ~valid]:
+        rejected[int(row)] = f"ungültige E-Mail-Adresse '{emails[row]}'"
+    for row in emails.index[duplicate]:
+        rejected[int(row)] = f"doppelte E-Mail-Adresse (wie Zeile {first_row[keys[row]]})"
+
+    keep = valid & ~duplicate
+    values["email"] = emails
+    records = values[keep].to_dict("records")
+    return [
+        {"recipient": fields["email"], "company": fields["company"], "row": int(row), "fields": fields}
+        for row, fields in zip(values.index[keep], records)
+    ], rejected
@@ -0,0 +1,171 @@
+import math
+from collections import Counter
+
+import numpy as np
+
+from normalize import name_tokens
+
+# Füllwörter, die für den Namensabgleich keine Aussagekraft haben ("Die Firma GmbH" -> "firma")
+STOPWORDS = {
+    "die", "der", "das", "den", "dem", "des", "und", "u", "fuer", "von", "vom", "zu", "zur", "zum",
+    "am", "an", "im", "in", "bei", "the", "and", "of", "for", "a",
+}
+
+NGRAM = 3
+# Ab diesem Kosinus-Wert (0..1) gilt ein HubSpot-Name als Treffer
+MIN_MATCH_SCORE = 0.7
+# Treffer mit fast gleichem Wert gelten als gleich gut (dann entscheidet das Datum)
+SCORE_TIE_TOLERANCE = 0.02
+# Tokens mit mehr Kandidaten werden ignoriert, wenn der Name noch andere Tokens hat
+MAX_CANDIDATES_PER_TOKEN = 1000
+# Anzahl Suchnamen pro Rechenschritt (begrenzt den Speicherbedarf)
+QUERY_CHUNK_SIZE = 256
+PREFIX_LENGTH = 4
+
+
+def match_tokens(name):
+    """Normalisierte Namens-Tokens ohne Rechtsform und Füllwörter (falls danach noch etwas übrig bleibt)."""
+    tokens = name_tokens(name)
+    return [t for t in tokens if t not in STOPWORDS] or tokens
+
+
+def match_key(name):
+    return " ".join(match_tokens(name))
+
+
+def distinctive_token(name):
+    """Aussagekräftigstes (längstes) Token eines Namens, z.B. für CONTAINS_TOKEN-Suchen; '' wenn keins."""
+    tokens = match_tokens(name)
+    return max(tokens, key=len) if tokens else ""
+
+
+def _char_ngrams(key):
+    padded = f" {key} "
+    return Counter(padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1))
+
+
+def _lookup_keys(key):
+    """Schlüssel im Kandidaten-Index: ganze Tokens und ihre Anfänge (fängt Tippfehler am Wortende ab)."""
+    keys = set()
+    for token in key.split():
+        keys.add(token)
+        if len(token) > PREFIX_LENGTH:
+            keys.add("^" + token[:PREFIX_LENGTH])
+    return keys
+
+
+class CompanyMatcher:
+    """
+    Unscharfer Abgleich von Firmennamen gegen eine feste Namensliste (z.B. alle HubSpot-Companies).
+    Die Namen werden normalisiert (Rechtsform, Füllwörter, Umlaute), Kandidaten über einen Token-Index
+    gefunden und mit Zeichen-Trigramm-TF-IDF (Kosinus) bewertet. match_many() rechnet alle Suchnamen
+    eines Blocks in einem vektorisierten NumPy-Schritt.
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.keys = [match_key(name) for name in self.names]
+        vocab = {}
+        indptr = [0]
+        indices = []
+        counts = []
+        postings = {}
+        for doc, key in enumerate(self.keys):
+            for gram, count in _char_ngrams(key).items():
+                indices.append(vocab.setdefault(gram, len(vocab)))
+                counts.append(count)
+            indptr.append(len(indices))
+            for lookup in _lookup_keys(key):
+                postings.setdefault(lookup, []).append(doc)
+
+        n_docs = len(self.keys)
+        self.vocab = vocab
+        self._indptr = np.asarray(indptr, dtype=np.int64)
+        self._indices = np.asarray(indices, dtype=np.int64)
+        doc_freq = np.bincount(self._indices, minlength=len(vocab))
+        self._idf = np.log((1 + n_docs) / (1 + doc_freq)) + 1
+        self._max_idf = math.log(1 + n_docs) + 1
+        # Sublineare Termgewichtung, Zeilen auf Länge 1 normiert (Skalarprodukt = Kosinus)
+        data = (1 + np.log(np.asarray(counts, dtype=np.float64))) * self._idf[self._indices]
+        rows = np.repeat(np.arange(n_docs), np.diff(self._indptr))
+        norms = np.sqrt(np.bincount(rows, weights=data ** 2, minlength=n_docs))
+        self._data = data / np.where(norms > 0, norms, 1)[rows] if len(data) else data
+        self._postings = {lookup: np.asarray(docs, dtype=np.int64) for lookup, docs in postings.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _candidates(self, key):
+        lists = [self._postings[k] for k in _lookup_keys(key) if k in self._postings]
+        if not lists:
+            return np.empty(0, dtype=np.int64)
+        selective = [docs for docs in lists if len(docs) <= MAX_CANDIDATES_PER_TOKEN]
+        return np.unique(np.concatenate(selective or lists))
+
+    def _query_vector(self, key):
+        weights = {}
+        norm_sq = 0.0
+        for gram, count in _char_ngrams(key).items():
+            column = self.vocab.get(gram)
+            weight = (1 + math.log(count)) * (self._idf[column] if column is not None else self._max_idf)
+            norm_sq += weight * weight
+            if column is not None:
+                weights[column] = weight
+        norm = math.sqrt(norm_sq) or 1.0
+        return {column: weight / norm for column, weight in weights.items()}
+
+    def _score_chunk(self, query_keys):
+        vocab_size = max(len(self.vocab), 1)
+        q_keys, q_vals, pair_query, pair_doc = [], [], [], []
+        for qi, key in enumerate(query_keys):
+            for column, weight in self._query_vector(key).items():
+                q_keys.append(qi * vocab_size + column)
+                q_vals.append(weight)
+            candidates = self._candidates(key)
+            pair_query.append(np.full(len(candidates), qi, dtype=np.int64))
+            pair_doc.append(candidates)
+        pair_query = np.concatenate(pair_query) if pair_query else np.empty(0, dtype=np.int64)
+        pair_doc = np.concatenate(pair_doc) if pair_doc else np.empty(0, dtype=np.int64)
+        if not len(pair_doc) or not q_keys:
+            return pair_query, pair_doc, np.zeros(len(pair_doc))
+
+        order = np.argsort(q_keys)
+        q_keys = np.asarray(q_keys, dtype=np.int64)[order]
+        q_vals = np.asarray(q_vals)[order]
+
+        # Alle Trigramm-Einträge der Kandidaten aneinanderhängen (CSR-Zeilen expandieren)
+        starts = self._indptr[pair_doc]
+        lengths = self._indptr[pair_doc + 1] - starts
+        entry_pair = np.repeat(np.arange(len(pair_doc)), lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        entries = np.repeat(starts, lengths) + offsets
+
+        # Passendes Gewicht des Suchnamens per binärer Suche über (Suchname, Trigramm)
+        lookup = pair_query[entry_pair] * vocab_size + self._indices[entries]
+        pos = np.minimum(np.searchsorted(q_keys, lookup), len(q_keys) - 1)
+        hit = q_keys[pos] == lookup
+        scores = np.bincount(entry_pair[hit], weights=self._data[entries[hit]] * q_vals[pos[hit]],
+                             minlength=len(pair_doc))
+        return pair_query, pair_doc, scores
+
+    def match_many(self, queries, min_score=MIN_MATCH_SCORE, limit=5):
+        """
+        Für jeden Suchnamen die besten Treffer als Liste [(Index in names, Wert), ...], absteigend sortiert,
+        nur Werte >= min_score. Die Rückgabe hat dieselbe Reihenfolge wie queries.
+        """
+        results = []
+        keys = [match_key(q) for q in queries]
+        for start in range(0, len(keys), QUERY_CHUNK_SIZE):
+            chunk = keys[start:start + QUERY_CHUNK_SIZE]
+            pair_query, pair_doc, scores = self._score_chunk(chunk)
+            matches = [[] for _ in chunk]
+            keep = scores >= min_score
+            for qi, doc, score in zip(pair_query[keep].tolist(), pair_doc[keep].tolist(), scores[keep].tolist()):
+                matches[qi].append((doc, score))
+            for found in matches:
+                found.sort(key=lambda m: -m[1])
+                results.append(found[:limit])
+        return results
+
+    def match(self, query, min_score=MIN_MATCH_SCORE, limit=5):
+        return self.match_many([query], min_score, limit)[0]
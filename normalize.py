@@ -0,0 +1,70 @@
+import re
+import unicodedata
+
+# Rechtsformen, die beim Namensvergleich ignoriert werden ("Beispiel Technik GmbH" == "Beispiel Technik")
+LEGAL_FORMS = {
+    "gmbh", "gesmbh", "mbh", "ag", "kg", "og", "ohg", "eu", "ek", "kgaa", "se",
+    "ug", "co", "ltd", "limited", "inc", "llc", "plc", "sarl", "sa", "srl", "bv",
+    "holding", "gruppe", "group",
+}
+
+UMLAUT_MAP = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+
+# Zweite Ebene bei Länderdomains, z.B. firma.co.at oder firma.or.at
+SECOND_LEVEL_LABELS = {"co", "or", "gv", "ac", "com", "net", "org", "gov", "edu"}
+
+# Plausible E-Mail-Adresse (Recherche-Ergebnisse, Empfänger beim Versand)
+EMAIL_PATTERN = re.compile(r'^[\w\.+-]+@[\w\.-]+\.\w+$')
+
+# Freemail-Domains sagen nichts über das Unternehmen aus
+FREEMAIL_DOMAINS = {
+    "gmail.com", "googlemail.com", "gmx.at", "gmx.de", "gmx.net", "web.de", "yahoo.com", "yahoo.de",
+    "outlook.com", "hotmail.com", "live.com", "icloud.com", "aon.at", "chello.at", "a1.net", "t-online.de",
+}
+
+
+def fold(text):
+    """Kleinschreibung, Umlaute als ae/oe/ue/ss, sonstige Akzente entfernt."""
+    text = str(text or "").casefold().translate(UMLAUT_MAP)
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def name_tokens(name):
+    """Normalisierte Wort-Tokens eines Firmennamens ohne Rechtsform."""
+    # Punkte entfernen, damit "Ges.m.b.H." zu "gesmbh" und "e.U." zu "eu" wird
+    text = fold(name).replace(".", "")
+    tokens = re.findall(r"[a-z0-9]+", text)
+    return [t for t in tokens if t not in LEGAL_FORMS] or tokens
+
+
+def normalize_company_name(name):
+    """Vergleichsschlüssel für Firmennamen, z.B. 'Müller Bau GmbH' -> 'mueller bau'."""
+    return " ".join(name_tokens(name))
+
+
+def registrable_domain(value):
+    """
+    Registrierbare Domain aus Website oder E-Mail-Adresse, z.B.
+    'https://www.shop.beispiel.co.at/kontakt' -> 'beispiel.co.at', 'info@beispiel.de' -> 'beispiel.de'.
+    Gibt '' zurück, wenn keine Domain erkennbar ist.
+    """
+    value = str(value or "").strip().lower()
+    if "@" in value:
+        value = value.rsplit("@", 1)[1]
+    value = re.sub(r"^[a-z]+://", "", value)
+    value = re.split(r"[/?#:\s]", value, maxsplit=1)[0].strip(".")
+    labels = [label for label in value.split(".") if label]
+    if len(labels) < 2:
+        return ""
+    if len(labels) >= 3 and labels[-2] in SECOND_LEVEL_LABELS and len(labels[-1]) == 2:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def company_domain(website="", email=""):
+    """Domain eines Unternehmens aus Website oder (Nicht-Freemail-)E-Mail."""
+    domain = registrable_domain(website)
+    if not domain:
+        domain = registrable_domain(email)
+    return "" if domain in FREEMAIL_DOMAINS else domain
@@ -4,40 +4,23 @@ import smtplib
 import time
 import os
 import logging
-import streamlit as st
+import re
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
-import gspread
-from google.oauth2.service_account import Credentials
+from backend import get_smtp_settings, get_worksheet
+from mail_templates import compile_template
+from instrumentation import count, span
 
 os.makedirs("mail_log", exist_ok=True)
 
-SPREADSHEET_ID = "1o4vY8j2hrHyKfs1wwvyxYF172BOvgPRl5qpj_9-GsJE"
-WORKSHEET_NAME = "Team Gabriel"
 LOG_FILE = 'mail_log/mail_log.txt'
 DELAY_SECONDS = 3
-
-td = {
-    'GMAIL_USER': st.secrets["GMAIL_USER"],
-    'GMAIL_PASS': st.secrets["GMAIL_PASS"],
-    'SMTP_HOST': st.secrets.get("SMTP_HOST", "smtp.gmail.com"),
-    'SMTP_PORT': int(st.secrets.get("SMTP_PORT", 587))
-}
-
-SERVICE_ACCOUNT_FILE = "service_account.json"
-with open(SERVICE_ACCOUNT_FILE, "w") as f:
-    f.write(st.secrets["GOOGLE_SERVICE_ACCOUNT_JSON"])
-
-SCOPES = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive"
-]
-CREDS = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-gc = gspread.authorize(CREDS)
-sh = gc.open_by_key(SPREADSHEET_ID)
-worksheet = sh.worksheet(WORKSHEET_NAME)
+# Nach so vielen Mails wird die SMTP-Verbindung erneuert
+MAX_MESSAGES_PER_CONNECTION = 50
+# Timeout pro SMTP-Operation in Sekunden (Verbindungsaufbau, Login, Senden)
+SMTP_TIMEOUT_SECONDS = 30
 
 logging.basicConfig(
     filename=LOG_FILE,
@@ -81,81 +64,195 @@ SIGNATURE_HTML = """
 </span>
 """
 
-def convert_text_to_html(text, company):
-    text = text.format(company=company)
+def text_to_html_template(text):
+    """Wandelt eigenen Text (mit {company}-Platzhalter) in ein HTML-Gerüst um, ohne ihn zu befüllen."""
     paragraphs = text.split('\n')
     html_paragraphs = [f"<p>{line.strip()}</p>" for line in paragraphs if line.strip()]
     return "<html><body>" + "\n".join(html_paragraphs) + "</body></html>"
 
+def convert_text_to_html(text, company):
+    return compile_template(text_to_html_template(text)).render({"company": company})
+
+_BODY_CLOSE_RE = re.compile(r"</body\s*>", flags=re.IGNORECASE)
+
 def add_signature_to_html(html, signature):
-    import re
-    return re.sub(r"</body\s*>", signature + "</body>", html, flags=re.IGNORECASE)
+    return _BODY_CLOSE_RE.sub(lambda m: signature + "</body>", html)
 
-# HIER IST DER FIX: Parameter "cc_email=None" am Ende hinzugefügt
-def send_mail(recipient, company, mail_text=None, mail_subject=None, attachment=None, add_signature=True, cc_email=None):
-    if not recipient or not str(recipient).strip():
-        logging.error(f"Abgebrochen: Keine E-Mail-Adresse für '{company}' vorhanden.")
-        print(f"Abgebrochen: Keine E-Mail-Adresse für '{company}'.")
-        return
-        
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = td['GMAIL_USER']
-        msg['To'] = recipient
-        
-        # --- NEU: CC hinzufügen, falls ausgefüllt ---
-        if cc_email:
-            msg['Cc'] = cc_email
-        # --------------------------------------------
-        
-        subject = mail_subject.format(company=company) if mail_subject else f"Maßgeschneiderte Lösungen für {company}"
-        msg['Subject'] = subject
+class MailSender:
+    """
+    Hält eine authentifizierte SMTP-Verbindung für viele Mails offen (statt Verbindungsaufbau,
+    STARTTLS und Login pro Empfänger). Bricht der Server die Verbindung ab, wird transparent neu
+    verbunden; nach max_messages_per_connection Mails wird die Verbindung erneuert.
 
-        if mail_text:
-            html = convert_text_to_html(mail_text, company)
-        else:
-            html = DEFAULT_MAIL_HTML.format(company=company)
+        with MailSender() as sender:
+            send_mail(..., sender=sender)
+    """
 
-        if add_signature:
-            html = add_signature_to_html(html, SIGNATURE_HTML)
+    def __init__(self, max_messages_per_connection=MAX_MESSAGES_PER_CONNECTION):
+        self.max_messages_per_connection = max_messages_per_connection
+        self._server = None
+        self._sent_on_connection = 0
 
-        msg.attach(MIMEText(html, 'html'))
+    def _connect(self):
+        self.close()
+        settings = get_smtp_settings()
+        count("smtp_sessions")
+        with span("smtp.connect"):
+            server = smtplib.SMTP(settings['SMTP_HOST'], settings['SMTP_PORT'], timeout=SMTP_TIMEOUT_SECONDS)
+            if settings.get('SMTP_STARTTLS', True):
+                server.starttls()
+            server.login(settings['GMAIL_USER'], settings['GMAIL_PASS'])
+        self._server = server
+        self._sent_on_connection = 0
+
+    def send(self, msg):
+        if self._server is None or self._sent_on_connection >= self.max_messages_per_connection:
+            self._connect()
+        try:
+            # Python (smtplib) liest To und Cc automatisch aus dem 'msg' Header aus
+            with span("smtp.send"):
+                self._server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Server hat die (Keep-Alive-)Verbindung geschlossen: einmal neu verbinden
+            count("smtp_reconnects")
+            self._connect()
+            with span("smtp.send"):
+                self._server.send_message(msg)
+        self._sent_on_connection += 1
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except smtplib.SMTPException:
+                pass
+            self._server = None
+
+    def __enter__(self):
+        return self
 
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def _read_attachment(attachment):
+    """Liest den kompletten Anhang, auch wenn der Stream (z.B. UploadedFile) schon gelesen wurde."""
+    if hasattr(attachment, "getvalue"):
+        return attachment.getvalue()
+    attachment.seek(0)
+    return attachment.read()
+
+class PreparedCampaign:
+    """
+    Einmal pro Kampagne vorbereitete Mail: HTML-Gerüst und Signatur werden einmal gerendert, der Anhang
+    einmal gelesen und base64-kodiert. Pro Empfänger werden nur noch die Platzhalter befüllt.
+    """
+
+    def __init__(self, mail_text=None, mail_subject=None, attachment=None, add_signature=True, cc_email=None):
+        self.subject_template = compile_template(mail_subject or "Maßgeschneiderte Lösungen für {company}")
+        html = text_to_html_template(mail_text) if mail_text else DEFAULT_MAIL_HTML
+        if add_signature:
+            # Die Signatur wird mit ins Template übernommen, darf also keine Platzhalter enthalten
+            html = add_signature_to_html(html, SIGNATURE_HTML.replace("{", "{{").replace("}", "}}"))
+        self.html_template = compile_template(html)
+        self.fields = self.subject_template.fields | self.html_template.fields
+        self.cc_email = cc_email
+
+        self.attachment_part = None
         if attachment is not None:
             part = MIMEBase('application', 'octet-stream')
-            part.set_payload(attachment.read())
+            part.set_payload(_read_attachment(attachment))
             encoders.encode_base64(part)
             part.add_header('Content-Disposition', f'attachment; filename="{attachment.name}"')
-            msg.attach(part)
+            # Wird unverändert an jede Mail der Kampagne gehängt
+            self.attachment_part = part
+
+    def missing_fields(self, records):
+        """
+        Prüft vor dem Versand, welche Platzhalter je Empfänger nicht befüllt werden können.
+        records: Liste von Platzhalter-Dicts; Rückgabe {Index: fehlende Felder} nur für unvollständige.
+        """
+        missing = {}
+        for i, values in enumerate(records):
+            fields = self.subject_template.missing(values) | self.html_template.missing(values)
+            if fields:
+                missing[i] = sorted(fields)
+        return missing
+
+    def render(self, values):
+        return self.subject_template.render(values), self.html_template.render(values)
+
+    def render_batch(self, records):
+        """Betreff und HTML für viele Empfänger auf einmal."""
+        return list(zip(self.subject_template.render_batch(records), self.html_template.render_batch(records)))
+
+    def build_message(self, recipient, company, fields=None):
+        values = {"company": company, **(fields or {})}
+        subject, html = self.render(values)
+        msg = MIMEMultipart()
+        msg['From'] = get_smtp_settings()['GMAIL_USER']
+        msg['To'] = recipient
+
+        # --- NEU: CC hinzufügen, falls ausgefüllt ---
+        if self.cc_email:
+            msg['Cc'] = self.cc_email
+        # --------------------------------------------
+
+        msg['Subject'] = subject
+        msg.attach(MIMEText(html, 'html'))
+        if self.attachment_part is not None:
+            msg.attach(self.attachment_part)
+        return msg
 
-        server = smtplib.SMTP(td['SMTP_HOST'], td['SMTP_PORT'])
-        server.starttls()
-        server.login(td['GMAIL_USER'], td['GMAIL_PASS'])
+# HIER IST DER FIX: Parameter "cc_email=None" am Ende hinzugefügt
+def send_mail(recipient, company, mail_text=None, mail_subject=None, attachment=None, add_signature=True, cc_email=None, sender=None, campaign=None, fields=None):
+    """
+    Sendet eine Mail an recipient. Gibt True zurück, wenn der Versand geklappt hat (Details im Log).
+    Für Massenversand eine PreparedCampaign übergeben; die Text-/Anhang-Parameter werden dann ignoriert.
+    fields: weitere Platzhalter-Werte (z.B. aus mail_templates.fields_from_row).
+    """
+    if not recipient or not str(recipient).strip():
+        logging.error(f"Abgebrochen: Keine E-Mail-Adresse für '{company}' vorhanden.")
+        print(f"Abgebrochen: Keine E-Mail-Adresse für '{company}'.")
+        return False
         
-        # Senden! Python (smtplib) liest To und Cc automatisch aus dem 'msg' Header aus
-        server.send_message(msg) 
-        server.quit()
+    try:
+        if campaign is None:
+            campaign = PreparedCampaign(mail_text, mail_subject, attachment, add_signature, cc_email)
+        with span("mail.build"):
+            msg = campaign.build_message(recipient, company, fields)
+
+        # Senden! Ohne übergebenen MailSender wird eine einmalige Verbindung aufgebaut
+        if sender is not None:
+            sender.send(msg)
+        else:
+            with MailSender() as single_sender:
+                single_sender.send(msg)
 
+        count("mails_sent")
         logging.info(f"Erfolgreich gesendet an {recipient} ({company})")
         print(f"Mail gesendet an {recipient}")
+        return True
     except Exception as e:
+        count("mails_failed")
         logging.error(f"Fehler beim Senden an {recipient} ({company}): {e}")
         print(f"Fehler beim Senden an {recipient}: {e}")
+        return False
 
 # ANGEPASST: Der DataFrame Abruf passiert nur noch, wenn die Datei direkt gestartet wird,
 # um Abstürze beim Importieren in die app.py zu verhindern.
 if __name__ == '__main__':
-    data = worksheet.get_all_records()
+    data = get_worksheet().get_all_records()
     df = pd.DataFrame(data)
     
     if df.empty:
         print("Keine Unternehmen zum Kontaktieren gefunden.")
     else:
-        for idx, row in df.iterrows():
-            email = row['E-Mail']
-            # ANGEPASST: Richtiger Spaltenname
-            company = row['Unternehmensname (laut Handelsregister)']
-            send_mail(email, company)
-            time.sleep(DELAY_SECONDS)
+        with MailSender() as sender:
+            for idx, row in df.iterrows():
+                email = row['E-Mail']
+                # ANGEPASST: Richtiger Spaltenname
+                company = row['Unternehmensname (laut Handelsregister)']
+                send_mail(email, company, sender=sender)
+                time.sleep(DELAY_SECONDS)
 
         print("Alle Mails wurden bearbeitet. Details im Log-File.")
\ No newline at end of file
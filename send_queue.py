@@ -0,0 +1,340 @@
+import contextlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+
+import instrumentation
+from send_emails import DELAY_SECONDS, SMTP_TIMEOUT_SECONDS, MailSender, PreparedCampaign, send_mail
+
+QUEUE_FILE = "mail_log/send_queue.sqlite3"
+# Name der Performance-Durchläufe des Workers, einer pro Kampagne (instrumentation.recent_runs)
+MAIL_RUN_NAME = "Mailversand"
+# Versandstatus wird gesammelt ins Sheet geschrieben: spätestens nach so vielen Mails bzw. Sekunden
+# und immer, wenn die Warteschlange leer ist (siehe sheet_data.write_send_status)
+SHEET_FLUSH_EVERY = 25
+SHEET_FLUSH_SECONDS = 60
+# Ein Job auf "sending" gilt erst nach so vielen Sekunden als verwaist (ein anderer Prozess, z.B. cli.py
+# neben der App, kann ihn gerade senden). Ein Versand dauert höchstens Verbindungsaufbau + Senden, bei
+# einem Verbindungsabbruch beides zweimal, jeweils mit SMTP_TIMEOUT_SECONDS.
+SENDING_LEASE_SECONDS = 4 * SMTP_TIMEOUT_SECONDS + 30
+
+# Job-Status: pending -> sending -> sent | failed. Jobs, die beim Neustart noch auf "sending"
+# stehen, werden zu "uncertain": ob die Mail rausging, ist unklar, daher nie erneut senden.
+PENDING, SENDING, SENT, FAILED, UNCERTAIN = "pending", "sending", "sent", "failed", "uncertain"
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+class _Attachment(io.BytesIO):
+    """Anhang aus dem Journal mit .name wie ein Streamlit-UploadedFile."""
+
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+def _connect(path=QUEUE_FILE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS campaigns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL NOT NULL,
+            mail_text TEXT,
+            mail_subject TEXT,
+            add_signature INTEGER NOT NULL,
+            cc_email TEXT,
+            attachment_name TEXT,
+            attachment BLOB,
+            delay_seconds REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            campaign_id INTEGER NOT NULL REFERENCES campaigns(id),
+            recipient TEXT NOT NULL,
+            company TEXT NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL,
+            error TEXT,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, id);
+    """)
+    # Journale älterer Versionen: Sheet-Zeile und Rückschreib-Status nachrüsten (alte Jobs bleiben ohne Zeile)
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    if "sheet_row" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN sheet_row INTEGER")
+    if "sheet_synced" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN sheet_synced INTEGER NOT NULL DEFAULT 0")
+    if "sheet_error" not in {row["name"] for row in conn.execute("PRAGMA table_info(campaigns)")}:
+        conn.execute("ALTER TABLE campaigns ADD COLUMN sheet_error TEXT")
+    return conn
+
+
+def enqueue_campaign(recipients, mail_text=None, mail_subject=None, attachment=None, add_signature=True,
+                     cc_email=None, messages_per_minute=None):
+    """
+    Legt eine Kampagne im Journal an und startet den Hintergrund-Worker.
+    recipients: Liste von Dicts mit 'recipient' und 'company' (weitere Schlüssel landen im Payload).
+    Mit 'row' (Sheet-Zeile, siehe mail_templates.recipient_batch) wird der Versand dort vermerkt.
+    Gibt die Kampagnen-ID zurück.
+    """
+    delay = DELAY_SECONDS
+    if messages_per_minute:
+        delay = max(DELAY_SECONDS, 60.0 / messages_per_minute)
+    attachment_data = attachment.getvalue() if attachment is not None else None
+    now = time.time()
+    conn = _connect()
+    try:
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO campaigns (created_at, mail_text, mail_subject, add_signature, cc_email, "
+                "attachment_name, attachment, delay_seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (now, mail_text, mail_subject, int(add_signature), cc_email,
+                 attachment.name if attachment is not None else None, attachment_data, delay)
+            )
+            campaign_id = cur.lastrowid
+            conn.executemany(
+                "INSERT INTO jobs (campaign_id, recipient, company, payload, status, updated_at, sheet_row) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (campaign_id, r["recipient"], r["company"],
+                     json.dumps({k: v for k, v in r.items() if k not in ("recipient", "company", "row")}, default=str),
+                     PENDING, now, r.get("row"))
+                    for r in recipients
+                ]
+            )
+    finally:
+        conn.close()
+    logging.info(f"Kampagne {campaign_id} mit {len(recipients)} Empfängern eingereiht")
+    ensure_worker()
+    return campaign_id
+
+
+def campaign_progress(campaign_id):
+    """
+    Anzahl Jobs pro Status, z.B. {'pending': 3, 'sent': 10, 'failed': 1, 'total': 14}, dazu 'unsynced'
+    (gesendet, aber noch nicht im Sheet vermerkt) und 'sheet_error' (letzter Fehler beim Rückschreiben oder None).
+    """
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT status, COUNT(*) AS n FROM jobs WHERE campaign_id = ? GROUP BY status", (campaign_id,)
+        ).fetchall()
+        unsynced = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE campaign_id = ? AND status = ? AND sheet_row IS NOT NULL AND sheet_synced = 0",
+            (campaign_id, SENT)
+        ).fetchone()[0]
+        campaign = conn.execute("SELECT sheet_error FROM campaigns WHERE id = ?", (campaign_id,)).fetchone()
+    finally:
+        conn.close()
+    progress = {PENDING: 0, SENDING: 0, SENT: 0, FAILED: 0, UNCERTAIN: 0}
+    progress.update({row["status"]: row["n"] for row in rows})
+    progress["total"] = sum(progress.values())
+    progress["unsynced"] = unsynced
+    progress["sheet_error"] = campaign["sheet_error"] if campaign is not None else None
+    return progress
+
+
+def _recover(conn):
+    """
+    Nach einem Absturz: unterbrochene Jobs als 'uncertain' markieren statt sie erneut zu senden.
+    Nur Jobs, die länger als SENDING_LEASE_SECONDS auf 'sending' stehen, damit ein Worker in einem
+    anderen Prozess nicht gestört wird.
+    """
+    now = time.time()
+    with conn:
+        n = conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+            (UNCERTAIN, "Versand unterbrochen (Neustart)", now, SENDING, now - SENDING_LEASE_SECONDS)
+        ).rowcount
+    if n:
+        logging.warning(f"{n} unterbrochene Mail-Jobs als 'uncertain' markiert (nicht erneut gesendet)")
+
+
+def _claim_next_job(conn):
+    """
+    Nimmt den ältesten offenen Job und markiert ihn vor dem Senden als 'sending'. Das UPDATE greift nur,
+    solange der Job noch 'pending' ist; hat ihn ein Worker in einem anderen Prozess zuerst genommen,
+    wird der nächste versucht. So wird jeder Job höchstens einmal gesendet.
+    """
+    while True:
+        row = conn.execute(
+            "SELECT j.*, c.delay_seconds FROM jobs j JOIN campaigns c ON c.id = j.campaign_id "
+            "WHERE j.status = ? ORDER BY j.id LIMIT 1",
+            (PENDING,)
+        ).fetchone()
+        if row is None:
+            return None
+        with conn:
+            claimed = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (SENDING, time.time(), row["id"], PENDING)
+            ).rowcount
+        if claimed:
+            return row
+
+
+def _finish_job(conn, job_id, ok):
+    with conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+            (SENT if ok else FAILED, None if ok else "Siehe mail_log", time.time(), job_id)
+        )
+
+
+def _set_sheet_error(conn, campaign_ids, error):
+    with conn:
+        conn.executemany("UPDATE campaigns SET sheet_error = ? WHERE id = ?", [(error, cid) for cid in campaign_ids])
+
+
+def _sync_sheet(conn):
+    """
+    Schreibt alle gesendeten, noch nicht vermerkten Jobs in einem Durchgang ins Sheet (ein batch_get,
+    ein batch_update). Schlägt das fehl (auch bei fehlenden Spalten), bleiben sie offen, werden beim
+    nächsten Mal mitgeschrieben und der Fehler steht in campaign_progress()["sheet_error"].
+    """
+    jobs = conn.execute(
+        "SELECT id, campaign_id, recipient, sheet_row FROM jobs "
+        "WHERE status = ? AND sheet_row IS NOT NULL AND sheet_synced = 0",
+        (SENT,)
+    ).fetchall()
+    if not jobs:
+        return
+    from backend import get_worksheet
+    from sheet_data import write_send_status
+
+    try:
+        with instrumentation.span("sheets.send_status", jobs=len(jobs)):
+            worksheet = get_worksheet()
+            today = date.today().isoformat()
+            # Mehrere Mails an dieselbe Zeile (z.B. aus zwei Kampagnen) zählen einzeln: eine Runde pro Wiederholung
+            while jobs:
+                batch, rest = {}, []
+                for job in jobs:
+                    if job["sheet_row"] in batch:
+                        rest.append(job)
+                    else:
+                        batch[job["sheet_row"]] = job
+                updated, skipped = write_send_status(
+                    worksheet, {row: job["recipient"] for row, job in batch.items()}, today
+                )
+                with conn:
+                    conn.executemany("UPDATE jobs SET sheet_synced = 1 WHERE id = ?",
+                                     [(job["id"],) for job in batch.values()])
+                _set_sheet_error(conn, {job["campaign_id"] for job in batch.values()}, None)
+                instrumentation.count("sheet_rows_marked", len(updated))
+                if skipped:
+                    logging.warning(f"Versandstatus nicht eingetragen, Zeilen {skipped} gehören inzwischen zu anderen Adressen")
+                jobs = rest
+    except Exception as e:
+        logging.warning(f"Versandstatus konnte nicht ins Sheet geschrieben werden (wird später erneut versucht): {e}")
+        _set_sheet_error(conn, {job["campaign_id"] for job in jobs}, str(e))
+
+
+def _prepare_campaign(conn, campaign_id):
+    row = conn.execute("SELECT * FROM campaigns WHERE id = ?", (campaign_id,)).fetchone()
+    attachment = None
+    if row["attachment"] is not None:
+        attachment = _Attachment(row["attachment"], row["attachment_name"])
+    return PreparedCampaign(
+        mail_text=row["mail_text"],
+        mail_subject=row["mail_subject"],
+        attachment=attachment,
+        add_signature=bool(row["add_signature"]),
+        cc_email=row["cc_email"]
+    )
+
+
+def _run_worker():
+    conn = _connect()
+    try:
+        _recover(conn)
+        # Vorbereitete Mails pro Kampagne: Anhang und HTML-Gerüst nur einmal aufbereiten
+        campaigns = {}
+        # Ein Performance-Durchlauf pro Kampagne (instrumentation.recent_runs(MAIL_RUN_NAME, campaign_id=...));
+        # die SMTP-Verbindung wird über Kampagnen hinweg weiterverwendet
+        with MailSender() as sender, contextlib.ExitStack() as campaign_run:
+            run_campaign = None
+            unsynced, last_sync = 0, time.monotonic()
+            while True:
+                if unsynced and (unsynced >= SHEET_FLUSH_EVERY or time.monotonic() - last_sync >= SHEET_FLUSH_SECONDS):
+                    _sync_sheet(conn)
+                    unsynced, last_sync = 0, time.monotonic()
+                job = _claim_next_job(conn)
+                if job is None:
+                    break
+                if job["campaign_id"] != run_campaign:
+                    if unsynced:
+                        # Kampagnenende: Versandstatus noch im Durchlauf der alten Kampagne schreiben
+                        _sync_sheet(conn)
+                        unsynced, last_sync = 0, time.monotonic()
+                    campaign_run.close()
+                    campaign_run.enter_context(instrumentation.run(MAIL_RUN_NAME, campaign_id=job["campaign_id"]))
+                    run_campaign = job["campaign_id"]
+                campaign = campaigns.get(job["campaign_id"])
+                if campaign is None:
+                    campaign = campaigns[job["campaign_id"]] = _prepare_campaign(conn, job["campaign_id"])
+                fields = json.loads(job["payload"]).get("fields")
+                ok = send_mail(job["recipient"], job["company"], sender=sender, campaign=campaign, fields=fields)
+                _finish_job(conn, job["id"], ok)
+                unsynced += ok and job["sheet_row"] is not None
+                with instrumentation.span("mail.delay"):
+                    time.sleep(job["delay_seconds"])
+            # Kampagnenende (und Reste aus früheren Läufen)
+            _sync_sheet(conn)
+    finally:
+        conn.close()
+
+
+def _worker_main():
+    global _worker
+    while True:
+        try:
+            _run_worker()
+        except Exception as e:
+            logging.error(f"Mail-Worker abgebrochen: {e}")
+        with _worker_lock:
+            # Zwischenzeitlich eingereihte Jobs noch abarbeiten, sonst beenden
+            conn = _connect()
+            try:
+                remaining = conn.execute("SELECT 1 FROM jobs WHERE status = ? LIMIT 1", (PENDING,)).fetchone()
+            finally:
+                conn.close()
+            if remaining is None:
+                _worker = None
+                return
+        time.sleep(DELAY_SECONDS)
+
+
+def ensure_worker():
+    """Startet den Hintergrund-Worker (einer pro Prozess), falls er nicht schon läuft."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_worker_main, name="mail-worker", daemon=True)
+            _worker.start()
+
+
+def worker_running():
+    """Ob der Hintergrund-Worker dieses Prozesses gerade läuft."""
+    with _worker_lock:
+        return _worker is not None
+
+
+def wait_for_worker(timeout=None):
+    """
+    Wartet, bis der Hintergrund-Worker dieses Prozesses fertig ist, also auch den Versandstatus ins Sheet
+    geschrieben hat (z.B. bevor cli.py beendet wird; der Worker ist ein Daemon-Thread).
+    """
+    with _worker_lock:
+        worker = _worker
+    if worker is not None:
+        worker.join(timeout)
@@ -0,0 +1,32 @@
+import os
+
+import streamlit as st
+
+# Zugangsdaten und Einstellungen kommen (in dieser Reihenfolge) aus configure() (z.B. der
+# CLI-Konfigurationsdatei), aus Umgebungsvariablen gleichen Namens oder aus .streamlit/secrets.toml.
+# So laufen dieselben Module in der App und ohne Streamlit (cli.py, Server-Jobs).
+
+_NO_DEFAULT = object()
+_overrides = {}
+
+
+def configure(values):
+    """Setzt Werte, die Vorrang vor Umgebung und secrets.toml haben (z.B. [secrets] aus der CLI-Konfiguration)."""
+    _overrides.update({str(k): v for k, v in dict(values).items()})
+
+
+def get_secret(name, default=_NO_DEFAULT):
+    """Einstellung name; ohne default führt ein fehlender Eintrag zu einem KeyError mit Namen."""
+    if name in _overrides:
+        return _overrides[name]
+    if name in os.environ:
+        return os.environ[name]
+    try:
+        if name in st.secrets:
+            return st.secrets[name]
+    except FileNotFoundError:
+        # Keine secrets.toml (z.B. Server ohne Streamlit-Konfiguration); StreamlitSecretNotFoundError erbt davon
+        pass
+    if default is _NO_DEFAULT:
+        raise KeyError(f"Secret '{name}' fehlt (weder in .streamlit/secrets.toml noch als Umgebungsvariable)")
+    return default
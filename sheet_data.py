@@ -0,0 +1,468 @@
+import math
+import re
+
+import numpy as np
+import pandas as pd
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+
+from instrumentation import count, span
+from normalize import company_domain, normalize_company_name
+from settings import get_secret
+
+# Die Tabelle beginnt mit der Kopfzeile in Zeile 6 (Spalten A bis Q), Daten ab Zeile 7.
+# Der DataFrame-Index ist die Zeilennummer im Sheet und dient als stabiler Zeilenschlüssel.
+HEADER_ROW = 6
+FIRST_DATA_ROW = HEADER_ROW + 1
+
+# Spaltentypen nach Position (0 = Spalte A): G und M sind Zähler, H bis L die fünf Status-Checkboxen.
+COUNTER_COLUMNS = (6, 12)
+FLAG_COLUMNS = (7, 8, 9, 10, 11)
+# Spalten mit wenigen verschiedenen Werten (als Kategorie gespeichert) und Datumsspalten nach Name
+CATEGORY_COLUMNS = ("Region", "Gruppe")
+DATE_COLUMN_HINTS = ("Letzter Kontakt", "Datum")
+# Datumsspalten werden nur umgewandelt, wenn jeder Wert in einem dieser Formate vorliegt
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y")
+_GERMAN_DATE_RE = re.compile(r"^(\d{1,2})\.(\d{1,2})\.(\d{4})$")
+
+
+class SheetConflictError(Exception):
+    """Zellen wurden seit dem Laden von jemand anderem geändert; es wurde nichts gespeichert."""
+
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__(f"{len(conflicts)} Zellen wurden zwischenzeitlich geändert: " + ", ".join(conflicts[:10]))
+
+
+def _is_empty(value):
+    if value is None:
+        return True
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
+
+
+def _column_letter(n):
+    return rowcol_to_a1(1, n).rstrip("0123456789")
+
+
+def cell_key(value):
+    """
+    Vergleichswert einer Zelle, unabhängig davon, ob sie typisiert (Zahl, Checkbox, Datum) oder
+    als Text aus dem Sheet gelesen wurde.
+    """
+    if _is_empty(value):
+        return ""
+    if isinstance(value, pd.Timestamp):
+        return value.strftime("%Y-%m-%d") if value == value.normalize() else value.isoformat(sep=" ")
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, str):
+        value = value.strip()
+        if value.upper() in ("TRUE", "FALSE"):
+            return value.upper()
+        date = _GERMAN_DATE_RE.match(value)
+        if date:
+            day, month, year = date.groups()
+            return f"{year}-{int(month):02d}-{int(day):02d}"
+        try:
+            number = float(value)
+        except ValueError:
+            return value
+        if not math.isfinite(number):
+            return value
+        value = number
+    if isinstance(value, (int, float)):
+        number = float(value)
+        return str(int(number)) if number.is_integer() else repr(number)
+    return str(value)
+
+
+def to_sheet_value(value, date_format="%Y-%m-%d"):
+    """Wert so, wie er ins Sheet geschrieben wird (native Python-Typen, leer statt NaN)."""
+    if _is_empty(value):
+        return ""
+    if isinstance(value, pd.Timestamp):
+        return value.strftime(date_format)
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def clean_headers(headers):
+    """Kopfzeile ohne Zeilenumbrüche und doppelte Leerzeichen; leere/doppelte Namen werden eindeutig gemacht."""
+    seen = {}
+    clean = []
+    for i, h in enumerate(headers):
+        h = " ".join(str(h).split()) or f"Leer_{i}"
+        if h in seen:
+            seen[h] += 1
+            clean.append(f"{h}_{seen[h]}")
+        else:
+            seen[h] = 0
+            clean.append(h)
+    return clean
+
+
+def _as_number(text, nonempty):
+    numbers = pd.to_numeric(text.where(nonempty), errors="coerce")
+    if numbers[nonempty].isna().any():
+        return None
+    if (numbers.dropna() % 1 == 0).all():
+        return numbers.astype("Int64")
+    return numbers.astype("Float64")
+
+
+def _as_flag(text, nonempty):
+    upper = text.str.upper()
+    if not upper[nonempty].isin(["TRUE", "FALSE"]).all():
+        return None
+    return upper.map({"TRUE": True, "FALSE": False}).astype("boolean")
+
+
+def _as_date(text, nonempty):
+    for fmt in DATE_FORMATS:
+        dates = pd.to_datetime(text.where(nonempty), format=fmt, errors="coerce")
+        if dates[nonempty].notna().all():
+            return dates, fmt
+    return None, None
+
+
+def frame_from_values(values):
+    """
+    Baut aus dem Ergebnis von worksheet.get("A6:Q") (Kopfzeile + Datenzeilen) einen typisierten DataFrame:
+    Zähler als Int64, Checkboxen als boolean, Region/Gruppe als category und Datumsspalten als datetime
+    (nur, wenn jeder Wert ein Datum ist). Passt ein Wert nicht zum Typ, bleibt die Spalte Text, damit beim
+    Speichern nichts verloren geht. Alle übrigen Spalten bleiben Text. Index = Zeilennummer im Sheet;
+    die erkannten Datumsformate stehen in df.attrs["date_formats"].
+    """
+    if not values:
+        return pd.DataFrame()
+    columns = clean_headers(values[0])
+    rows = values[1:]
+    # Kurze Zeilen (leere Zellen am Ende fehlen in der API-Antwort) werden in einem Durchgang aufgefüllt
+    df = pd.DataFrame(rows, dtype=object).reindex(columns=range(len(columns)))
+    df = df.fillna("").astype(str)
+    df.columns = columns
+    df.index = pd.RangeIndex(FIRST_DATA_ROW, FIRST_DATA_ROW + len(rows))
+
+    date_formats = {}
+    for pos, col in enumerate(columns):
+        text = df[col].str.strip()
+        nonempty = text != ""
+        typed = None
+        if pos in COUNTER_COLUMNS:
+            typed = _as_number(text, nonempty)
+        elif pos in FLAG_COLUMNS:
+            typed = _as_flag(text, nonempty)
+        elif col in CATEGORY_COLUMNS:
+            typed = text.where(nonempty).astype("category")
+        elif any(hint in col for hint in DATE_COLUMN_HINTS) and nonempty.any():
+            typed, fmt = _as_date(text, nonempty)
+            if typed is not None:
+                date_formats[col] = fmt
+        if typed is not None:
+            df[col] = typed
+    df.attrs["date_formats"] = date_formats
+    return df
+
+
+def _row_labels(index):
+    """Index des bearbeiteten DataFrames als Zeilennummern (NaN für neu angelegte Zeilen)."""
+    return pd.to_numeric(pd.Series(index, dtype=object), errors="coerce").to_numpy(dtype=float)
+
+
+def _changed_positions(edited, original):
+    """
+    Positionen, an denen sich zwei gleich lange Spalten unterscheiden (wie cell_key). Gleiche Rohwerte
+    und beidseitig leere Zellen werden vektorisiert aussortiert; nur die übrigen Kandidaten (z.B. " 1"
+    statt 1) werden einzeln über cell_key verglichen.
+    """
+    edited = edited.reset_index(drop=True)
+    original = original.reset_index(drop=True)
+    same = edited.isna().to_numpy() & original.isna().to_numpy()
+    try:
+        same |= edited.eq(original).fillna(False).to_numpy(dtype=bool)
+    except (TypeError, ValueError):
+        # Nicht vergleichbare Typen (z.B. Text gegen Datum): alle Zellen einzeln prüfen
+        pass
+    return [
+        pos for pos in np.nonzero(~same)[0]
+        if cell_key(edited.iat[pos]) != cell_key(original.iat[pos])
+    ]
+
+
+def diff_company_data(snapshot, edited, columns):
+    """
+    Vergleicht den bearbeiteten DataFrame (st.data_editor) mit dem Stand beim Laden.
+    snapshot/edited sind über die Sheet-Zeilennummer indiziert, columns ist die vollständige
+    Spaltenliste des Sheets (für die Spaltenposition). Zeilen, die nicht im Snapshot waren
+    (z.B. durch Filter ausgeblendet), bleiben unberührt. Verglichen wird spaltenweise und vektorisiert;
+    in Sheet-Werte umgewandelt werden nur geänderte Zellen.
+    Gibt (geänderte Zellen {(zeile, spalte): wert}, neue Zeilen [werte], gelöschte Zeilen [zeile]) zurück.
+    """
+    col_pos = {col: i + 1 for i, col in enumerate(columns)}
+    date_formats = snapshot.attrs.get("date_formats", {})
+
+    def sheet_value(col, value):
+        return to_sheet_value(value, date_formats.get(col, "%Y-%m-%d"))
+
+    labels = _row_labels(edited.index)
+    snapshot_rows = pd.Index(snapshot.index.astype(int))
+    # Bestehende Zeilen: Zeilennummer aus dem Snapshot, jede nur einmal; alles andere ist neu
+    existing = ~np.isnan(labels) & np.isin(labels, snapshot_rows.to_numpy())
+    existing &= ~pd.Series(labels).duplicated().to_numpy()
+    rows = labels[existing].astype(int)
+
+    changed = {}
+    current = edited[existing]
+    original = snapshot.reindex(rows)
+    for col in edited.columns:
+        if col not in col_pos:
+            continue
+        before = original[col] if col in original.columns else pd.Series(pd.NA, index=original.index, dtype=object)
+        for pos in _changed_positions(current[col], before):
+            changed[(int(rows[pos]), col_pos[col])] = sheet_value(col, current[col].iat[pos])
+
+    appended = []
+    added = edited[~existing]
+    added = added[added.notna().any(axis=1)].reindex(columns=columns)
+    for values in zip(*(added[col] for col in columns)):
+        appended.append([sheet_value(col, value) for col, value in zip(columns, values)])
+
+    deleted = sorted(set(snapshot_rows) - set(rows.tolist()))
+    return changed, appended, deleted
+
+
+def _conflicts(worksheet, snapshot, columns, changed, deleted, append_rows):
+    """Liest die betroffenen Zeilen in einem Aufruf nach und vergleicht sie mit dem Snapshot."""
+    rows = sorted({r for r, _ in changed} | set(deleted) | set(append_rows))
+    if not rows:
+        return []
+    last_col = _column_letter(len(columns))
+    count("sheets_requests")
+    current = worksheet.batch_get([f"A{r}:{last_col}{r}" for r in rows])
+    current_by_row = {}
+    for r, values in zip(rows, current):
+        cells = values[0] if values else []
+        current_by_row[r] = cells + [""] * (len(columns) - len(cells))
+
+    conflicts = []
+    for (r, c) in changed:
+        if cell_key(current_by_row[r][c - 1]) != cell_key(snapshot.loc[r].get(columns[c - 1])):
+            conflicts.append(rowcol_to_a1(r, c))
+    for r in deleted:
+        original = snapshot.loc[r]
+        if any(cell_key(current_by_row[r][i]) != cell_key(original.get(col)) for i, col in enumerate(columns)):
+            conflicts.append(f"Zeile {r}")
+    for r in append_rows:
+        if any(cell_key(v) != "" for v in current_by_row[r]):
+            conflicts.append(f"Zeile {r} (nicht mehr leer)")
+    return conflicts
+
+
+def save_company_data(worksheet, snapshot, edited, columns, next_row):
+    """
+    Speichert nur die Unterschiede zwischen snapshot und edited in einem batch_update:
+    geänderte Zellen, neue Zeilen (ab next_row) und geleerte Zeilen für gelöschte Einträge.
+    Wurden betroffene Zellen seit dem Laden geändert, wird SheetConflictError ausgelöst.
+    Gibt die Anzahl (geänderte Zellen, neue Zeilen, gelöschte Zeilen) zurück.
+    """
+    with span("sheets.diff"):
+        changed, appended, deleted = diff_company_data(snapshot, edited, columns)
+    append_rows = list(range(next_row, next_row + len(appended)))
+
+    with span("sheets.conflict_check"):
+        conflicts = _conflicts(worksheet, snapshot, columns, changed, deleted, append_rows)
+    if conflicts:
+        raise SheetConflictError(conflicts)
+
+    last_col = _column_letter(len(columns))
+    data = [{"range": rowcol_to_a1(r, c), "values": [[value]]} for (r, c), value in changed.items()]
+    if appended:
+        data.append({"range": f"A{next_row}:{last_col}{next_row + len(appended) - 1}", "values": appended})
+    for r in deleted:
+        data.append({"range": f"A{r}:{last_col}{r}", "values": [[""] * len(columns)]})
+    if data:
+        count("sheets_requests")
+        with span("sheets.batch_update", ranges=len(data)):
+            worksheet.batch_update(data)
+    return len(changed), len(appended), len(deleted)
+
+
+class CompanyDedupIndex:
+    """
+    Bereits eingetragene Unternehmen für die Dublettenprüfung beim Eintragen neuer Recherchen:
+    normalisierte Namen (ohne Rechtsform, Umlaute gefaltet), registrierbare Domains (aus Website bzw.
+    Nicht-Freemail-Adresse) und E-Mail-Adressen in Kleinschreibung, jeweils als Set.
+    Merkt sich außerdem die belegten Zeilen, damit neue Einträge nur in wirklich freie Zeilen gehen.
+    """
+
+    # Spalten A (Name), C (E-Mail) und N (Website)
+    NAME_COLUMN, EMAIL_COLUMN, WEBSITE_COLUMN = "A", "C", "N"
+
+    def __init__(self):
+        self.names = set()
+        self.domains = set()
+        self.emails = set()
+        self.used_rows = set()
+
+    @classmethod
+    def from_worksheet(cls, worksheet):
+        """Liest Name, E-Mail und Website aller Datenzeilen in einem Aufruf (batch_get)."""
+        ranges = [f"{col}{FIRST_DATA_ROW}:{col}" for col in (cls.NAME_COLUMN, cls.EMAIL_COLUMN, cls.WEBSITE_COLUMN)]
+        names, emails, websites = ([cell[0] if cell else "" for cell in values] for values in worksheet.batch_get(ranges))
+        index = cls()
+        for offset in range(max(len(names), len(emails), len(websites))):
+            name = names[offset] if offset < len(names) else ""
+            email = emails[offset] if offset < len(emails) else ""
+            website = websites[offset] if offset < len(websites) else ""
+            if str(name).strip() or str(email).strip() or str(website).strip():
+                index.add(name, email, website, row=FIRST_DATA_ROW + offset)
+        return index
+
+    @staticmethod
+    def _keys(name, email, website):
+        return (
+            normalize_company_name(name),
+            str(email or "").strip().lower(),
+            company_domain(website, email)
+        )
+
+    def find(self, name, email="", website=""):
+        """Grund, warum das Unternehmen schon erfasst ist ('Name', 'E-Mail', 'Domain'), sonst None."""
+        name_key, email_key, domain_key = self._keys(name, email, website)
+        if name_key and name_key in self.names:
+            return "Name"
+        if email_key and email_key in self.emails:
+            return "E-Mail"
+        if domain_key and domain_key in self.domains:
+            return "Domain"
+        return None
+
+    def add(self, name, email="", website="", row=None):
+        name_key, email_key, domain_key = self._keys(name, email, website)
+        if name_key:
+            self.names.add(name_key)
+        if email_key:
+            self.emails.add(email_key)
+        if domain_key:
+            self.domains.add(domain_key)
+        if row is not None:
+            self.used_rows.add(row)
+
+    def free_rows(self, count):
+        """Die ersten `count` freien Zeilen ab FIRST_DATA_ROW (Lücken zuerst, dann hinter der letzten Zeile)."""
+        rows = []
+        row = FIRST_DATA_ROW
+        while len(rows) < count:
+            if row not in self.used_rows:
+                rows.append(row)
+            row += 1
+        return rows
+
+
+def row_runs(rows):
+    """Zerlegt aufsteigende Zeilennummern in zusammenhängende Blöcke [(erste, letzte), ...]."""
+    runs = []
+    for row in rows:
+        if runs and row == runs[-1][1] + 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    return [tuple(run) for run in runs]
+
+
+# Rückschreiben nach dem Versand (Spaltenbuchstaben, per Einstellung änderbar, siehe settings.get_secret):
+# Zähler G und erste Status-Checkbox H wie in COUNTER_COLUMNS/FLAG_COLUMNS, die E-Mail-Spalte C sichert ab,
+# dass die Zeile noch zum Empfänger gehört. Das Versanddatum wird nur mit SEND_STATUS_DATE_COLUMN geschrieben.
+SEND_STATUS_DEFAULT_COLUMNS = {
+    "email": CompanyDedupIndex.EMAIL_COLUMN,
+    "counter": _column_letter(COUNTER_COLUMNS[0] + 1),
+    "flag": _column_letter(FLAG_COLUMNS[0] + 1),
+    "date": "",
+}
+
+
+class SendStatusColumnsMissing(Exception):
+    """Eine Spalte für das Rückschreiben des Versandstatus hat keine Überschrift; es wurde nichts geschrieben."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        super().__init__("Spalten für den Versandstatus fehlen im Sheet (keine Überschrift in Zeile "
+                         f"{HEADER_ROW}): " + ", ".join(columns))
+
+
+def send_status_columns():
+    """
+    Spalten für write_send_status als {Rolle: Buchstabe}: SEND_STATUS_EMAIL_COLUMN, SEND_STATUS_COUNTER_COLUMN,
+    SEND_STATUS_FLAG_COLUMN und SEND_STATUS_DATE_COLUMN (leer = kein Datum), sonst SEND_STATUS_DEFAULT_COLUMNS.
+    """
+    columns = {}
+    for role, default in SEND_STATUS_DEFAULT_COLUMNS.items():
+        letter = str(get_secret(f"SEND_STATUS_{role.upper()}_COLUMN", default) or "").strip().upper()
+        if letter:
+            columns[role] = letter
+    return columns
+
+
+def write_send_status(worksheet, sent, date, columns=None):
+    """
+    Markiert erfolgreich angeschriebene Zeilen: Checkbox auf TRUE, Zähler + 1 und ggf. Datum (Text, z.B.
+    "2025-06-01"); Spalten siehe send_status_columns(). sent: {Zeile: E-Mail-Adresse}.
+    Kopfzeile und betroffene Zeilen werden in einem batch_get gelesen, alle Änderungen in einem
+    batch_update geschrieben (unabhängig von der Anzahl). Hat eine der Spalten keine Überschrift, wird
+    SendStatusColumnsMissing ausgelöst; Zeilen mit inzwischen anderer Adresse bleiben unverändert.
+    Gibt (aktualisierte Zeilen, übersprungene Zeilen) zurück.
+    """
+    rows = sorted(sent)
+    if not rows:
+        return [], []
+    letters = columns or send_status_columns()
+    positions = {role: a1_to_rowcol(f"{letter}1")[1] - 1 for role, letter in letters.items()}
+    runs = row_runs(rows)
+    ranges = [f"{HEADER_ROW}:{HEADER_ROW}"] + [f"{first}:{last}" for first, last in runs]
+    count("sheets_requests")
+    with span("sheets.read_send_status", rows=len(rows)):
+        values = worksheet.batch_get(ranges)
+    header = values[0][0] if values[0] else []
+    missing = [letters[role] for role, pos in positions.items() if pos >= len(header) or not str(header[pos]).strip()]
+    if missing:
+        raise SendStatusColumnsMissing(missing)
+
+    def cell(cells, role):
+        pos = positions[role]
+        return cells[pos] if pos < len(cells) else ""
+
+    current = {}
+    for (first, last), block in zip(runs, values[1:]):
+        for offset, row in enumerate(range(first, last + 1)):
+            current[row] = block[offset] if offset < len(block) else []
+
+    updated, skipped = [], []
+    data = []
+    for row in rows:
+        cells = current[row]
+        if str(cell(cells, "email")).strip().lower() != str(sent[row]).strip().lower():
+            skipped.append(row)
+            continue
+        number = cell_key(cell(cells, "counter"))
+        contacts = int(float(number)) + 1 if re.fullmatch(r"-?\d+(\.\d+)?", number) else 1
+        data += [
+            {"range": f"{letters['counter']}{row}", "values": [[contacts]]},
+            {"range": f"{letters['flag']}{row}", "values": [["TRUE"]]},
+        ]
+        if "date" in letters:
+            data.append({"range": f"{letters['date']}{row}", "values": [[date]]})
+        updated.append(row)
+    if data:
+        count("sheets_requests")
+        with span("sheets.batch_update", ranges=len(data)):
+            worksheet.batch_update(data)
+    return updated, skipped
@@ -0,0 +1,149 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from normalize import fold
+
+# Anzahl zuletzt verwendeter Filterkombinationen, deren Zeilenmaske gemerkt wird
+MAX_CACHED_MASKS = 32
+# Bis zu so vielen verschiedenen Werten wird pro Wert eine Bitmaske vorberechnet
+MAX_BITMAP_VALUES = 256
+NGRAM = 3
+
+
+def _ngrams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class TableFilter:
+    """
+    Suchindex für einen geladenen Tabellenstand (einmal pro Revision aufbauen, dann wiederverwenden).
+    Textspalten werden in Kleinschreibung und ohne Umlaute/Akzente (normalize.fold) mit einem
+    Trigramm-Index versehen; Textfilter sind wörtliche Teilstring-Suchen (kein Regex), "müller" findet
+    also auch "Mueller GmbH" und umgekehrt. Für Auswahlspalten (Kategorie, Checkbox) gibt es Bitmasken
+    je Wert. mask() kombiniert die Indizes zu einer Zeilenmaske und merkt sich die letzten Kombinationen.
+    Thread-sicher, da eine Instanz von allen Sessions geteilt wird.
+    """
+
+    def __init__(self, frame, text_columns=(), max_cached=MAX_CACHED_MASKS):
+        self.frame = frame
+        self.max_cached = max_cached
+        self._folded = {}
+        self._postings = {}
+        for col in text_columns:
+            if col in frame.columns:
+                self._index_text(col)
+        self._bitmaps = {}
+        for col in frame.columns:
+            dtype = frame[col].dtype
+            if isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(dtype):
+                self._bitmaps[col] = self._build_bitmaps(col)
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.frame)
+
+    def _index_text(self, col):
+        folded = [fold(v) if not pd.isna(v) else "" for v in self.frame[col].tolist()]
+        postings = {}
+        for row, text in enumerate(folded):
+            for gram in _ngrams(text):
+                postings.setdefault(gram, []).append(row)
+        self._folded[col] = folded
+        self._postings[col] = {gram: np.asarray(rows, dtype=np.int32) for gram, rows in postings.items()}
+
+    def _build_bitmaps(self, col):
+        """{Wert: bool-Array}; leere Zellen (NA) unter dem Schlüssel None. None bei zu vielen Werten."""
+        codes, uniques = pd.factorize(self.frame[col], use_na_sentinel=True)
+        if len(uniques) > MAX_BITMAP_VALUES:
+            return None
+        bitmaps = {value: codes == i for i, value in enumerate(uniques.tolist())}
+        bitmaps[None] = codes == -1
+        return bitmaps
+
+    def _text_mask(self, col, query):
+        query = fold(query).strip()
+        mask = np.zeros(len(self.frame), dtype=bool)
+        if col not in self._folded:
+            self._index_text(col)
+        folded = self._folded[col]
+        if len(query) < NGRAM:
+            candidates = range(len(folded))
+        else:
+            postings = self._postings[col]
+            lists = sorted((postings.get(gram) for gram in _ngrams(query)), key=lambda p: -1 if p is None else len(p))
+            if lists[0] is None:
+                return mask
+            candidates = lists[0]
+            for rows in lists[1:]:
+                candidates = np.intersect1d(candidates, rows, assume_unique=True)
+                if not len(candidates):
+                    return mask
+        for row in candidates:
+            if query in folded[row]:
+                mask[row] = True
+        return mask
+
+    def _value_mask(self, col, values):
+        if col not in self._bitmaps:
+            self._bitmaps[col] = self._build_bitmaps(col)
+        bitmaps = self._bitmaps[col]
+        if bitmaps is None:
+            series = self.frame[col]
+            mask = series.isin([v for v in values if v is not None]).to_numpy(dtype=bool, na_value=False)
+            if None in values:
+                mask |= series.isna().to_numpy()
+            return mask
+        mask = np.zeros(len(self.frame), dtype=bool)
+        for value in values:
+            bitmap = bitmaps.get(value)
+            if bitmap is not None:
+                mask |= bitmap
+        return mask
+
+    def _range_mask(self, col, low, high):
+        """low <= Wert <= high; leere Zellen fallen heraus. Grenzen dürfen None sein."""
+        series = self.frame[col]
+        mask = series.notna().to_numpy(copy=True)
+        if low is not None:
+            mask &= (series >= low).to_numpy(dtype=bool, na_value=False)
+        if high is not None:
+            mask &= (series <= high).to_numpy(dtype=bool, na_value=False)
+        return mask
+
+    def mask(self, text=None, values=None, ranges=None):
+        """
+        Zeilenmaske (numpy bool-Array in Reihenfolge von self.frame) für alle Bedingungen zusammen:
+        text {Spalte: Suchtext}, values {Spalte: erlaubte Werte, None = leer}, ranges {Spalte: (von, bis)}.
+        """
+        text = {col: q for col, q in (text or {}).items() if q and q.strip()}
+        values = {col: tuple(v) for col, v in (values or {}).items()}
+        ranges = {col: tuple(r) for col, r in (ranges or {}).items()}
+        key = (tuple(sorted(text.items())), tuple(sorted(values.items(), key=lambda kv: kv[0])),
+               tuple(sorted(ranges.items(), key=lambda kv: kv[0])))
+        with self._lock:
+            cached = self._masks.get(key)
+            if cached is not None:
+                self._masks.move_to_end(key)
+                return cached
+
+            mask = np.ones(len(self.frame), dtype=bool)
+            for col, query in text.items():
+                mask &= self._text_mask(col, query)
+            for col, allowed in values.items():
+                mask &= self._value_mask(col, allowed)
+            for col, (low, high) in ranges.items():
+                mask &= self._range_mask(col, low, high)
+
+            mask.flags.writeable = False
+            self._masks[key] = mask
+            while len(self._masks) > self.max_cached:
+                self._masks.popitem(last=False)
+            return mask
+
+    def filter(self, text=None, values=None, ranges=None):
+        """Gefilterte Zeilen von self.frame (neuer DataFrame, der Index bleibt die Sheet-Zeilennummer)."""
+        return self.frame[self.mask(text, values, ranges)]